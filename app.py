@@ -1,26 +1,192 @@
-from dash import Dash, html, Input, Output, callback, dcc, ctx
+from dash import Dash, html, Input, Output, State, callback, clientside_callback, ClientsideFunction, dcc, ctx, Patch, no_update
 import dash_cytoscape as cyto
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
+import itertools
+import os
+from collections import OrderedDict
+from threading import Lock
 
 from functions import *
-
-group_by = 'Teams'
-database = 'GEC2017'
-node_type = 'Behaviours'
-edge_type = 'Frequency'
-team = 'All'
-meeting = 'All'
-colour_type = 'Behaviours'
-colour_source = 'Source'
-normalise = True
-show_stats = False
-
-teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_stats, edge_stats, node_size_map = load_dataset(group_by, database, node_type, edge_type, team, meeting, colour_type, colour_source, normalise, show_stats)
-legend_nodes = get_legend_nodes(node_names, selector_node_classes, colour_type, behaviours)
+from session import SessionStore, SESSION_STORE_PATH, new_session_id
+from metrics import instrument, get_metrics
+
+# The static site (see export.py) has no server to answer callbacks: they run in the browser (assets/static_site.js)
+# on the bundles exported for every combination of options
+STATIC_SITE = os.environ.get('BITGRAPHS_STATIC_SITE') == '1'
+
+# Options a graph is loaded with. Each session keeps the view of the graph it shows in the session store, so that
+# callbacks do not depend on which worker process answers them
+default_view = {
+    'group_by': 'Teams',
+    'database': 'GEC2017',
+    'node_type': 'Behaviours',
+    'edge_type': 'Frequency',
+    'team': 'All',
+    'meeting': 'All',
+    'colour_type': 'Behaviours',
+    'colour_source': 'Source',
+    'normalise': True,
+    'show_stats': False,
+    'order': 1,
+    'compare': '',
+    'detail': 'All'
+}
+VIEW_OPTIONS = list(default_view.keys())
+# Number of loaded graphs kept by each worker process
+LOADED_VIEWS_MAX = 32
+# Number of graphs whose Cytoscape elements, stylesheet and legend are kept built by each worker process
+GRAPH_DISPLAYS_MAX = 8
+
+sessions = SessionStore(SESSION_STORE_PATH)
+loaded_views = OrderedDict()
+loaded_views_lock = Lock()
+# Graphs are numbered as they are loaded, so that what is built from a graph is never used for a graph loaded later
+graph_versions = itertools.count()
+graph_displays = OrderedDict()
+graph_displays_lock = Lock()
+
+def get_view_key(view):
+    return tuple(view[option] for option in VIEW_OPTIONS)
+
+def get_weight_step(view, min_weight, max_weight):
+    # Compare views have differences of frequencies or probabilities as weights, which can be small and negative
+    if view['compare'] != '' and max_weight > min_weight:
+        return (max_weight - min_weight) / 100
+    return 1
+
+def load_view(view):
+    # Load the graph of view and keep it in this worker. Returns a dictionary with the outputs of load_dataset, the
+    # edges sorted by weight, the edges of each node and the version of the dataset it was loaded from (source). Edges
+    # are kept as arrays (see graph.py) and written as Cytoscape elements when sent, see get_graph_edges. Stats are
+    # computed when hovered, see get_graph_stats
+    teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_size_map = load_dataset(
+        view['group_by'], view['database'], view['node_type'], view['edge_type'], view['team'], view['meeting'], view['colour_type'], view['colour_source'], view['normalise'], order=view['order'], compare=view['compare'], detail=view['detail'])
+    graph = {'teams': teams, 'meetings': meetings, 'edge_data': edge_data, 'nodes': nodes,
+             'edge_classes': get_edge_classes(edge_data, view['node_type'], view['colour_type'], view['colour_source']),
+             'selector_node_classes': selector_node_classes, 'selector_edge_classes': selector_edge_classes,
+             'min_weight': min_weight, 'max_weight': max_weight, 'weight_step': get_weight_step(view, min_weight, max_weight),
+             'weight_bins': weight_bins, 'node_names': node_names,
+             'behaviours': behaviours, 'colour_type': view['colour_type'], 'weight_index': get_weight_index(edge_data), 'adjacency_index': get_adjacency_index(edge_data),
+             'stats': {}, 'stats_counts': None}
+    graph['source'] = graph['checked_source'] = read_cube(view['database'])['source']
+    removed = []
+    with loaded_views_lock:
+        graph['version'] = next(graph_versions)
+        if get_view_key(view) in loaded_views:
+            removed.append(loaded_views[get_view_key(view)])
+        loaded_views[get_view_key(view)] = graph
+        loaded_views.move_to_end(get_view_key(view))
+        while len(loaded_views) > LOADED_VIEWS_MAX:
+            removed.append(loaded_views.popitem(last=False)[1])
+    for old_graph in removed:
+        invalidate_graph_display(old_graph)
+    return graph
+
+def get_graph(view):
+    # Graph of view, loading it again if this worker does not have it or meetings of the view were appended to the
+    # dataset since (see append.py). Edges come out in the same order, so edge indices stored in the session are the
+    # same in every worker
+    with loaded_views_lock:
+        graph = loaded_views.get(get_view_key(view))
+        if graph is not None:
+            loaded_views.move_to_end(get_view_key(view))
+    if graph is None:
+        return load_view(view)
+    source = read_cube(view['database'])['source']
+    if source != graph['checked_source']:
+        if is_view_affected(view, get_appends_since(read_cube(view['database']), graph['checked_source'])):
+            return load_view(view)
+        graph['checked_source'] = source
+    return graph
+
+def get_graph_edges(graph, indices=None):
+    # Cytoscape edges of graph at indices, all of them if None
+    if indices is None:
+        return get_graph_display(graph)['edges']
+    edges = get_graph_display(graph)['edges']
+    return [edges[i] for i in indices]
+
+def get_graph_display(graph):
+    # Cytoscape edges and elements, stylesheet, legend nodes and legend stylesheet of graph, built on first use and
+    # kept for the GRAPH_DISPLAYS_MAX graphs used last. Graphs are loaded per view, display options included, so the
+    # version of the graph is the key
+    with graph_displays_lock:
+        display = graph_displays.get(graph['version'])
+        if display is not None:
+            graph_displays.move_to_end(graph['version'])
+            return display
+    edges = get_edge_elements(graph['edge_data'], graph['edge_classes'])
+    display = {'edges': edges, 'elements': edges + graph['nodes'],
+               'stylesheet': graph['selector_node_classes'] + graph['selector_edge_classes'] + default_stylesheet,
+               'legend_nodes': get_legend_nodes(graph['node_names'], graph['selector_node_classes'], graph['colour_type'], graph['behaviours']),
+               'legend_stylesheet': graph['selector_node_classes'] + legend_stylesheet}
+    with graph_displays_lock:
+        graph_displays[graph['version']] = display
+        while len(graph_displays) > GRAPH_DISPLAYS_MAX:
+            graph_displays.popitem(last=False)
+    return display
+
+def invalidate_graph_display(graph):
+    # Drop what was built from graph, when it is loaded again or no longer kept
+    with graph_displays_lock:
+        graph_displays.pop(graph['version'], None)
+
+def get_graph_windows(graph, view):
+    # Cumulative transition counts of the selection of graph (see get_window_index), built on first use
+    if 'window_index' not in graph:
+        graph['window_index'] = get_window_index(view['group_by'], read_cube(view['database']), read_behaviour_stream(view['database']),
+                                                 graph['teams'], view['team'], view['meeting'])
+    return graph['window_index']
+
+def get_window_frames(graph, view, start, size, count):
+    # Cytoscape elements of count consecutive windows of size transitions from start, by start position
+    window_index = get_graph_windows(graph, view)
+    size, last, step = get_window_positions(window_index, size)
+    elements = {}
+    for position in range(start, min(start + count * step, last + 1), step):
+        window_data, indices = get_window_edge_data(graph['edge_data'], get_window_counts(window_index, position, size), view['edge_type'], view['normalise'])
+        elements[str(position)] = get_edge_elements(window_data, graph['edge_classes'][indices]) + graph['nodes']
+    return elements
+
+def get_graph_stats(graph, view, key):
+    # Stats text of the node (a name) or edge (a (source, target) pair) key of graph, '' if the view has none. Only
+    # behaviour graphs of single behaviours have stats, and only Frequency and Probability edges. Frequencies are
+    # counted the first time a stats text of the graph is asked for and texts are kept with the graph
+    if not view['show_stats'] or view['node_type'] != 'Behaviours' or view['order'] != 1:
+        return ''
+    if isinstance(key, tuple) and (view['compare'] != '' or view['edge_type'] not in ['Frequency', 'Probability']):
+        return ''
+    text = graph['stats'].get(key)
+    if text is None:
+        if graph['stats_counts'] is None:
+            graph['stats_counts'] = get_stats_counts(view['group_by'], view['database'], view['team'], view['meeting'], view['compare'])
+        if isinstance(key, tuple):
+            text = get_edge_stats(graph['stats_counts'], key[0], key[1])
+        else:
+            text = get_node_stats(graph['stats_counts'], key)
+        graph['stats'][key] = text
+    return text
+
+def get_session_state(session_id):
+    # State of a session: the view of its graph, the version of the graph shown in the browser and the indices of
+    # the edges shown (None for all)
+    state = sessions.get(session_id)
+    if state is None:
+        state = {'view': dict(default_view), 'source': default_graph['source'], 'visible_edges': None}
+    # Views stored before an option existed get its default
+    state['view'] = {**default_view, **state['view']}
+    return state
+
+default_graph = load_view(default_view)
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])
 
+@app.server.route('/metrics')
+def serve_metrics():
+    # Span totals (see metrics.py) and dataset cache hits, misses and evictions of this worker process
+    return {**get_metrics(), 'dataset_cache': dataset_cache.get_info()}
+
 default_stylesheet = [
     # Group selectors for nodes
     {
@@ -68,11 +234,12 @@ layout_dropdown = html.Div([
     html.P("Layout:"),
     dcc.Dropdown(
         id='dropdown-update-layout',
-        value='grid',
+        value='preset',
         clearable=False,
+        # preset places nodes where the server put them (see layout.py), the others are laid out by the browser
         options=[
             {'label': name.capitalize(), 'value': name}
-            for name in ['grid', 'random', 'circle', 'cose', 'concentric']
+            for name in ['preset', 'grid', 'random', 'circle', 'cose', 'concentric']
         ],
         style={'width': '150px'},
         className='dash-bootstrap'
@@ -87,7 +254,7 @@ group_dropdown = html.Div([
         clearable=False,
         options=[
             {'label': name, 'value': name}
-            for name in ['Teams', 'teammark', 'airtime_evenness', 'psy_safe', 'expgroup']
+            for name in GROUP_BY_OPTIONS
         ],
         style={'width': '150px'},
         className='dash-bootstrap'
@@ -102,7 +269,7 @@ database_dropdown = html.Div([
         clearable=False,
         options=[
         {'label': name, 'value': name}
-        for name in ['GEC2017', 'GEC2018', 'EYH2017', 'EYH2018', 'IDP2019', 'IDP2020']
+        for name in DATASETS
         ],
         className='dash-bootstrap',
         style={'width': '200px'},
@@ -118,7 +285,7 @@ team_dropdown = html.Div([
         clearable=False,
         options=[
             {'label': name, 'value': name}
-            for name in teams
+            for name in default_graph['teams']
         ],
         style={'width': '200px'},
         className='dash-bootstrap'
@@ -134,7 +301,7 @@ meeting_dropdown = html.Div([
         clearable=False,
         options=[
             {'label': name, 'value': name}
-            for name in meetings
+            for name in default_graph['meetings']
         ],
         style={'width': '200px'},
         className='dash-bootstrap'
@@ -146,8 +313,11 @@ node_type_radio = html.Div([html.P("Node type:", style = {'display': 'inline-blo
     html.Div(dcc.RadioItems(['Behaviours', 'Participants'], id='radio-update-nodes', value='Behaviours', inline=True, inputStyle={'margin-right': '10px', 'margin-left': '10px'}), style={'display': 'inline-block'})
 ], style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block'})
 
+# The static site has no significance graphs
+EDGE_TYPES = ['Frequency', 'Probability'] if STATIC_SITE else ['Frequency', 'Probability', 'Significance']
+
 edge_type_radio = html.Div([html.P("Edge weight:", style = {'display': 'inline-block'}),
-    html.Div(dcc.RadioItems(['Frequency', 'Probability'], id='radio-update-edges', value='Frequency', inline=True, inputStyle={'margin-right': '10px', 'margin-left': '10px'}), style={'display': 'inline-block'})
+    html.Div(dcc.RadioItems(EDGE_TYPES, id='radio-update-edges', value='Frequency', inline=True, inputStyle={'margin-right': '10px', 'margin-left': '10px'}), style={'display': 'inline-block'})
 ], style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block'})
 
 colour_type_radio = html.Div([html.P("Colour by:", style = {'display': 'inline-block'}),
@@ -164,23 +334,83 @@ normalise_checkbox = html.Div([dcc.Checklist(['Normalise'], id='checkbox-update-
 show_stats_checkbox = html.Div([dcc.Checklist(['Show stats'], id='checkbox-update-stats', value=[''], inline=True, inputStyle={'margin-right': '10px', 'margin-left': '10px'})],
                                 style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block'})
 
+hops_dropdown = html.Div([html.P("Selection hops:", style = {'display': 'inline-block'}),
+    html.Div(dcc.Dropdown(
+        id='dropdown-update-hops',
+        value=1,
+        clearable=False,
+        options=[
+            {'label': str(hops), 'value': hops}
+            for hops in [1, 2, 3, 4, 5]
+        ],
+        style={'width': '80px'},
+        className='dash-bootstrap'
+    ), style={'display': 'inline-block', 'margin-left': '10px', 'vertical-align': 'middle'})
+], style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block'})
+
+# Behaviour graphs of (Markov) order k have runs of k behaviours as nodes. The static site only has order 1
+order_dropdown = html.Div([html.P("Behaviour order:", style = {'display': 'inline-block'}),
+    html.Div(dcc.Dropdown(
+        id='dropdown-update-order',
+        value=1,
+        clearable=False,
+        options=[
+            {'label': str(order), 'value': order}
+            for order in BEHAVIOUR_ORDERS
+        ],
+        style={'width': '80px'},
+        className='dash-bootstrap'
+    ), style={'display': 'inline-block', 'margin-left': '10px', 'vertical-align': 'middle'})
+], style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block' if not STATIC_SITE else 'none'})
+
+# Behaviour graphs of a group can show the difference with another group of the same variable. The static site has
+# no difference graphs
+compare_dropdown = html.Div([html.P("Compare with:", style = {'display': 'inline-block'}),
+    html.Div(dcc.Dropdown(
+        id='dropdown-update-compare',
+        value=None,
+        clearable=True,
+        options=[],
+        style={'width': '200px'},
+        className='dash-bootstrap'
+    ), style={'display': 'inline-block', 'margin-left': '10px', 'vertical-align': 'middle'})
+], style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block' if not STATIC_SITE else 'none'})
+
+# Graphs with many edges can be pruned to fewer of them (see get_detail_edges). The static site has all the edges
+detail_labels = {'All': 'All edges', 'Top': 'Top ' + str(DETAIL_TOP_EDGES) + ' per node', 'Backbone': 'Backbone (p < ' + str(DETAIL_BACKBONE_ALPHA) + ')',
+                 'Budget': 'Up to ' + str(DETAIL_MAX_ELEMENTS) + ' elements'}
+detail_dropdown = html.Div([html.P("Detail:", style = {'display': 'inline-block'}),
+    html.Div(dcc.Dropdown(
+        id='dropdown-update-detail',
+        value='All',
+        clearable=False,
+        options=[
+            {'label': detail_labels[detail], 'value': detail}
+            for detail in DETAIL_LEVELS
+        ],
+        style={'width': '200px'},
+        className='dash-bootstrap'
+    ), style={'display': 'inline-block', 'margin-left': '10px', 'vertical-align': 'middle'})
+], style={'margin-left': '20px', 'margin-top': '20px', 'display': 'inline-block' if not STATIC_SITE else 'none'})
+
 update_button = html.Div([
     dbc.Button("Update", id='update-button', color="primary", className="mr-1", style = {'margin-left': '20px'})
 ], style = {'display': 'inline-block'})
 
-options_div = html.Div([node_type_radio, edge_type_radio, colour_type_radio, colour_source_radio, normalise_checkbox, show_stats_checkbox, update_button])
+options_div = html.Div([node_type_radio, edge_type_radio, colour_type_radio, colour_source_radio, normalise_checkbox, show_stats_checkbox, order_dropdown, compare_dropdown, detail_dropdown, hops_dropdown, update_button])
+
+default_display = get_graph_display(default_graph)
 
 graph = html.Div([cyto.Cytoscape(
         id='BiT',
-        layout={'name': 'circle',
-                'radius': 200},
-        elements = edges+nodes,
-        stylesheet = selector_node_classes + selector_edge_classes + default_stylesheet,
+        layout={'name': 'preset'},
+        elements = default_display['elements'],
+        stylesheet = default_display['stylesheet'],
         style={'width': '80%', 'height': '780px', 'display': 'inline-block'},
     ),cyto.Cytoscape(id='BiT2',
         layout={'name': 'grid', 'columns': 1},
-        elements = legend_nodes,
-        stylesheet = selector_node_classes + legend_stylesheet,
+        elements = default_display['legend_nodes'],
+        stylesheet = default_display['legend_stylesheet'],
         style={'width': '20%', 'height': '780px', 'display': 'inline-block'},
                      userPanningEnabled=False,
                      userZoomingEnabled=False,)
@@ -189,34 +419,74 @@ graph = html.Div([cyto.Cytoscape(
 weight_slider = html.Div([
     html.P("Weight threshold", id='weight-slider-output', style={'margin-left': '20px'}),
     dcc.RangeSlider(
-        min = min_weight,
-        max = max_weight,
-        step = 1,
-        value = [min_weight, max_weight],
-        marks = weight_bins,
+        min = default_graph['min_weight'],
+        max = default_graph['max_weight'],
+        step = default_graph['weight_step'],
+        value = [default_graph['min_weight'], default_graph['max_weight']],
+        marks = default_graph['weight_bins'],
         allowCross = False,
         id = 'weight-slider'
     )
 ])
 
+# Temporal windows: the graph of WINDOW_SIZES consecutive transitions of the selection, moved with the window slider
+# or played. The static site has no windows
+window_controls = html.Div([
+    html.Div([html.P("Window:", style = {'display': 'inline-block'}),
+        html.Div(dcc.Dropdown(
+            id='dropdown-update-window',
+            value=None,
+            clearable=True,
+            options=[
+                {'label': str(size) + ' transitions', 'value': size}
+                for size in WINDOW_SIZES
+            ],
+            style={'width': '200px'},
+            className='dash-bootstrap'
+        ), style={'display': 'inline-block', 'margin-left': '10px', 'vertical-align': 'middle'}),
+        dbc.Button("Play", id='window-play', color="primary", className="mr-1", style = {'margin-left': '20px'}, disabled=True)
+    ], style={'margin-left': '20px', 'margin-top': '20px'}),
+    html.P("Window: off", id='window-slider-output', style={'margin-left': '20px'}),
+    dcc.Slider(min=0, max=0, step=1, value=0, marks=None, disabled=True, id='window-slider'),
+    dcc.Interval(id='window-interval', interval=500, disabled=True),
+    dcc.Store(id='window-frames')
+], style={'display': 'block' if not STATIC_SITE else 'none'})
+
 tooltip = html.Div([
     html.P(id='tooltip')
 ], style={'margin-left': '10px'})
 
-graph_tab = html.Div([layout_dropdown, group_dropdown, database_dropdown, team_dropdown, meeting_dropdown, options_div, graph, weight_slider, tooltip])
+graph_tab = html.Div([layout_dropdown, group_dropdown, database_dropdown, team_dropdown, meeting_dropdown, options_div, graph, weight_slider, window_controls, tooltip])
+
+def serve_layout():
+    # A new session for every page load
+    if STATIC_SITE:
+        return html.Div([dcc.Store(id='static-bundle'), graph_tab])
+    return html.Div([dcc.Store(id='session-id', data=new_session_id()), graph_tab])
+
+def server_callback(*args, **kwargs):
+    # Register a callback answered by the server. The static site has none
+    if STATIC_SITE:
+        return lambda function: function
+    return callback(*args, **kwargs)
 
-app.layout = graph_tab
+app.layout = serve_layout
 
 # Hover callbacks
 
 # Nodes
 
-@callback(
+@server_callback(
         Output('tooltip', 'children'),
         [Input('BiT', 'mouseoverNodeData'),
-        Input('BiT', 'mouseoverEdgeData')])
-def mouseover_node_data(hover_node_data, hover_edge_data):
+        Input('BiT', 'mouseoverEdgeData')],
+        State('session-id', 'data'))
+@instrument('callback.mouseover_node_data')
+def mouseover_node_data(hover_node_data, hover_edge_data, session_id):
     if hover_node_data or hover_edge_data:
+        view = get_session_state(session_id)['view']
+        node_type, edge_type, normalise = view['node_type'], view['edge_type'], view['normalise']
+        graph = get_graph(view)
         component = list(ctx.triggered_prop_ids.keys())[0]
         text_input = ""
         if 'Node' in component:
@@ -224,179 +494,304 @@ def mouseover_node_data(hover_node_data, hover_edge_data):
         if 'Edge' in component:
             text_input = 'Edge'
         if text_input == 'Node':
-            return hover_node_data['id'] + ", with frequency: " + str(hover_node_data['freq']) + " " + hover_node_data['stats']
+            return hover_node_data['id'] + ", with frequency: " + str(hover_node_data['freq']) + " " + get_graph_stats(graph, view, hover_node_data['id'])
         elif text_input == 'Edge':
-            if node_type == 'Behaviours':
+            stats = get_graph_stats(graph, view, (hover_edge_data['source'], hover_edge_data['target']))
+            if view['compare'] != '':
+                return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + view['team'] + " - " + view['compare'] + " = " + str(round(hover_edge_data['weight'], 2)) + " (CI " + str(round(hover_edge_data['lower'], 2)) + " to " + str(round(hover_edge_data['upper'], 2)) + ")"
+            elif edge_type == 'Significance':
+                return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['original_weight']) + " (z = " + str(round(hover_edge_data['weight'], 2)) + ", p = " + str(round(hover_edge_data['p_value'], 4)) + ")"
+            elif node_type == 'Behaviours':
                 if edge_type == 'Frequency':
                     if not normalise:
-                        return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['original_weight']) + " " + hover_edge_data['stats']
+                        return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['original_weight']) + " " + stats
                     else:
-                        return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['weight']) + " " + hover_edge_data['stats']
+                        return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['weight']) + " " + stats
                 else:
-                    return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['original_weight']) + " (" + str(round(hover_edge_data['weight'], 2)) + "%)" + " " + hover_edge_data['stats']
+                    return hover_edge_data['source'].upper() + " -> " + hover_edge_data['target'].upper() + ": " + str(hover_edge_data['original_weight']) + " (" + str(round(hover_edge_data['weight'], 2)) + "%)" + " " + stats
             else:
                 if edge_type == 'Frequency':
                     if not normalise:
-                        return hover_edge_data['source'] + " -> " + hover_edge_data['target'] + ", " + hover_edge_data['behaviour'] + ": " + str(hover_edge_data['original_weight']) + " " + hover_edge_data['stats']
+                        return hover_edge_data['source'] + " -> " + hover_edge_data['target'] + ", " + hover_edge_data['behaviour'] + ": " + str(hover_edge_data['original_weight']) + " " + stats
                     else:
-                        return hover_edge_data['source'] + " -> " + hover_edge_data['target'] + ", " + hover_edge_data['behaviour'] + ": " + str(hover_edge_data['weight']) + " " + hover_edge_data['stats']
+                        return hover_edge_data['source'] + " -> " + hover_edge_data['target'] + ", " + hover_edge_data['behaviour'] + ": " + str(hover_edge_data['weight']) + " " + stats
                 else:
-                    return hover_edge_data['source'] + " -> " + hover_edge_data['target'] + ", " + hover_edge_data['behaviour'] + ": " + str(hover_edge_data['original_weight']) + " (" + str(hover_edge_data['weight']) + "%)" + " " + hover_edge_data['stats']
-
+                    return hover_edge_data['source'] + " -> " + hover_edge_data['target'] + ", " + hover_edge_data['behaviour'] + ": " + str(hover_edge_data['original_weight']) + " (" + str(hover_edge_data['weight']) + "%)" + " " + stats
+
+
+def get_elements_patch(graph, state, visible):
+    # Update the elements in the browser so that only the edges of graph in visible (a set of edge indices) are shown,
+    # sending only the edges that are removed or added. The edges shown are stored in state. If the browser shows an
+    # older version of the graph, all its elements are sent
+    if state.get('source') != graph['source']:
+        state['source'] = graph['source']
+        state['visible_edges'] = sorted(visible)
+        return get_graph_edges(graph, state['visible_edges']) + graph['nodes']
+    current = set(range(len(graph['edge_data']))) if state['visible_edges'] is None else set(state['visible_edges'])
+    removed, added = get_visible_changes(current, visible)
+    patch = Patch()
+    for edge in get_graph_edges(graph, removed):
+        patch.remove(edge)
+    if len(added) > 0:
+        patch.extend(get_graph_edges(graph, added))
+    state['visible_edges'] = sorted(visible)
+    return patch
+
+def show_edges(session_id, graph, state, visible):
+    # Elements to send so that only the edges of graph in visible are shown (see get_elements_patch), saving the state
+    # of the session. If another callback saved the session since state was read, the browser may have applied its
+    # patch too, so all the elements are sent
+    elements = get_elements_patch(graph, state, visible)
+    if not sessions.update(session_id, state):
+        state['source'] = graph['source']
+        state['visible_edges'] = sorted(visible)
+        sessions.set(session_id, state)
+        elements = get_graph_edges(graph, state['visible_edges']) + graph['nodes']
+    return elements
 
 # Select node callbacks
-@callback(Output('BiT', 'elements', allow_duplicate=True),
-            Input('BiT', 'selectedNodeData'), prevent_initial_call=True)
-def select_node(selected_nodes):
-    if len(selected_nodes) == 0:
-        return get_original_edges(edge_data, node_type, colour_type, colour_source, edge_stats) + get_original_nodes(node_data, node_type, leader, colour_type, node_stats)
-    else:
-        current_edges = []
-        for node in selected_nodes:
-            for edge in get_original_edges(edge_data, node_type, colour_type, colour_source, edge_stats):
-                if colour_source == 'Source':
-                    if edge['data']['source'] == node['id']:
-                        current_edges.append(edge)
-                else:
-                    if edge['data']['target'] == node['id']:
-                        current_edges.append(edge)
-        return current_edges + get_original_nodes(node_data, node_type, leader, colour_type, node_stats)
+@server_callback(Output('BiT', 'elements', allow_duplicate=True),
+            Input('BiT', 'selectedNodeData'),
+            Input('dropdown-update-hops', 'value'),
+            State('session-id', 'data'), prevent_initial_call=True)
+@instrument('callback.select_node')
+def select_node(selected_nodes, hops, session_id):
+    if not selected_nodes and ctx.triggered_id == 'dropdown-update-hops':
+        raise PreventUpdate
+    state = get_session_state(session_id)
+    graph = get_graph(state['view'])
+    if not selected_nodes:
+        return show_edges(session_id, graph, state, set(range(len(graph['edge_data']))))
+    # Edges within hops steps of the selected nodes
+    node_ids = [node['id'] for node in selected_nodes]
+    return show_edges(session_id, graph, state, get_neighbourhood_edges(graph['adjacency_index'], graph['edge_data'], node_ids, hops, state['view']['colour_source']))
 
 # Dropdown callbacks
 
 # Group
-@callback(Output('dropdown-update-team', 'options', allow_duplicate=True),
+@server_callback([Output('dropdown-update-team', 'options', allow_duplicate=True),
+    Output('dropdown-update-compare', 'options'),
+    Output('dropdown-update-compare', 'value')],
     Input('dropdown-update-group', 'value'),
+    State('dropdown-update-database', 'value'),
     prevent_initial_call=True)
-def update_group(value):
-    global group_by
-    group_by = value
-    return get_teams_for_group(database, value)
+@instrument('callback.update_group')
+def update_group(value, database):
+    options = get_teams_for_group(database, value)
+    # Teams are not compared, only groups
+    return options, options if value != 'Teams' else [], None
 
 # Layout
-@callback(Output('BiT', 'layout'),
+@server_callback(Output('BiT', 'layout'),
               Input('dropdown-update-layout', 'value'))
+@instrument('callback.update_layout')
 def update_layout(layout):
     return {
         'name': layout,
         #'animate': True
     }
 
-# Database
-@callback(Input('dropdown-update-database', 'value'),prevent_initial_call=True)
-def update_database(value):
-    global database
-    database = value
-
 # Team
-@callback(
+@server_callback(
     [Output('dropdown-update-meeting', 'options')],
-    Input('dropdown-update-team', 'value'), prevent_initial_call=True)
-def update_meeting_display(value):
+    Input('dropdown-update-team', 'value'),
+    State('dropdown-update-database', 'value'),
+    State('dropdown-update-group', 'value'), prevent_initial_call=True)
+@instrument('callback.update_meeting_display')
+def update_meeting_display(value, database, group_by):
     if value != '':
-        global team
-        team = value
         return [get_meetings_for_team(database, group_by, value)]
     else:
         return [[]]
 
-# Meeting
-@callback(Input('dropdown-update-meeting', 'value'), prevent_initial_call=True)
-def update_graph_with_meeting(value):
-    global meeting
-    if value is not None:
-        meeting = value
-
-# Radio button callbacks
-
-# Node type
-@callback(Input('radio-update-nodes', 'value'),
-    prevent_initial_call=True)
-def update_team(value):
-    global node_type
-    node_type = value
-
-# Edge type
-@callback(Input('radio-update-edges', 'value'),
-    prevent_initial_call=True)
-def update_edge_weight(value):
-    global edge_type
-    edge_type = value
-
-# Colour type
-@callback(Input('radio-update-colour_type', 'value'),
-    prevent_initial_call=True)
-def update_colour_type(value):
-    global colour_type
-    colour_type = value
-
-# Colour source
-@callback(Input('radio-update-colour-source', 'value'),
-    prevent_initial_call=True)
-def update_colour_source(value):
-    global colour_source
-    colour_source = value
-
-# Normalise checkbox
-@callback(Input('checkbox-update-normalise', 'value'),
-    prevent_initial_call=True)
-def update_normalise(value):
-    global normalise
-    normalise = 'Normalise' in value
-
-# Show stats checkbox
-@callback(Input('checkbox-update-stats', 'value'),
-    prevent_initial_call=True)
-def update_show_stats(value):
-    global show_stats
-    show_stats = 'Show stats' in value
-
 # Weight slider
-@callback(
+@server_callback(
     [Output('BiT', 'elements'),
     Output('weight-slider-output', 'children')],
-    Input('weight-slider', 'value'))
-def update_graph(selected_weight):
-    global nodes, edges
-    if selected_weight == min_weight:
-        nodes = get_original_nodes(node_data, node_type, leader, colour_type, node_stats)
-        edges = get_original_edges(edge_data, node_type, colour_type, colour_source, edge_stats)
-        return edges + nodes, "Weight threshold: " + str(selected_weight)
-    else:
-        # Remove edges with weight less than selected_weight
-        current_edges = []
-        for edge in get_original_edges(edge_data, node_type, colour_type, colour_source, edge_stats):
-            if edge_type == 'Probability':
-                if selected_weight[0] <= edge['data']['weight'] <= selected_weight[1]:
-                    current_edges.append(edge)
-            else:
-                if selected_weight[0] <= edge['data']['weight'] <= selected_weight[1]:
-                    current_edges.append(edge)
-        nodes = get_original_nodes(node_data, node_type, leader, colour_type, node_stats)
-        edges = current_edges
-        # Format selected_weight to display only 2 decimal places
-        return edges + nodes, "Weight threshold: " + str(round(selected_weight[0], 2)) + " - " + str(round(selected_weight[1], 2))
+    Input('weight-slider', 'value'),
+    State('session-id', 'data'))
+@instrument('callback.update_graph')
+def update_graph(selected_weight, session_id):
+    state = get_session_state(session_id)
+    graph = get_graph(state['view'])
+    # Keep only edges with weight in the selected range
+    current_edges = get_edges_in_range(graph['weight_index'], selected_weight[0], selected_weight[1])
+    elements = show_edges(session_id, graph, state, set(current_edges))
+    # Format selected_weight to display only 2 decimal places
+    return elements, "Weight threshold: " + str(round(selected_weight[0], 2)) + " - " + str(round(selected_weight[1], 2))
 
 # Update button callback
-@callback([Output('BiT', 'elements', allow_duplicate=True),
+@server_callback([Output('BiT', 'elements', allow_duplicate=True),
              Output('BiT', 'stylesheet'),
              Output('weight-slider', 'min'),
              Output('weight-slider', 'max'),
+             Output('weight-slider', 'step'),
              Output('weight-slider', 'marks'),
              Output('weight-slider', 'value'),
            Output('BiT2', 'elements', allow_duplicate=True),
            Output('BiT2', 'stylesheet'),],
             Input('update-button', 'n_clicks'),
+            State('session-id', 'data'),
+            State('dropdown-update-group', 'value'),
+            State('dropdown-update-database', 'value'),
+            State('radio-update-nodes', 'value'),
+            State('radio-update-edges', 'value'),
+            State('dropdown-update-team', 'value'),
+            State('dropdown-update-meeting', 'value'),
+            State('radio-update-colour_type', 'value'),
+            State('radio-update-colour-source', 'value'),
+            State('checkbox-update-normalise', 'value'),
+            State('checkbox-update-stats', 'value'),
+            State('dropdown-update-order', 'value'),
+            State('dropdown-update-compare', 'value'),
+            State('dropdown-update-detail', 'value'),
             prevent_initial_call=True)
-def update_graph_with_button(n_clicks):
-    global teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_stats, edge_stats
-    valid = check_valid_options(node_type, colour_type, team)
+@instrument('callback.update_graph_with_button')
+def update_graph_with_button(n_clicks, session_id, group_by, database, node_type, edge_type, team, meeting, colour_type, colour_source, normalise, show_stats, order, compare, detail):
+    state = get_session_state(session_id)
+    view = {'group_by': group_by, 'database': database, 'node_type': node_type, 'edge_type': edge_type,
+            # A cleared team or meeting keeps the one of the current graph
+            'team': team if team not in [None, ''] else state['view']['team'],
+            'meeting': meeting if meeting is not None else state['view']['meeting'],
+            'colour_type': colour_type, 'colour_source': colour_source,
+            'normalise': 'Normalise' in normalise, 'show_stats': 'Show stats' in show_stats,
+            # Participant and significance graphs are only of order 1
+            'order': order if node_type == 'Behaviours' and edge_type != 'Significance' else 1,
+            # Only behaviour graphs of order 1 of a group are compared, by Frequency or Probability
+            'compare': compare if compare not in [None, ''] and group_by != 'Teams' and node_type == 'Behaviours' and edge_type != 'Significance' else '',
+            'detail': detail}
+    if view['compare'] != '':
+        view['order'] = 1
+    valid = check_valid_options(view['node_type'], view['colour_type'], view['team'], view['edge_type'])
     if valid:
-        teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_stats, edge_stats, node_size_map = load_dataset(
-        group_by, database, node_type, edge_type, team, meeting, colour_type, colour_source, normalise, show_stats)
-        return edges + nodes, selector_node_classes + selector_edge_classes + default_stylesheet, min_weight, max_weight, weight_bins, [min_weight, max_weight], get_legend_nodes(node_names, selector_node_classes, colour_type, behaviours), selector_node_classes + legend_stylesheet
+        graph = get_graph(view)
+        sessions.set(session_id, {'view': view, 'source': graph['source'], 'visible_edges': None})
+        display = get_graph_display(graph)
+        return display['elements'], display['stylesheet'], graph['min_weight'], graph['max_weight'], graph['weight_step'], graph['weight_bins'], [graph['min_weight'], graph['max_weight']], display['legend_nodes'], display['legend_stylesheet']
     else:
         raise PreventUpdate
 
+# Window callbacks
+@server_callback([Output('window-slider', 'max'),
+             Output('window-slider', 'step'),
+             Output('window-slider', 'value'),
+             Output('window-slider', 'disabled'),
+             Output('window-play', 'disabled'),
+             Output('window-frames', 'data'),
+             Output('window-interval', 'disabled', allow_duplicate=True),
+             Output('window-slider-output', 'children', allow_duplicate=True),
+             Output('BiT', 'elements', allow_duplicate=True)],
+            Input('dropdown-update-window', 'value'),
+            Input('BiT', 'stylesheet'),
+            State('session-id', 'data'),
+            prevent_initial_call=True)
+@instrument('callback.update_window')
+def update_window(size, stylesheet, session_id):
+    # Start the windows of the graph of the session at the first one, or show the whole graph when windows are off
+    state = get_session_state(session_id)
+    view = state['view']
+    if size is None or not check_window_options(view['node_type'], view['edge_type'], view['order'], view['compare']):
+        elements = no_update
+        if ctx.triggered_id == 'dropdown-update-window':
+            graph = get_graph(view)
+            elements = show_edges(session_id, graph, state, set(range(len(graph['edge_data']))))
+        return 0, 1, 0, True, True, None, True, "Window: off", elements
+    graph = get_graph(view)
+    size, last, step = get_window_positions(get_graph_windows(graph, view), size)
+    return last, step, 0, False, False, None, True, "Window: loading", no_update
+
+@server_callback(Output('window-frames', 'data', allow_duplicate=True),
+            Input('window-slider', 'value'),
+            State('dropdown-update-window', 'value'),
+            State('window-frames', 'data'),
+            State('session-id', 'data'),
+            prevent_initial_call=True)
+@instrument('callback.prefetch_windows')
+def prefetch_windows(start, size, frames, session_id):
+    # Elements of the WINDOW_PREFETCH windows from start, unless those of the next half of them were already sent
+    state = get_session_state(session_id)
+    view = state['view']
+    if size is None or not check_window_options(view['node_type'], view['edge_type'], view['order'], view['compare']):
+        raise PreventUpdate
+    graph = get_graph(view)
+    window_index = get_graph_windows(graph, view)
+    window_size, last, step = get_window_positions(window_index, size)
+    ahead = [str(position) for position in range(start, min(start + WINDOW_PREFETCH // 2 * step, last) + 1, step)]
+    if frames is not None and frames['size'] == window_size and frames['source'] == graph['source'] and all(position in frames['elements'] for position in ahead):
+        raise PreventUpdate
+    # The browser no longer shows the edges of the session, the next patch sends all the elements
+    state['source'] = None
+    sessions.set(session_id, state)
+    return {'size': window_size, 'transitions': window_index['transitions'], 'source': graph['source'],
+            'elements': get_window_frames(graph, view, start, window_size, WINDOW_PREFETCH)}
+
+# Static site callbacks, see assets/static_site.js
+if not STATIC_SITE:
+    clientside_callback(ClientsideFunction('windows', 'show_window'),
+                        [Output('BiT', 'elements', allow_duplicate=True),
+                         Output('window-slider-output', 'children')],
+                        Input('window-slider', 'value'),
+                        Input('window-frames', 'data'), prevent_initial_call=True)
+    clientside_callback(ClientsideFunction('windows', 'play_window'),
+                        [Output('window-interval', 'disabled'),
+                         Output('window-play', 'children')],
+                        Input('window-play', 'n_clicks'),
+                        State('window-interval', 'disabled'), prevent_initial_call=True)
+    clientside_callback(ClientsideFunction('windows', 'advance_window'),
+                        [Output('window-slider', 'value', allow_duplicate=True),
+                         Output('window-interval', 'disabled', allow_duplicate=True),
+                         Output('window-play', 'children', allow_duplicate=True)],
+                        Input('window-interval', 'n_intervals'),
+                        State('window-slider', 'value'),
+                        State('window-slider', 'max'),
+                        State('window-slider', 'step'), prevent_initial_call=True)
+
+if STATIC_SITE:
+    clientside_callback(ClientsideFunction('bitgraphs', 'update_layout'),
+                        Output('BiT', 'layout'),
+                        Input('dropdown-update-layout', 'value'))
+    clientside_callback(ClientsideFunction('bitgraphs', 'update_teams'),
+                        Output('dropdown-update-team', 'options'),
+                        Input('dropdown-update-group', 'value'),
+                        State('dropdown-update-database', 'value'), prevent_initial_call=True)
+    clientside_callback(ClientsideFunction('bitgraphs', 'update_meetings'),
+                        Output('dropdown-update-meeting', 'options'),
+                        Input('dropdown-update-team', 'value'),
+                        State('dropdown-update-database', 'value'),
+                        State('dropdown-update-group', 'value'), prevent_initial_call=True)
+    clientside_callback(ClientsideFunction('bitgraphs', 'load_bundle'),
+                        Output('static-bundle', 'data'),
+                        Input('update-button', 'n_clicks'),
+                        State('dropdown-update-group', 'value'),
+                        State('dropdown-update-database', 'value'),
+                        State('radio-update-nodes', 'value'),
+                        State('radio-update-edges', 'value'),
+                        State('dropdown-update-team', 'value'),
+                        State('dropdown-update-meeting', 'value'),
+                        State('radio-update-colour_type', 'value'),
+                        State('radio-update-colour-source', 'value'),
+                        State('checkbox-update-normalise', 'value'))
+    clientside_callback(ClientsideFunction('bitgraphs', 'show_bundle'),
+                        [Output('BiT', 'stylesheet'),
+                         Output('weight-slider', 'min'),
+                         Output('weight-slider', 'max'),
+                         Output('weight-slider', 'marks'),
+                         Output('weight-slider', 'value'),
+                         Output('BiT2', 'elements'),
+                         Output('BiT2', 'stylesheet')],
+                        Input('static-bundle', 'data'), prevent_initial_call=True)
+    clientside_callback(ClientsideFunction('bitgraphs', 'filter_elements'),
+                        [Output('BiT', 'elements'),
+                         Output('weight-slider-output', 'children')],
+                        Input('static-bundle', 'data'),
+                        Input('weight-slider', 'value'),
+                        Input('BiT', 'selectedNodeData'),
+                        Input('dropdown-update-hops', 'value'), prevent_initial_call=True)
+    clientside_callback(ClientsideFunction('bitgraphs', 'show_tooltip'),
+                        Output('tooltip', 'children'),
+                        Input('BiT', 'mouseoverNodeData'),
+                        Input('BiT', 'mouseoverEdgeData'),
+                        State('static-bundle', 'data'))
+
 if __name__ == '__main__':
     app.run_server(debug=False)
@@ -0,0 +1,87 @@
+import argparse
+import io
+import os
+
+import pandas as pd
+
+from functions import events_file, variable_separation_file, build_cube_builder
+from cube import add_events_chunk, compact_cube_builder
+from storage import append_columnar, convert_table, drop_events, get_columnar_path, get_source_signature, has_columnar, read_cube_builder, read_metadata, write_cube_builder
+
+# Append new meetings to a dataset without counting its events again. Usage:
+#
+#   python3 append.py DATASET NEW_EVENTS_CSV [--variables NEW_VARIABLES_CSV]
+#
+# The new events (sequenceId, event, entityId, and any other columns of Events.csv) are added at the end of
+# Events.csv, to its converted copy (DATASET/columnar/Events/, if there is one) and to the saved cube builder
+# (DATASET/columnar/cube.pickle), which records the teams and meetings of the append. The running app reloads the cube
+# from the builder, reads only the new rows for its behaviour stream (see read_behaviour_stream) and only recomputes
+# the views of those teams and meetings. The lines of NEW_VARIABLES_CSV, in the format of Variables.csv, are added at the end of Variables.csv,
+# where groups that appear more than once are merged.
+#
+# The new sequences must not be in the dataset already: events of a sequence must be contiguous in Events.csv.
+
+def append_events(dataset_name, new_events, new_variables_lines=None):
+    # Returns the teams and meetings of the new events
+    events_path = os.path.join(dataset_name, events_file)
+    builder = read_cube_builder(events_path)
+    if builder is None:
+        builder = build_cube_builder(dataset_name)
+    sequence_ids = new_events['sequenceId'].unique()
+    known = builder['sequence_index']
+    if any(sequence_id in known for sequence_id in sequence_ids):
+        raise ValueError('Sequences already in ' + dataset_name + ': ' + ', '.join(sequence_id for sequence_id in sequence_ids if sequence_id in known))
+
+    # Events.csv, with the columns in the order of its header. The new rows are read back from the lines added, so
+    # they have the types they get when the whole file is read
+    columns = pd.read_csv(events_path, nrows=0).columns
+    columnar = has_columnar(events_path)
+    dictionary_columns = []
+    if columnar:
+        dictionary_columns = [column['name'] for column in read_metadata(get_columnar_path(events_path))['columns'] if column['kind'] == 'dictionary']
+    lines = new_events.reindex(columns=columns).to_csv(header=False, index=False, lineterminator='\n')
+    new_events = pd.read_csv(io.StringIO(lines), header=None, names=columns, dtype={column: str for column in dictionary_columns})
+    with open(events_path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        ends_with_newline = file.read(1) == b'\n'
+    with open(events_path, 'a', newline='') as file:
+        if not ends_with_newline:
+            file.write('\n')
+        file.write(lines)
+    new_events = drop_events(new_events)
+    if columnar and not append_columnar(new_events, get_columnar_path(events_path), get_source_signature(events_path)):
+        convert_table(events_path)
+
+    known_behaviours = set(builder['event_index'])
+    add_events_chunk(builder, new_events)
+    compact_cube_builder(builder)
+    # sequenceId has the form meeting_team
+    teams = sorted(set(sequence_id.split('_')[1] for sequence_id in sequence_ids))
+    meetings = sorted(set(sequence_id.split('_')[0] for sequence_id in sequence_ids))
+    builder['source'] = get_source_signature(events_path)
+    behaviours = [behaviour for behaviour in builder['event_index'] if behaviour not in known_behaviours]
+    builder['appends'].append({'source': builder['source'], 'teams': teams, 'meetings': meetings, 'behaviours': behaviours})
+    write_cube_builder(events_path, builder)
+
+    if new_variables_lines is not None:
+        variables_path = os.path.join(dataset_name, variable_separation_file)
+        with open(variables_path, 'r') as file:
+            ends_with_newline = file.read().endswith('\n')
+        with open(variables_path, 'a') as file:
+            if not ends_with_newline:
+                file.write('\n')
+            file.writelines(line if line.endswith('\n') else line + '\n' for line in new_variables_lines)
+    return teams, meetings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append new meetings to a dataset')
+    parser.add_argument('dataset')
+    parser.add_argument('events', help='CSV file with the events of the new meetings')
+    parser.add_argument('--variables', help='lines to add to Variables.csv for the new meetings')
+    args = parser.parse_args()
+    new_variables_lines = None
+    if args.variables is not None:
+        with open(args.variables, 'r') as file:
+            new_variables_lines = file.readlines()
+    teams, meetings = append_events(args.dataset, pd.read_csv(args.events), new_variables_lines)
+    print('Appended meetings ' + ', '.join(meetings) + ' of teams ' + ', '.join(teams) + ' to ' + args.dataset)
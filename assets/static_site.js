@@ -0,0 +1,149 @@
+// Callbacks of the static site (see export.py), run in the browser on the exported bundles. The live app answers
+// the same callbacks on the server, these are only registered when app.py is imported with BITGRAPHS_STATIC_SITE=1
+
+var bitgraphsIndex = null;
+
+function getIndex() {
+    // index.json has the bundle number of every view, the options of the team and meeting dropdowns and the shared
+    // stylesheets. It is fetched once
+    if (bitgraphsIndex === null) {
+        bitgraphsIndex = fetch('bundles/index.json').then(function (response) {
+            return response.json();
+        });
+    }
+    return bitgraphsIndex;
+}
+
+function getViewKey(database, groupBy, team, meeting, nodeType, edgeType, normalise, colourType, colourSource) {
+    // Same as get_view_key in export.py
+    return JSON.stringify([database, groupBy, team, meeting, nodeType, edgeType, normalise, colourType, colourSource]);
+}
+
+function roundWeight(value) {
+    return Math.round(value * 100) / 100;
+}
+
+function getNeighbourhoodEdges(edges, nodeIds, hops, colourSource) {
+    // Indices of the edges up to hops steps away from nodeIds, as get_neighbourhood_edges in functions.py
+    var [start, end] = colourSource === 'Source' ? ['source', 'target'] : ['target', 'source'];
+    var selected = new Set();
+    var reached = new Set(nodeIds);
+    var frontier = new Set(nodeIds);
+    for (var hop = 0; hop < hops && frontier.size > 0; hop++) {
+        var next = new Set();
+        edges.forEach(function (edge, i) {
+            if (!selected.has(i) && frontier.has(edge.data[start])) {
+                selected.add(i);
+                if (!reached.has(edge.data[end])) {
+                    next.add(edge.data[end]);
+                }
+            }
+        });
+        next.forEach(function (node) {
+            reached.add(node);
+        });
+        frontier = next;
+    }
+    return selected;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    bitgraphs: {
+        update_layout: function (layout) {
+            return {'name': layout};
+        },
+
+        update_teams: function (groupBy, database) {
+            return getIndex().then(function (index) {
+                return (index.teams[database] || {})[groupBy] || [];
+            });
+        },
+
+        update_meetings: function (team, database, groupBy) {
+            if (team === '') {
+                return [];
+            }
+            return getIndex().then(function (index) {
+                return ((index.meetings[database] || {})[groupBy] || {})[team] || [{'label': 'All', 'value': 'All'}];
+            });
+        },
+
+        load_bundle: function (nClicks, groupBy, database, nodeType, edgeType, team, meeting, colourType, colourSource, normalise) {
+            var key = getViewKey(database, groupBy, team, meeting === null ? 'All' : meeting, nodeType, edgeType,
+                                 normalise.includes('Normalise'), colourType, colourSource);
+            return getIndex().then(function (index) {
+                if (!(key in index.views)) {
+                    // Not a valid combination of options (see check_valid_options)
+                    return window.dash_clientside.no_update;
+                }
+                return fetch('bundles/' + index.views[key] + '.json').then(function (response) {
+                    return response.json();
+                });
+            });
+        },
+
+        show_bundle: function (bundle) {
+            return getIndex().then(function (index) {
+                return [
+                    bundle.selector_node_classes.concat(bundle.selector_edge_classes, index.default_stylesheet),
+                    bundle.min_weight,
+                    bundle.max_weight,
+                    bundle.weight_bins,
+                    [bundle.min_weight, bundle.max_weight],
+                    bundle.legend_nodes,
+                    bundle.selector_node_classes.concat(index.legend_stylesheet)
+                ];
+            });
+        },
+
+        filter_elements: function (bundle, selectedWeight, selectedNodes, hops) {
+            if (!bundle) {
+                return window.dash_clientside.no_update;
+            }
+            var triggered = window.dash_clientside.callback_context.triggered.map(function (t) {
+                return t.prop_id;
+            });
+            var edges = bundle.edges;
+            var weightText = 'Weight threshold: ' + roundWeight(selectedWeight[0]) + ' - ' + roundWeight(selectedWeight[1]);
+            if (triggered.includes('BiT.selectedNodeData') || triggered.includes('dropdown-update-hops.value')) {
+                if (selectedNodes && selectedNodes.length > 0) {
+                    var nodeIds = selectedNodes.map(function (node) {
+                        return node.id;
+                    });
+                    var selected = getNeighbourhoodEdges(edges, nodeIds, hops, bundle.view.colour_source);
+                    edges = edges.filter(function (edge, i) {
+                        return selected.has(i);
+                    });
+                } else if (triggered.includes('dropdown-update-hops.value')) {
+                    return window.dash_clientside.no_update;
+                }
+            } else if (triggered.includes('weight-slider.value')) {
+                edges = edges.filter(function (edge) {
+                    return edge.data.weight >= selectedWeight[0] && edge.data.weight <= selectedWeight[1];
+                });
+            }
+            return [edges.concat(bundle.nodes), weightText];
+        },
+
+        show_tooltip: function (hoverNodeData, hoverEdgeData, bundle) {
+            if (!bundle || !(hoverNodeData || hoverEdgeData)) {
+                return window.dash_clientside.no_update;
+            }
+            var triggered = window.dash_clientside.callback_context.triggered[0].prop_id;
+            if (triggered.includes('Node')) {
+                return hoverNodeData.id + ', with frequency: ' + hoverNodeData.freq + ' ';
+            }
+            var view = bundle.view;
+            var edge = hoverEdgeData;
+            var text = view.node_type === 'Behaviours'
+                ? edge.source.toUpperCase() + ' -> ' + edge.target.toUpperCase() + ': '
+                : edge.source + ' -> ' + edge.target + ', ' + edge.behaviour + ': ';
+            if (view.edge_type === 'Frequency') {
+                text += view.normalise ? edge.weight : edge.original_weight;
+            } else {
+                text += edge.original_weight + ' (' + (view.node_type === 'Behaviours' ? roundWeight(edge.weight) : edge.weight) + '%)';
+            }
+            return text + ' ';
+        }
+    }
+});
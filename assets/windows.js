@@ -0,0 +1,29 @@
+// Playback of the temporal windows of a graph (see the window callbacks in app.py). The server sends the elements of
+// WINDOW_PREFETCH consecutive windows at once to the window-frames store, and these callbacks show them as the window
+// slider moves, so playing does not wait for the server at every step
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    windows: {
+        show_window: function (start, frames) {
+            if (!frames || !(String(start) in frames.elements)) {
+                // Not fetched yet, the store is updated by the server
+                return window.dash_clientside.no_update;
+            }
+            return [frames.elements[String(start)],
+                    'Window: transitions ' + start + ' - ' + (start + frames.size - 1) + ' of ' + frames.transitions];
+        },
+
+        play_window: function (nClicks, disabled) {
+            // Start or stop playing
+            return [!disabled, disabled ? 'Pause' : 'Play'];
+        },
+
+        advance_window: function (nIntervals, start, last, step) {
+            // Next window, stopping at the last one
+            if (start >= last) {
+                return [window.dash_clientside.no_update, true, 'Play'];
+            }
+            return [Math.min(start + step, last), false, 'Pause'];
+        }
+    }
+});
@@ -0,0 +1,107 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from functions import *
+
+# Benchmarks of the stages of the graph pipeline on the datasets in the current directory (e.g. generated with
+# synthetic.py). Usage:
+#
+#   python3 benchmark.py DATASETS [--repeat N] [--output results.json] [--compare previous.json]
+#
+# Each benchmark is run repeat times for the wall time (the median is reported) and once more under tracemalloc for
+# the peak of memory allocated by Python and NumPy. Results are printed and written as JSON, and compared with
+# the results of a previous run if given.
+
+BENCHMARK_REPEAT = 5
+
+def run_benchmark(function, repeat, setup=None):
+    # Median and minimum wall time in seconds and peak allocated memory in bytes of function(). setup() is run
+    # before each call, outside of the measures
+    times = []
+    for run in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'median': float(np.median(times)), 'min': float(np.min(times)), 'peak_memory': peak}
+
+def get_benchmarks(dataset_name):
+    # (name, function, setup) of every benchmark of a dataset. The dataset is parsed once first, so only read_files
+    # and read_cube are measured without cache
+    events, entities, teams, behaviours, participants, meetings = read_files(dataset_name)
+    cube = read_cube(dataset_name)
+    team = teams[1]
+    node_data = get_participant_node_data(events, entities, team, 'All', participants, True)
+    entity_list = node_data[6]
+
+    def clear_cache():
+        dataset_cache.invalidate()
+
+    benchmarks = [
+        ('read_files', lambda: read_files(dataset_name), clear_cache),
+        ('read_cube', lambda: read_cube(dataset_name), lambda: (clear_cache(), read_files(dataset_name)))
+    ]
+    # Stats are counted on the first hover of a graph, then each hover formats the text of one node or edge
+    stats_counts = get_stats_counts('Teams', dataset_name, 'All', 'All')
+    source, target = get_behaviour_edge_data('Teams', 'Frequency', teams, cube, 'All', 'All', True)[0][0][:2]
+    benchmarks += [
+        ('get_behaviour_node_data', lambda: get_behaviour_node_data('Teams', cube, teams, 'All', 'All', participants, True), None),
+        ('get_behaviour_edge_data', lambda: get_behaviour_edge_data('Teams', 'Frequency', teams, cube, 'All', 'All', True), None),
+        ('load_dataset', lambda: load_dataset('Teams', dataset_name, 'Behaviours', 'Frequency', 'All', 'All', 'Behaviours', 'Source', True), None),
+        ('get_stats_counts', lambda: get_stats_counts('Teams', dataset_name, 'All', 'All'), None),
+        ('get_edge_stats', lambda: get_edge_stats(stats_counts, source, target), None),
+        ('get_participant_node_data', lambda: get_participant_node_data(events, entities, team, 'All', participants, True), None),
+        ('get_participant_edge_data', lambda: get_participant_edge_data('Frequency', cube, team, 'All', entity_list, True), None),
+        ('load_dataset participants', lambda: load_dataset('Teams', dataset_name, 'Participants', 'Frequency', team, 'All', 'Behaviours', 'Source', True), None)
+    ]
+    return benchmarks
+
+def run_benchmarks(dataset_names, repeat=BENCHMARK_REPEAT):
+    results = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'datasets': {}}
+    for dataset_name in dataset_names:
+        events = read_files(dataset_name)[0]
+        dataset_results = {'events': len(events), 'sequences': int(events['sequence'].max()) + 1, 'benchmarks': {}}
+        for name, function, setup in get_benchmarks(dataset_name):
+            dataset_results['benchmarks'][name] = run_benchmark(function, repeat, setup)
+        results['datasets'][dataset_name] = dataset_results
+    return results
+
+def print_results(results, previous=None):
+    for dataset_name, dataset_results in results['datasets'].items():
+        print(dataset_name + ': ' + str(dataset_results['events']) + ' events, ' + str(dataset_results['sequences']) + ' sequences')
+        previous_benchmarks = previous['datasets'].get(dataset_name, {}).get('benchmarks', {}) if previous is not None else {}
+        for name, result in dataset_results['benchmarks'].items():
+            line = '  ' + name.ljust(32) + str(round(result['median'] * 1000, 2)).rjust(10) + ' ms' + str(round(result['peak_memory'] / 1024 ** 2, 2)).rjust(10) + ' MiB'
+            if name in previous_benchmarks:
+                line += '  x' + str(round(result['median'] / previous_benchmarks[name]['median'], 2)) + ' time'
+            print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the graph pipeline')
+    parser.add_argument('datasets', nargs='+')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    args = parser.parse_args()
+    results = run_benchmarks(args.datasets, args.repeat)
+    previous = None
+    if args.compare is not None:
+        with open(args.compare, 'r') as file:
+            previous = json.load(file)
+    print_results(results, previous)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
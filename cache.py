@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def get_file_signature(paths):
+    # Modification time and size of every file, used to tell whether a cached entry is stale. Missing files are
+    # recorded as None, so creating them also invalidates the entry
+    signature = []
+    for path in paths:
+        if os.path.exists(path):
+            file_stat = os.stat(path)
+            signature.append((path, file_stat.st_mtime_ns, file_stat.st_size))
+        else:
+            signature.append((path, None))
+    return tuple(signature)
+
+
+class DatasetCache:
+    # Least recently used cache of parsed datasets keyed by dataset name. Each entry remembers the signature of the
+    # files it was parsed from and is reloaded as soon as one of them changes on disk. Entries are evicted, least
+    # recently used first, once their estimated size goes over max_bytes (the most recent entry is always kept)
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, name, paths, load, size_of):
+        signature = get_file_signature(paths)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry[0] == signature:
+                self.entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = load()
+        with self.lock:
+            self.entries[name] = (signature, value, size_of(value))
+            self.entries.move_to_end(name)
+            self.evict()
+        return value
+
+    def peek(self, name):
+        # Cached value of name even if its files changed since, or None. Used to update a value instead of loading
+        # it again
+        with self.lock:
+            entry = self.entries.get(name)
+        return entry[1] if entry is not None else None
+
+    def evict(self):
+        while len(self.entries) > 1 and self.get_size() > self.max_bytes:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, name=None):
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(name, None)
+
+    def get_size(self):
+        return sum(entry[2] for entry in self.entries.values())
+
+    def get_info(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'datasets': list(self.entries.keys()),
+                'bytes': self.get_size(),
+                'max_bytes': self.max_bytes
+            }
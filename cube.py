@@ -0,0 +1,338 @@
+import numpy as np
+import pandas as pd
+
+# Position used for "never appears" when taking the first appearance of a node or transition
+NOT_PRESENT = np.iinfo(np.int64).max
+
+# The transition cube of a dataset holds node frequencies and transition counts per sequence, so that the graph of
+# any selection of sequences (team, meeting, group or 'All') is a masked sum over sequence rows instead of a new pass
+# over the events.
+#
+# Transitions are counted inside segments: runs of consecutive rows of the same sequence. The transition from the
+# last row of a segment to the first row of the next selected segment depends on the selection, so it is added back
+# when a selection is made (see get_junctions). First appearance positions are kept as well, so that nodes and edges
+# come out in the same order as when counting the filtered events directly.
+#
+# The cube is built from events read in chunks (new_cube_builder, add_events_chunk, get_builder_cube), so that the
+# events of a dataset never need to be in memory at once. Between chunks only a cube builder is kept: the counts, plus
+# the last row of each row stream (all rows, rows without 'Break' and rows with a participant) to count the
+# transitions across chunk boundaries. A builder can be saved and more events added to it later (see append.py).
+
+def new_cube_builder():
+    return {
+        'sequence_index': {},
+        'event_index': {},
+        'entity_index': {},
+        'n_rows': 0,
+        'sequence_rows': np.zeros(0, dtype=np.int64),
+        'node_counts': np.zeros((0, 0), dtype=np.int64),
+        'node_first': np.full((0, 0), NOT_PRESENT, dtype=np.int64),
+        'transition_counts': np.zeros((0, 0, 0), dtype=np.int64),
+        'transition_first': np.full((0, 0, 0), NOT_PRESENT, dtype=np.int64),
+        'behaviour': new_row_stream(1),
+        'participant': new_row_stream(2),
+        # Participant transitions counted so far: sequence, source, target and event codes, counts and first positions
+        'participant_rows': [np.zeros(0, dtype=np.int64) for i in range(6)]
+    }
+
+def add_events_chunk(builder, chunk):
+    # Add the events of chunk, which follow those already added, to builder
+    sequence_codes = get_chunk_codes(builder['sequence_index'], chunk['sequenceId'])
+    event_codes = get_chunk_codes(builder['event_index'], chunk['event'])
+    n_sequences = len(builder['sequence_index'])
+    n_events = len(builder['event_index'])
+    builder['sequence_rows'] = grow(builder['sequence_rows'], (n_sequences,), 0)
+    for name, fill_value in [('node_counts', 0), ('node_first', NOT_PRESENT)]:
+        builder[name] = grow(builder[name], (n_sequences, n_events), fill_value)
+    for name, fill_value in [('transition_counts', 0), ('transition_first', NOT_PRESENT)]:
+        builder[name] = grow(builder[name], (n_sequences, n_events, n_events), fill_value)
+
+    builder['sequence_rows'] += np.bincount(sequence_codes, minlength=n_sequences)
+    keys = sequence_codes * n_events + event_codes
+    add_counts(builder['node_counts'], builder['node_first'], keys, builder['n_rows'] + np.arange(len(keys)))
+    builder['n_rows'] += len(keys)
+
+    keep = event_codes != builder['event_index'].get('Break', -1)
+    offset = builder['behaviour']['offset']
+    sources, targets, sequences, rows = add_stream_rows(builder['behaviour'], sequence_codes[keep], [event_codes[keep]], n_sequences)
+    add_counts(builder['transition_counts'], builder['transition_first'], (sequences * n_events + sources) * n_events + targets, offset + rows)
+
+    keep = chunk['entityId'].to_numpy() != -1
+    entity_codes = get_chunk_codes(builder['entity_index'], chunk['entityId'][keep])
+    labels = event_codes[keep]
+    offset = builder['participant']['offset']
+    sources, targets, sequences, rows = add_stream_rows(builder['participant'], sequence_codes[keep], [entity_codes, labels], n_sequences)
+    counts = np.ones(len(rows), dtype=np.int64)
+    shape = (n_sequences, len(builder['entity_index']), n_events)
+    builder['participant_rows'] = merge_participant_rows(builder['participant_rows'], [sequences, sources, targets, labels[rows], counts, offset + rows], shape)
+
+def compact_cube_builder(builder):
+    # Join the segments stored chunk by chunk into one array each, before saving the builder
+    for name in ['behaviour', 'participant']:
+        stream = builder[name]
+        for key in ['segment_sequences', 'segment_starts', 'segment_last']:
+            if len(stream[key]) > 1:
+                stream[key] = [np.concatenate(stream[key])]
+        stream['segment_first'] = [[np.concatenate(first)] if len(first) > 1 else first for first in stream['segment_first']]
+
+def get_builder_cube(builder):
+    # Cube of the events added to builder. builder is not changed, so more events can be added afterwards
+    cube = {}
+    n_sequences = len(builder['sequence_index'])
+    n_events = len(builder['event_index'])
+    cube['event_names'] = np.asarray(list(builder['event_index']), dtype=object)
+    cube['sequence_ids'] = np.asarray(list(builder['sequence_index']), dtype=object)
+    sequence_parts = pd.Series(cube['sequence_ids'], dtype=object).str.split('_')
+    cube['sequence_meetings'] = np.asarray(sequence_parts.str[0], dtype=object)
+    cube['sequence_teams'] = np.asarray(sequence_parts.str[1], dtype=object)
+    cube['sequence_rows'] = builder['sequence_rows']
+    cube['team_ids'], cube['sequence_team_codes'] = np.unique(cube['sequence_teams'], return_inverse=True)
+    cube['node_counts'] = builder['node_counts']
+    cube['node_first'] = builder['node_first']
+    add_row_stream(cube, 'behaviour', builder['behaviour'], n_sequences)
+    cube['transition_counts'] = builder['transition_counts']
+    cube['transition_first'] = builder['transition_first']
+    cube['entity_ids'] = np.asarray(list(builder['entity_index']), dtype=object)
+    add_row_stream(cube, 'participant', builder['participant'], n_sequences)
+    sequences, sources, targets, events, counts, first = builder['participant_rows']
+    cube['participant_first'] = first
+    cube['participant_counts'] = counts
+    cube['participant_events'] = events
+    cube['participant_targets'] = targets
+    cube['participant_sources'] = sources
+    cube['participant_sequences'] = sequences
+    return cube
+
+def get_chunk_codes(index, values):
+    # Codes of values, numbered in order of first appearance across chunks. index maps known values to their code
+    # and gets the new values of this chunk
+    codes, uniques = pd.factorize(values)
+    unique_codes = np.empty(len(uniques), dtype=np.int64)
+    for i, value in enumerate(uniques.tolist()):
+        unique_codes[i] = index.setdefault(value, len(index))
+    return unique_codes[codes]
+
+def grow(array, shape, fill_value):
+    # array padded with fill_value to shape
+    if array.shape == shape:
+        return array
+    grown = np.full(shape, fill_value, dtype=array.dtype)
+    grown[tuple(slice(0, size) for size in array.shape)] = array
+    return grown
+
+def add_counts(counts, first, keys, positions):
+    # Add the occurrences of keys (flat indices) to counts and their smallest position to first, in place
+    counts.reshape(-1)[:] += np.bincount(keys, minlength=counts.size)
+    unique_keys, first_index = np.unique(keys, return_index=True)
+    flat_first = first.reshape(-1)
+    flat_first[unique_keys] = np.minimum(flat_first[unique_keys], positions[first_index])
+
+def new_row_stream(n_codes):
+    # State of a row stream between chunks: the number of rows so far, the sequence and codes of the last row, and the
+    # segments found so far: the sequence, start position and first codes of each segment, and the last node of the
+    # segments before them (see add_stream_rows)
+    return {'offset': 0, 'last_sequence': -1, 'last_codes': None, 'rows': np.zeros(0, dtype=np.int64),
+            'sequence_first': np.zeros(0, dtype=np.int64), 'segment_sequences': [], 'segment_starts': [],
+            'segment_last': [], 'segment_first': [[] for i in range(n_codes)]}
+
+def add_stream_rows(stream, sequence_codes, node_codes, n_sequences):
+    # Add the rows of a chunk to a row stream. Returns the transitions between consecutive rows of the same segment
+    # (source and target codes of the first code array, sequence and row of the target in the chunk), including the
+    # one from the last row of the previous chunk
+    offset = stream['offset']
+    n_rows = len(sequence_codes)
+    stream['rows'] = grow(stream['rows'], (n_sequences,), 0) + np.bincount(sequence_codes, minlength=n_sequences)
+    stream['sequence_first'] = grow(stream['sequence_first'], (n_sequences,), NOT_PRESENT)
+    if n_rows == 0:
+        return [np.zeros(0, dtype=np.int64)] * 4
+    previous_sequences = np.append(stream['last_sequence'], sequence_codes[:-1])
+    same_segment = sequence_codes == previous_sequences
+    if stream['last_codes'] is None:
+        previous_nodes = np.append(0, node_codes[0][:-1])
+    else:
+        previous_nodes = np.append(stream['last_codes'][0], node_codes[0][:-1])
+
+    # Segments starting in this chunk, and the last node of the segments they follow
+    starts = np.flatnonzero(~same_segment)
+    ends = starts if stream['last_codes'] is not None else starts[starts > 0]
+    stream['segment_last'].append(previous_nodes[ends])
+    stream['segment_sequences'].append(sequence_codes[starts])
+    stream['segment_starts'].append(offset + starts)
+    for i, codes in enumerate(node_codes):
+        stream['segment_first'][i].append(codes[starts])
+    segment_sequences, first_segments = np.unique(sequence_codes[starts], return_index=True)
+    stream['sequence_first'][segment_sequences] = np.minimum(stream['sequence_first'][segment_sequences], offset + starts[first_segments])
+
+    stream['last_sequence'] = sequence_codes[-1]
+    stream['last_codes'] = [codes[-1] for codes in node_codes]
+    stream['offset'] = offset + n_rows
+    rows = np.flatnonzero(same_segment)
+    return previous_nodes[rows], node_codes[0][rows], sequence_codes[rows], rows
+
+def add_row_stream(cube, name, stream, n_sequences):
+    # Store the segments of a row stream in the cube: the sequence, start position, first and last node of every
+    # segment, and the rows and position of the first row of each sequence (used to order sequences by appearance).
+    # First values are kept for every code array (node, then label for participants), last values only for the node.
+    # The last segment ends at the last row
+    segment_last = stream['segment_last'] + ([np.array([stream['last_codes'][0]])] if stream['last_codes'] is not None else [])
+    cube[name + '_segment_sequences'] = np.concatenate(stream['segment_sequences'] or [np.zeros(0, dtype=np.int64)]).astype(np.int32)
+    cube[name + '_segment_starts'] = np.concatenate(stream['segment_starts'] or [np.zeros(0, dtype=np.int64)])
+    cube[name + '_segment_last'] = np.concatenate(segment_last or [np.zeros(0, dtype=np.int64)])
+    cube[name + '_segment_first'] = [np.concatenate(first or [np.zeros(0, dtype=np.int64)]) for first in stream['segment_first']]
+    cube[name + '_rows'] = grow(stream['rows'], (n_sequences,), 0)
+    cube[name + '_sequence_first'] = grow(stream['sequence_first'], (n_sequences,), NOT_PRESENT)
+
+def merge_participant_rows(rows, new_rows, shape):
+    # Add up participant transitions with the same sequence, source, target and event (codes smaller than shape).
+    # Rows are sorted by those codes and keep the smallest first position
+    sequences, sources, targets, events, counts, first = [np.concatenate([old, new]).astype(np.int64) for old, new in zip(rows, new_rows)]
+    n_sequences, n_entities, n_events = shape
+    keys = ((sequences * n_entities + sources) * n_entities + targets) * n_events + events
+    keys, inverse = np.unique(keys, return_inverse=True)
+    merged_counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+    merged_first = np.full(len(keys), NOT_PRESENT, dtype=np.int64)
+    np.minimum.at(merged_first, inverse, first)
+    events = keys % n_events
+    keys = keys // n_events
+    targets = keys % n_entities
+    keys = keys // n_entities
+    return [keys // n_entities, keys % n_entities, targets, events, merged_counts, merged_first]
+
+def get_sequence_mask(cube, teams=None, meeting='All'):
+    # Sequences in any of teams (all teams if None) and in meeting
+    mask = np.ones(len(cube['sequence_ids']), dtype=bool)
+    if teams is not None:
+        mask &= np.isin(cube['sequence_teams'], list(teams))
+    if meeting != 'All':
+        mask &= cube['sequence_meetings'] == meeting
+    return mask
+
+def get_junctions(cube, name, sequence_mask, segment_groups=None):
+    # Transitions from the last row of a selected segment to the first row of the next selected segment of the same
+    # group (segment_groups gives a group code per segment, None puts every segment in one group). Returns the index
+    # of the source and target segments and the group of each junction
+    segments = np.flatnonzero(sequence_mask[cube[name + '_segment_sequences']])
+    if segment_groups is None:
+        groups = np.zeros(len(segments), dtype=np.int64)
+    else:
+        segments = segments[np.argsort(segment_groups[segments], kind='stable')]
+        groups = segment_groups[segments]
+    same_group = groups[1:] == groups[:-1]
+    return segments[:-1][same_group], segments[1:][same_group], groups[1:][same_group]
+
+def get_selection_junctions(cube, name, sequence_mask, split_sequences):
+    # Junctions between consecutive selected segments. With split_sequences, only those between two segments of the
+    # same sequence are kept
+    sources, targets, groups = get_junctions(cube, name, sequence_mask)
+    if split_sequences:
+        segment_sequences = cube[name + '_segment_sequences']
+        same_sequence = segment_sequences[sources] == segment_sequences[targets]
+        sources = sources[same_sequence]
+        targets = targets[same_sequence]
+    return sources, targets
+
+def get_node_counts(cube, sequence_mask):
+    # Frequency and first appearance of every event in the selected sequences, and their number of rows
+    counts = cube['node_counts'][sequence_mask].sum(axis=0)
+    first = cube['node_first'][sequence_mask].min(axis=0, initial=NOT_PRESENT)
+    return counts, first, int(cube['sequence_rows'][sequence_mask].sum())
+
+def get_group_node_counts(cube, sequence_mask, sequence_groups, n_groups):
+    # Event frequencies of the selected sequences added up per group (groups x events)
+    counts = np.zeros((n_groups, len(cube['event_names'])), dtype=np.int64)
+    np.add.at(counts, sequence_groups[sequence_mask], cube['node_counts'][sequence_mask])
+    return counts
+
+def get_transition_counts(cube, sequence_mask, split_sequences=False):
+    # Behaviour transition counts (source x target) of the selected sequences and the first appearance of each
+    # transition, as if the selected events had been filtered and counted in order. With split_sequences,
+    # transitions between different sequences are left out
+    counts = cube['transition_counts'][sequence_mask].sum(axis=0)
+    first = cube['transition_first'][sequence_mask].min(axis=0, initial=NOT_PRESENT)
+    sources, targets = get_selection_junctions(cube, 'behaviour', sequence_mask, split_sequences)
+    source_codes = cube['behaviour_segment_last'][sources]
+    target_codes = cube['behaviour_segment_first'][0][targets]
+    np.add.at(counts, (source_codes, target_codes), 1)
+    np.minimum.at(first, (source_codes, target_codes), cube['behaviour_segment_starts'][targets])
+    return counts, first, int(cube['behaviour_rows'][sequence_mask].sum())
+
+def get_group_transition_counts(cube, sequence_mask, sequence_groups, n_groups):
+    # Behaviour transition counts of the selected sequences per group (groups x source x target), as if the events
+    # of each group had been filtered and counted on their own
+    n_events = len(cube['event_names'])
+    counts = np.zeros((n_groups, n_events, n_events), dtype=np.int64)
+    np.add.at(counts, sequence_groups[sequence_mask], cube['transition_counts'][sequence_mask])
+    segment_groups = sequence_groups[cube['behaviour_segment_sequences']]
+    sources, targets, groups = get_junctions(cube, 'behaviour', sequence_mask, segment_groups)
+    np.add.at(counts, (groups, cube['behaviour_segment_last'][sources], cube['behaviour_segment_first'][0][targets]), 1)
+    return counts
+
+def get_participant_transitions(cube, sequence_mask, entity_names, split_sequences=False):
+    # Participant transitions of the selected sequences in order of first appearance, with entityIds replaced by
+    # entity_names (a dictionary entityId: name; other entityIds are kept as they are). Returns the node names and,
+    # for each transition, the codes of its source and target in the node names, its event code and its count. Also
+    # returns the number of rows of the selection
+    rows = np.flatnonzero(sequence_mask[cube['participant_sequences']])
+    sources, targets = get_selection_junctions(cube, 'participant', sequence_mask, split_sequences)
+    source_codes = np.concatenate([cube['participant_sources'][rows], cube['participant_segment_last'][sources]])
+    target_codes = np.concatenate([cube['participant_targets'][rows], cube['participant_segment_first'][0][targets]])
+    event_codes = np.concatenate([cube['participant_events'][rows], cube['participant_segment_first'][1][targets]])
+    counts = np.concatenate([cube['participant_counts'][rows], np.ones(len(targets), dtype=np.int64)])
+    first = np.concatenate([cube['participant_first'][rows], cube['participant_segment_starts'][targets]])
+
+    # Entities with the same name become the same node
+    names = [entity_names.get(entity_id, entity_id) for entity_id in cube['entity_ids']]
+    name_codes, name_values = pd.factorize(pd.Series(names, dtype=object))
+    n_names = max(len(name_values), 1)
+    n_events = len(cube['event_names'])
+    keys = (name_codes[source_codes].astype(np.int64) * n_names + name_codes[target_codes]) * n_events + event_codes
+    keys, inverse = np.unique(keys, return_inverse=True)
+    key_counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+    key_first = np.full(len(keys), NOT_PRESENT, dtype=np.int64)
+    np.minimum.at(key_first, inverse, first)
+    order = np.argsort(key_first, kind='stable')
+
+    keys = keys[order]
+    event_codes = keys % n_events
+    keys = keys // n_events
+    return np.asarray(name_values, dtype=object), keys // n_names, keys % n_names, event_codes, key_counts[order], int(cube['participant_rows'][sequence_mask].sum())
+
+def get_kgram_counts(stream_sequences, stream_events, sequence_mask, order, n_events):
+    # k-grams (order consecutive events of the same sequence) of the selected sequences. stream_sequences and
+    # stream_events are the sequence and event codes of the rows, grouped by sequence with the rows of each sequence in
+    # order. Returns the k-grams as integer keys (event codes in base n_events, the first event the most significant)
+    # in order of first appearance, their counts, and the number of rows of the selection
+    rows = sequence_mask[stream_sequences]
+    sequences = stream_sequences[rows]
+    events = stream_events[rows].astype(np.int64)
+    n_windows = len(events) - order + 1
+    if n_windows <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), len(events)
+    # Key of the window starting at each row, event by event, keeping only windows that end in the sequence they start
+    keys = np.zeros(n_windows, dtype=np.int64)
+    for position in range(order):
+        keys = keys * n_events + events[position:position + n_windows]
+    keys = keys[sequences[:n_windows] == sequences[order - 1:]]
+    keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    return keys[order], counts[order], len(events)
+
+def get_transition_prefix_sums(stream_sequences, stream_events, sequence_mask, n_events, max_cells):
+    # Cumulative transition counts of the selected sequences, for the counts of any window of consecutive transitions
+    # without going through the events again. Transitions are between consecutive events of the same sequence, in
+    # order (see get_kgram_counts for the stream). Row c of the result has the counts (n_events * n_events) of the
+    # first c * stride transitions, the last row those of all of them; stride is the smallest that keeps the result
+    # within max_cells. Returns the counts, the stride and the number of transitions
+    rows = sequence_mask[stream_sequences]
+    sequences = stream_sequences[rows]
+    events = stream_events[rows].astype(np.int64)
+    same = sequences[:-1] == sequences[1:]
+    keys = events[:-1][same] * n_events + events[1:][same]
+    n_cells = n_events * n_events
+    stride = max(1, -(-(len(keys) + 1) * n_cells // max_cells))
+    n_blocks = -(-len(keys) // stride)
+    blocks = np.arange(len(keys)) // stride
+    counts = np.bincount(blocks * n_cells + keys, minlength=n_blocks * n_cells).reshape(n_blocks, n_cells)
+    prefix = np.zeros((n_blocks + 1, n_cells), dtype=np.int32)
+    np.cumsum(counts, axis=0, out=prefix[1:])
+    return prefix, stride, len(keys)
@@ -0,0 +1,124 @@
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Static site for GitHub Pages: the page of the app with its callbacks running in the browser (see
+# assets/static_site.js), and a bundle with the graph of every combination of options. Usage:
+#
+#   python3 export.py [OUTPUT_DIRECTORY] [DATASETS]
+#
+# The app must be imported in static site mode, with the path the site is served from
+os.environ.setdefault('BITGRAPHS_STATIC_SITE', '1')
+os.environ.setdefault('DASH_REQUESTS_PATHNAME_PREFIX', '/BiTGraphs/')
+
+from plotly.io.json import to_json_plotly
+
+from functions import *
+from app import app, default_stylesheet, legend_stylesheet
+
+EXPORT_DIRECTORY = 'pages_files'
+BUNDLES_DIRECTORY = 'bundles'
+# Files loaded by the dash renderer and dcc on demand, so they are not in the page
+DCC_CHUNKS = ['async-dropdown.js', 'async-slider.js', 'async-graph.js', 'async-highlight.js', 'async-markdown.js', 'async-datepicker.js', 'dash_core_components-shared.js']
+# Fetched by the dash renderer, renamed so that they are served as JSON
+RENDERER_REQUESTS = ['_dash-layout', '_dash-dependencies']
+
+def get_view_key(view):
+    # Same as getViewKey in assets/static_site.js
+    return json.dumps([view['database'], view['group_by'], view['team'], view['meeting'], view['node_type'], view['edge_type'], view['normalise'], view['colour_type'], view['colour_source']], separators=(',', ':'), ensure_ascii=False)
+
+def get_export_views(dataset_names):
+    # Every combination of options of the app that check_valid_options accepts, with the teams and meetings the
+    # dropdowns offer. Also returns those options as {database: {group_by: teams}} and
+    # {database: {group_by: {team: meetings}}}
+    views = []
+    team_options = {}
+    meeting_options = {}
+    for database in dataset_names:
+        for group_by in GROUP_BY_OPTIONS:
+            teams = get_teams_for_group(database, group_by)
+            team_options.setdefault(database, {})[group_by] = teams
+            for team in [option['value'] for option in teams]:
+                meetings = get_meetings_for_team(database, group_by, team)
+                meeting_options.setdefault(database, {}).setdefault(group_by, {})[team] = meetings
+                for meeting, node_type, edge_type, normalise, colour_type, colour_source in itertools.product(
+                        [option['value'] for option in meetings], ['Behaviours', 'Participants'], ['Frequency', 'Probability'], [True, False], ['Behaviours', 'Participants'], ['Source', 'Target']):
+                    if check_valid_options(node_type, colour_type, team):
+                        views.append({'group_by': group_by, 'database': database, 'node_type': node_type, 'edge_type': edge_type,
+                                      'team': team, 'meeting': meeting, 'colour_type': colour_type, 'colour_source': colour_source,
+                                      'normalise': normalise, 'show_stats': False})
+    return views, team_options, meeting_options
+
+def export_bundle(job):
+    # Write the bundle of a view. Returns the number of the bundle and its size, or None as size if the view has no
+    # graph (e.g. a group without teams)
+    number, view, path = job
+    try:
+        teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_size_map = load_dataset(
+            view['group_by'], view['database'], view['node_type'], view['edge_type'], view['team'], view['meeting'], view['colour_type'], view['colour_source'], view['normalise'])
+    except ValueError:
+        return number, None
+    bundle = {'view': view, 'nodes': nodes, 'edges': edges, 'selector_node_classes': selector_node_classes,
+              'selector_edge_classes': selector_edge_classes, 'min_weight': min_weight, 'max_weight': max_weight,
+              'weight_bins': weight_bins, 'legend_nodes': get_legend_nodes(node_names, selector_node_classes, view['colour_type'], behaviours)}
+    with open(path, 'w') as file:
+        file.write(to_json_plotly(bundle))
+    return number, os.path.getsize(path)
+
+def export_bundles(dataset_names, out_dir, processes=None):
+    # Write a bundle for every view in a pool of processes, and index.json with the bundle number of each view.
+    # Returns the number of bundles and their total size
+    bundles_dir = os.path.join(out_dir, BUNDLES_DIRECTORY)
+    os.makedirs(bundles_dir, exist_ok=True)
+    # Parsed before the pool is created, so forked workers do not parse the datasets again
+    preload_datasets(dataset_names)
+    views, team_options, meeting_options = get_export_views(dataset_names)
+    jobs = [(number, view, os.path.join(bundles_dir, str(number) + '.json')) for number, view in enumerate(views)]
+    index = {'views': {}, 'teams': team_options, 'meetings': meeting_options,
+             'default_stylesheet': default_stylesheet, 'legend_stylesheet': legend_stylesheet}
+    size = 0
+    with ProcessPoolExecutor(processes) as executor:
+        for number, bundle_size in executor.map(export_bundle, jobs, chunksize=16):
+            if bundle_size is not None:
+                index['views'][get_view_key(views[number])] = number
+                size += bundle_size
+    with open(os.path.join(bundles_dir, 'index.json'), 'w') as file:
+        file.write(to_json_plotly(index))
+    return len(index['views']), size
+
+def write_file(out_dir, path, content):
+    path = os.path.join(out_dir, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(content)
+
+def export_site(out_dir):
+    # Write the page of the app and every file it loads, as served by the app, without starting a server
+    client = app.server.test_client()
+    prefix = app.config.requests_pathname_prefix
+    page = client.get('/').get_data()
+    write_file(out_dir, 'index.html', page)
+    paths = re.findall(r'(?:src|href)="' + re.escape(prefix) + r'([^"?]+)', page.decode())
+    paths += ['_dash-component-suites/dash/dcc/' + name for name in DCC_CHUNKS]
+    for path in paths:
+        content = client.get('/' + path).get_data()
+        if 'dash_renderer' in path:
+            for request in RENDERER_REQUESTS:
+                content = content.replace(('"' + request + '"').encode(), ('"' + request + '.json"').encode())
+        write_file(out_dir, path, content)
+    for request in RENDERER_REQUESTS:
+        write_file(out_dir, request + '.json', client.get('/' + request).get_data())
+
+if __name__ == '__main__':
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else EXPORT_DIRECTORY
+    dataset_names = sys.argv[2:]
+    if len(dataset_names) == 0:
+        dataset_names = [name for name in DATASETS if os.path.exists(os.path.join(name, events_file))]
+    start = time.perf_counter()
+    export_site(out_dir)
+    n_bundles, size = export_bundles(dataset_names, out_dir)
+    print('Exported ' + str(n_bundles) + ' views (' + str(round(size / 1024 ** 2, 1)) + ' MiB) in ' + str(round(time.perf_counter() - start, 2)) + 's')
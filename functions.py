@@ -1,62 +1,299 @@
 from math import log2
+import hashlib
+import os
+import sys
 import numpy as np
 import pandas as pd
 
+from cache import DatasetCache
+from metrics import span
+from storage import drop_events, read_table, read_table_chunks, get_table_paths, get_source_signature, get_cube_builder_path, read_cube_builder, write_cube_builder, get_columnar_path, has_columnar, read_metadata, read_columnar_codes, decode_columnar
+from graph import NodeTable, EdgeTable, get_node_elements, get_edge_elements
+from layout import get_layout
+from significance import count_transitions, count_sequence_transitions, get_transition_rates, get_adjusted_residuals, get_permutation_p_values, get_bootstrap_intervals
+from cube import new_cube_builder, add_events_chunk, compact_cube_builder, get_builder_cube, get_sequence_mask, get_node_counts, get_group_node_counts, get_transition_counts, get_group_transition_counts, get_participant_transitions, get_kgram_counts, get_transition_prefix_sums
+
 NODE_MAP_MIN_SIZE = 40
 NODE_MAP_MAX_SIZE = 150
 EDGE_MAP_MIN_SIZE = 1
 EDGE_MAP_MAX_SIZE = 20
 NORMALISE_MULTIPLIER = 100
+# Memory (in bytes) of the parsed datasets kept by each process, see cache.py
+DATASET_CACHE_MAX_BYTES = int(os.environ.get('BITGRAPHS_DATASET_CACHE_MAX_BYTES', str(1024 ** 3)))
+EVENTS_CHUNK_SIZE = 250000
+DATASETS = ['GEC2017', 'GEC2018', 'EYH2017', 'EYH2018', 'IDP2019', 'IDP2020']
+GROUP_BY_OPTIONS = ['Teams', 'teammark', 'airtime_evenness', 'psy_safe', 'expgroup']
+# Markov orders of behaviour graphs: the number of consecutive behaviours of a node, see get_kgram_node_data
+BEHAVIOUR_ORDERS = [1, 2, 3]
+# p-values below which transitions are significant, as levels of the weight slider of the Significance edge type
+SIGNIFICANCE_LEVELS = [0.05, 0.01, 0.001]
+# Colours of the edges of difference graphs more frequent in the group team and in the group compare
+DIFFERENCE_COLOURS = {'edgeIncrease': 'rgb(0, 191, 255)', 'edgeDecrease': 'rgb(255, 99, 71)'}
+# Sizes (in transitions) of the windows of temporal graphs, the cells kept for their cumulative counts and the number of
+# consecutive windows sent at once while playing
+WINDOW_SIZES = [25, 50, 100, 250, 500, 1000]
+WINDOW_PREFIX_MAX_CELLS = 4 * 1024 ** 2
+WINDOW_PREFETCH = 10
+# Windows start every 1 / WINDOW_STEPS of their size
+WINDOW_STEPS = 5
+# Levels of detail of graphs with many edges: the edges kept per node by 'Top', the significance level of the
+# disparity filter of 'Backbone' and the number of elements (nodes and edges) sent by 'Budget'
+DETAIL_LEVELS = ['All', 'Top', 'Backbone', 'Budget']
+DETAIL_TOP_EDGES = 3
+DETAIL_BACKBONE_ALPHA = 0.05
+DETAIL_MAX_ELEMENTS = 1000
 
 events_file = 'Events.csv'
 entities_file = 'EntityAttributes.csv'
 teams_file = 'SequenceAttributes.csv'
 variable_separation_file = 'Variables.csv'
 
-def load_dataset(group_by, dataset_name, node_type, edge_type, team, meeting, colour_type, colour_source, normalise, show_stats):
-    events, entities, teams, behaviours, participants, meetings = read_files(dataset_name)
-    if group_by != 'Teams':
-        teams = read_teams_from_file(dataset_name, group_by, team)
-    if node_type == 'Behaviours':
-        node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, leader, node_stats = get_behaviour_node_data(group_by, events, teams, team, meeting, participants, normalise, show_stats)
-        edge_data, min_weight, max_weight, weight_bins, edge_size_map, edge_stats = get_behaviour_edge_data(group_by, edge_type, teams, events, team, meeting, normalise, show_stats)
-    else:
-        node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, entity_list, leader, node_stats = get_participant_node_data(events, entities, team, meeting, participants, normalise)
-        edge_data, min_weight, max_weight, weight_bins, edge_size_map, edge_stats = get_participant_edge_data(edge_type, events, team, meeting, entity_list, normalise)
-    colors = get_colors(node_names, behaviours, colour_type)
-    selector_node_classes, selector_edge_classes = get_selector_classes(node_names, behaviours, colors, node_size_map, edge_size_map, colour_type)
-    node_data, nodes = get_nodes(node_names, acronyms, freq, sizes, node_type, leader, colour_type, node_stats)
-    if node_type == 'Behaviours':
-        edges = get_behaviour_edges(edge_data, colour_source, edge_stats)
-    else:
-        edges = get_participant_edges(edge_data, colour_type, colour_source)
-    return teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_stats, edge_stats, node_size_map
+# Parsed datasets shared by every callback in the process
+dataset_cache = DatasetCache(DATASET_CACHE_MAX_BYTES)
+
+def load_dataset(group_by, dataset_name, node_type, edge_type, team, meeting, colour_type, colour_source, normalise, split_sequences=False, order=1, compare='', detail='All'):
+    # Behaviour graphs of order k > 1 have runs of k behaviours as nodes, see get_kgram_node_data.
+    # Significance graphs (edge_type 'Significance') are of order 1, see get_significance_edge_data. With compare (a
+    # group of group_by), behaviour graphs show the difference between the group team and the group compare, see
+    # get_difference_edge_data. detail (one of DETAIL_LEVELS) prunes the edges, see get_detail_edges
+    # Stats are not part of the graph, they are computed when asked for, see get_stats_counts
+    # Each stage is measured as a span (see metrics.py)
+    with span('load_dataset', dataset=dataset_name, node_type=node_type) as current:
+        with span('load_dataset.read_files'):
+            # Behaviour graphs only need the cube, the events are read for participant graphs
+            cube = read_cube(dataset_name)
+            entities, participants = read_entities(dataset_name)
+            teams, behaviours, meetings = get_dataset_lists(cube)
+            if node_type != 'Behaviours':
+                events = read_files(dataset_name)[0]
+            if group_by != 'Teams':
+                teams = read_teams_from_file(dataset_name, group_by, team)
+        node_colours = None
+        if node_type == 'Behaviours' and compare != '':
+            compare_teams = read_teams_from_file(dataset_name, group_by, compare)
+            with span('load_dataset.node_data'):
+                node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, leader = get_behaviour_node_data(group_by, cube, sorted(set(teams + compare_teams)), team, meeting, participants, normalise)
+            with span('load_dataset.edge_data'):
+                edge_data, min_weight, max_weight, weight_bins, edge_size_map = get_difference_edge_data(dataset_name, cube, read_behaviour_stream(dataset_name), teams, compare_teams, meeting, edge_type)
+        elif node_type == 'Behaviours' and edge_type == 'Significance':
+            with span('load_dataset.node_data'):
+                node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, leader = get_behaviour_node_data(group_by, cube, teams, team, meeting, participants, normalise)
+            with span('load_dataset.edge_data'):
+                edge_data, min_weight, max_weight, weight_bins, edge_size_map = get_significance_edge_data(group_by, dataset_name, teams, cube, read_behaviour_stream(dataset_name), team, meeting)
+        elif node_type == 'Behaviours' and order > 1:
+            stream = read_behaviour_stream(dataset_name)
+            with span('load_dataset.node_data'):
+                node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, leader, node_colours = get_kgram_node_data(group_by, cube, stream, teams, team, meeting, participants, normalise, order)
+            with span('load_dataset.edge_data'):
+                edge_data, min_weight, max_weight, weight_bins, edge_size_map = get_kgram_edge_data(group_by, edge_type, teams, cube, stream, team, meeting, normalise, order)
+        elif node_type == 'Behaviours':
+            with span('load_dataset.node_data'):
+                node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, leader = get_behaviour_node_data(group_by, cube, teams, team, meeting, participants, normalise)
+            with span('load_dataset.edge_data'):
+                edge_data, min_weight, max_weight, weight_bins, edge_size_map = get_behaviour_edge_data(group_by, edge_type, teams, cube, team, meeting, normalise, split_sequences)
+        else:
+            with span('load_dataset.node_data'):
+                node_names, acronyms, acronyms_dict, freq, sizes, node_size_map, entity_list, leader = get_participant_node_data(events, entities, team, meeting, participants, normalise)
+            with span('load_dataset.edge_data'):
+                edge_data, min_weight, max_weight, weight_bins, edge_size_map = get_participant_edge_data(edge_type, cube, team, meeting, entity_list, normalise, split_sequences)
+        if detail != 'All':
+            with span('load_dataset.detail'):
+                edge_data = edge_data.take(get_detail_edges(edge_data, detail, len(node_names)))
+        with span('load_dataset.stylesheet'):
+            colors = get_colors(node_names, behaviours, colour_type)
+            selector_node_classes, selector_edge_classes = get_selector_classes(node_names, behaviours, colors, node_size_map, edge_size_map, colour_type)
+            if edge_data.intervals is not None:
+                selector_edge_classes += get_difference_selector_classes()
+        with span('load_dataset.elements'):
+            node_data, nodes = get_nodes(node_names, acronyms, freq, sizes, node_type, leader, colour_type, node_colours, edge_data)
+            edges = get_edges(edge_data, node_type, colour_type, colour_source)
+        current.set(nodes=len(nodes), edges=len(edges), selectors=len(selector_node_classes) + len(selector_edge_classes))
+    return teams, meetings, node_data, edge_data, nodes, edges, selector_node_classes, selector_edge_classes, min_weight, max_weight, weight_bins, leader, node_names, behaviours, node_size_map
+
+def preload_datasets(dataset_names):
+    # Parse the datasets, build their cubes and read their Variables.csv, so they are cached before worker processes
+    # are forked from this one. Returns the names of the datasets that were loaded (those with files on disk)
+    loaded = []
+    for dataset_name in dataset_names:
+        try:
+            read_files(dataset_name)
+            read_cube(dataset_name)
+            read_variables(dataset_name)
+        except FileNotFoundError:
+            continue
+        loaded.append(dataset_name)
+    return loaded
 
 def read_files(dataset_name):
-    events = pd.read_csv(dataset_name + '/' + events_file)
-    entities = pd.read_csv(dataset_name + '/' + entities_file)
-    # Keep only sequenceId, event and entityId columns in events
-    events = events[['sequenceId', 'event', 'entityId']]
-    # Remove event Online, if present
-    events = events[events['event'] != 'Online']
-    # Keep only entityId, ParameterKey and ParameterValue columns in entities
-    entities = entities[['entityId', 'ParameterKey', 'ParameterValue']]
+    # Parse the dataset only if it is not cached or its files changed on disk. The cached DataFrames are shared, so
+    # they must not be modified in place
+    paths = get_table_paths(dataset_name + '/' + events_file) + get_table_paths(dataset_name + '/' + entities_file)
+    events, entities, teams, behaviours, participants, meetings = dataset_cache.get(dataset_name, paths, lambda: parse_files(dataset_name), get_dataset_size)
+    return events, entities, teams.copy(), behaviours, participants, meetings.copy()
+
+def read_cube(dataset_name):
+    # Per-sequence node and transition counts of the dataset (see cube.py), built once and cached with the dataset.
+    # The cube also has the signature of the Events.csv it was built from (source) and the meetings appended since
+    # the builder was first saved (appends, see append.py)
+    events_path = dataset_name + '/' + events_file
+    paths = get_table_paths(events_path) + [get_cube_builder_path(events_path)]
+    return dataset_cache.get(dataset_name + '/cube', paths, lambda: load_cube(dataset_name), get_cube_size)
+
+def load_cube(dataset_name):
+    # From the saved cube builder if it was made from the current Events.csv, otherwise the events are counted again.
+    # Builders are only saved by storage.py and append.py, never while serving requests
+    builder = read_cube_builder(dataset_name + '/' + events_file)
+    if builder is None:
+        builder = build_cube_builder(dataset_name)
+    cube = get_builder_cube(builder)
+    cube['source'] = builder['source']
+    cube['base_source'] = builder['base_source']
+    cube['appends'] = builder['appends']
+    return cube
+
+def build_cube_builder(dataset_name):
+    # Cube builder of the whole Events.csv. Events are read in chunks of EVENTS_CHUNK_SIZE rows, so they are never
+    # all in memory
+    source = get_source_signature(dataset_name + '/' + events_file)
+    builder = new_cube_builder()
+    for chunk in read_table_chunks(dataset_name + '/' + events_file, ['sequenceId', 'event', 'entityId'], EVENTS_CHUNK_SIZE):
+        add_events_chunk(builder, drop_events(chunk))
+    builder['source'] = source
+    builder['base_source'] = source
+    builder['appends'] = []
+    return builder
+
+def save_cube_builder(dataset_name):
+    # Count the events of the dataset and save the cube builder, so the app and append.py start from it
+    builder = build_cube_builder(dataset_name)
+    compact_cube_builder(builder)
+    write_cube_builder(dataset_name + '/' + events_file, builder)
+
+def get_appends_since(cube, source):
+    # Teams and meetings appended to the dataset since its Events.csv had signature source, as a list of
+    # {'source', 'teams', 'meetings', 'behaviours'}. None if source is not a version the cube knows of
+    if source == cube['base_source']:
+        return cube['appends']
+    for i, append in enumerate(cube['appends']):
+        if append['source'] == source:
+            return cube['appends'][i + 1:]
+    return None
+
+def is_view_affected(view, appends):
+    # Whether the graph of view (the options of load_dataset, as a dictionary) may have changed with appends
+    if appends is None:
+        return True
+    if view['group_by'] != 'Teams':
+        teams = set(read_teams_from_file(view['database'], view['group_by'], view['team']))
+        if view.get('compare', '') != '':
+            teams |= set(read_teams_from_file(view['database'], view['group_by'], view['compare']))
+    elif view['team'] != 'All':
+        teams = {view['team']}
+    else:
+        teams = None
+    for append in appends:
+        # New behaviours change the colours of every graph
+        if len(append['behaviours']) > 0:
+            return True
+        if (teams is None or len(teams & set(append['teams'])) > 0) and (view['meeting'] == 'All' or view['meeting'] in append['meetings']):
+            return True
+    return False
+
+def get_cube_size(cube):
+    return sum(value.nbytes for value in cube.values() if isinstance(value, np.ndarray))
+
+def get_dataset_size(dataset):
+    # Estimate the memory used by the DataFrames of a parsed dataset
+    size = 0
+    for value in dataset:
+        if isinstance(value, pd.DataFrame):
+            size += int(value.memory_usage(deep=True).sum())
+    return size
+
+def read_behaviour_stream(dataset_name):
+    # Sequence and event codes (as in the cube) of the rows of the dataset that are not 'Break', grouped by sequence,
+    # for k-gram graphs (see get_kgram_counts). The stream also has the signature of the Events.csv it was made from
+    # and the number of rows of its converted copy (None if it was made from the CSV file), so that after an append
+    # (see append.py) only the new rows are read
+    paths = get_table_paths(dataset_name + '/' + events_file) + get_table_paths(dataset_name + '/' + entities_file)
+    name = dataset_name + '/stream'
+    return dataset_cache.get(name, paths, lambda: parse_behaviour_stream(dataset_name, dataset_cache.peek(name)), get_stream_size)
+
+def parse_behaviour_stream(dataset_name, previous=None):
+    events_path = dataset_name + '/' + events_file
+    cube = read_cube(dataset_name)
+    if previous is not None:
+        stream = extend_behaviour_stream(events_path, cube, previous)
+        if stream is not None:
+            return stream
+    source = get_source_signature(events_path)
+    rows = read_metadata(get_columnar_path(events_path))['rows'] if has_columnar(events_path) else None
+    sequence_codes, event_codes = get_stream_codes(read_files(dataset_name)[0], cube)
+    return sequence_codes, event_codes, source, rows
+
+def extend_behaviour_stream(events_path, cube, stream):
+    # stream with the rows appended to the converted Events since it was made, or None if the events changed in
+    # another way. Appended sequences are new, so their codes come after those of stream
+    sequence_codes, event_codes, source, rows = stream
+    if rows is None or not has_columnar(events_path) or get_appends_since(cube, source) is None:
+        return None
+    path = get_columnar_path(events_path)
+    metadata = read_metadata(path)
+    if metadata['rows'] < rows:
+        return None
+    table = read_columnar_codes(path, ['sequenceId', 'event'], metadata)
+    events = decode_columnar({name: values[rows:] for name, values in table.items()}, metadata)
+    new_sequence_codes, new_event_codes = get_stream_codes(events, cube)
+    return np.concatenate([sequence_codes, new_sequence_codes]), np.concatenate([event_codes, new_event_codes]), metadata['source'], metadata['rows']
+
+def get_stream_codes(events, cube):
+    events = events[events['event'] != 'Break']
+    sequence_codes = pd.Index(cube['sequence_ids']).get_indexer(events['sequenceId'])
+    event_codes = pd.Index(cube['event_names']).get_indexer(events['event'])
+    order = np.argsort(sequence_codes, kind='stable')
+    return sequence_codes[order], event_codes[order]
+
+def get_stream_size(stream):
+    return stream[0].nbytes + stream[1].nbytes
+
+def parse_files(dataset_name):
+    # Keep only sequenceId, event and entityId columns in events. Converted copies are read instead of the CSV files
+    # when present (see storage.py)
+    events = read_table(dataset_name + '/' + events_file, ['sequenceId', 'event', 'entityId'])
+    # Remove event Online, if present. Converted copies have none (see storage.drop_events), so their memory mapped
+    # columns are not copied
+    events = drop_events(events)
+    # Split sequenceId into meeting and team columns once, so filters do not need to split strings
+    events = add_sequence_columns(events)
+    entities, participants = read_entities(dataset_name)
 
     # Get unique teams
-    teams = events['sequenceId'].unique()
-    teams = [team.split('_')[1] for team in teams]
-    teams = list(set(teams))
-    teams.sort()
+    teams = events['team'].cat.categories.tolist()
     # Add 'All' to teams at the beginning
     teams.insert(0, 'All')
 
     # Get unique behaviours
-    behaviours = events['event'].unique()
+    behaviours = np.asarray(events['event'].unique(), dtype=object)
     behaviours = behaviours[behaviours != 'Break']
 
+    # Get meetings
+    meetings = events['meeting'].cat.categories.tolist()
+    meetings.append('All')
+
+    return events, entities, teams, behaviours, participants, meetings
+
+def read_entities(dataset_name):
+    # Entities and participants of the dataset, which do not need its events
+    paths = get_table_paths(dataset_name + '/' + entities_file)
+    return dataset_cache.get(dataset_name + '/entities', paths, lambda: parse_entities(dataset_name), get_dataset_size)
+
+def parse_entities(dataset_name):
+    entities_file_df = read_table(dataset_name + '/' + entities_file, ['sequenceId', 'entityId', 'ParameterKey', 'ParameterValue'])
+    # Keep only entityId, ParameterKey and ParameterValue columns in entities
+    entities = entities_file_df[['entityId', 'ParameterKey', 'ParameterValue']]
+
     # Participants
     if '2017' in dataset_name:
-        entities_file_df = pd.read_csv(dataset_name + '/' + entities_file)
         # Keep only rows where ParameterKey is 'name' or 'leader_meeting'
         participants = entities_file_df[entities_file_df['ParameterKey'].isin(['name', 'leader_meeting'])]
         # Create a dictionary with entityIds as keys and name and leader_meeting as values
@@ -81,66 +318,89 @@ def read_files(dataset_name):
     else:
         participants = []
 
-    # Get meetings
-    meetings = events['sequenceId'].unique()
-    meetings = [meeting.split('_')[0] for meeting in meetings]
-    meetings = list(set(meetings))
-    meetings.sort()
-    meetings.append('All')
 
-    return events, entities, teams, behaviours, participants, meetings
+    return entities, participants
+
+def get_dataset_lists(cube):
+    # Teams ('All' first), behaviours and meetings ('All' last) of a dataset as parse_files gives them, from its cube
+    teams = ['All'] + cube['team_ids'].tolist()
+    behaviours = cube['event_names'][cube['event_names'] != 'Break']
+    meetings = np.unique(cube['sequence_meetings']).tolist() + ['All']
+    return teams, behaviours, meetings
+
+def add_sequence_columns(events):
+    # Add categorical meeting and team columns and an integer sequence column (in order of first appearance) to
+    # events. sequenceId has the form meeting_team, so only the unique sequenceIds are split
+    sequence_codes, sequence_ids = pd.factorize(events['sequenceId'])
+    sequence_parts = pd.Series(sequence_ids).str.split('_')
+    sequence_meetings = pd.Categorical(sequence_parts.str[0])
+    sequence_teams = pd.Categorical(sequence_parts.str[1])
+    return events.assign(
+        sequence=sequence_codes.astype(np.int32),
+        meeting=pd.Categorical.from_codes(sequence_meetings.codes[sequence_codes], sequence_meetings.categories),
+        team=pd.Categorical.from_codes(sequence_teams.codes[sequence_codes], sequence_teams.categories)
+    )
 
 def read_teams_from_file(database, variable, group_name):
-    with open(database + '/' + variable_separation_file, 'r') as file:
-        lines = file.readlines()
-    is_variable = False
-    is_group = False
-    teams = []
-    for line in lines:
-        if 'Attribute' in line:
-            if variable in line:
-                is_variable = True
-            else:
-                is_variable = False
-            continue
-        if is_variable:
-            if group_name in line:
-                is_group = True
-                continue
-        if is_group:
-            teams = line.split(',')
-            teams = [team for team in teams if team != 'NA\n']
-            teams = [team.split('_')[1].strip() for team in teams]
-            break
-    return teams
+    # Teams in group_name of variable, sorted. Empty if the variable or group is not in Variables.csv
+    return sorted(read_variables(database).get(variable, {}).get(group_name, frozenset()))
+
+def read_variables(database):
+    # Index of Variables.csv as {attribute: {group: frozenset(teams)}}, parsed once and cached with the dataset
+    path = database + '/' + variable_separation_file
+    return dataset_cache.get(path, [path], lambda: parse_variables_file(path), get_variables_size)
+
+def get_variables_size(variables):
+    # Bytes of the team names of every group
+    return sum(sys.getsizeof(team) for groups in variables.values() for teams in groups.values() for team in teams)
+
+def parse_variables_file(path):
+    # Variables.csv has an 'Attribute:<name>' line for each attribute, followed by an 'ids:<group>' line and a line
+    # of comma separated sequenceIds (meeting_team) for each group. Attributes and groups that appear more than once
+    # are merged
+    variables = {}
+    groups = None
+    group_name = None
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('Attribute:'):
+                groups = variables.setdefault(line[len('Attribute:'):].strip(), {})
+                group_name = None
+            elif line.startswith('ids:') and groups is not None:
+                group_name = line[len('ids:'):].strip()
+                groups.setdefault(group_name, frozenset())
+            elif line != '' and group_name is not None:
+                # Keep the team part of each sequenceId, skipping NA
+                teams = [sequence.strip().split('_') for sequence in line.split(',')]
+                teams = [parts[1] for parts in teams if len(parts) > 1]
+                groups[group_name] = groups[group_name] | frozenset(teams)
+                group_name = None
+    return variables
+
+def get_behaviour_node_mask(group_by, cube, teams, team, meeting):
+    # Sequences whose behaviours are the nodes of a behaviour graph. Without a team, nodes are of every meeting
+    if group_by == 'Teams':
+        if team != 'All':
+            # Keep only sequences of the team and the selected meeting
+            return get_sequence_mask(cube, [team], meeting)
+        return get_sequence_mask(cube)
+    # Keep only sequences of the teams in the group and the selected meeting
+    return get_sequence_mask(cube, teams, meeting)
 
-def get_behaviour_node_data(group_by, events, team_list, team, meeting, participants, normalise, show_stats):
+def get_behaviour_node_data(group_by, cube, team_list, team, meeting, participants, normalise):
     # Remove All from teams (if present)
     teams = team_list.copy()
     if 'All' in teams:
         teams.remove('All')
-    leader = ''
-    if group_by == 'Teams':
-        if team != 'All':
-            # Keep only rows where sequenceId contains team
-            events = events[events['sequenceId'].str.split('_').str[1] == team]
-            # Keep only rows where meeting is equal to the selected meeting
-            if meeting != 'All':
-                events = events[events['sequenceId'].str.split('_').str[0] == meeting]
-                # Get participants in the selected team
-                leader = participants[(participants['teamid'] == team) & (participants['leader_meeting'] == int(meeting))]['nameinfile']
-                if len(leader) > 0:
-                    leader = "Leader: " + ",".join(leader)
-    else:
-        # Keep only rows where sequenceId contains team
-        events = events[events['sequenceId'].str.split('_').str[1].isin(teams)]
-        if meeting != 'All':
-            # Keep only rows where meeting is equal to the selected meeting
-            events = events[events['sequenceId'].str.split('_').str[0] == meeting]
+    sequence_mask = get_behaviour_node_mask(group_by, cube, teams, team, meeting)
+    leader = get_leader(group_by, participants, team, meeting)
 
-    # Get node names
-    node_names = events['event'].unique()
-    node_names = node_names[node_names != 'Break']
+    # Get node names, in order of first appearance
+    counts, first, n_events = get_node_counts(cube, sequence_mask)
+    node_codes = np.flatnonzero((counts > 0) & (cube['event_names'] != 'Break'))
+    node_codes = node_codes[np.argsort(first[node_codes], kind='stable')]
+    node_names = cube['event_names'][node_codes]
 
     # Get acronyms
     acronyms = [event.replace('_', ' ') for event in node_names]
@@ -151,93 +411,21 @@ def get_behaviour_node_data(group_by, events, team_list, team, meeting, particip
     # Create a dictionary with node names as keys and acronyms as values
     acronyms_dict = dict(zip(node_names, acronyms))
 
-    # Get additional stats for each node if team and/or meeting = 'All'
-    stats = {}
-    for name in node_names:
-        stats[name] = ''
-    if show_stats:
-        if team == 'All':
-            team_freqs = {}
-            for t in teams:
-                team_events = events[events['sequenceId'].str.split('_').str[1] == t]
-                team_freq = team_events['event'].value_counts()
-                # If one node_name is not present in team_freq, add it with value 0
-                for name in node_names:
-                    if name not in team_freq:
-                        team_freq[name] = 0
-                team_freq = team_freq[node_names]
-                team_freqs[t] = team_freq
-            # Get the team with the highest frequency of each behaviour
-            for name in node_names:
-                max_freq = 0
-                max_team = ''
-                min_freq = 1000000
-                min_team = ''
-                sum = 0
-                for t in teams:
-                    if team_freqs[t][name] > max_freq:
-                        max_freq = team_freqs[t][name]
-                        max_team = t
-                    if team_freqs[t][name] < min_freq:
-                        min_freq = team_freqs[t][name]
-                        min_team = t
-                    sum += team_freqs[t][name]
-                stats[name] += 'Most frequent team: ' + max_team + ' (' + str(max_freq) + ')'
-                stats[name] += ' Least frequent team: ' + min_team + ' (' + str(min_freq) + ')'
-                # Get average frequency
-                stats[name] += ' Average frequency: ' + str(round(sum / len(teams),2))
-        if meeting == 'All':
-            # Get unique sequenceIds
-            sequenceIds = events['sequenceId'].unique()
-            # Get frequency of each behaviour in each meeting
-            meeting_freqs = {}
-            for s in sequenceIds:
-                meeting_events = events[events['sequenceId'] == s]
-                meeting_freq = meeting_events['event'].value_counts()
-                # If one node_name is not present in meeting_freq, add it with value 0
-                for name in node_names:
-                    if name not in meeting_freq:
-                        meeting_freq[name] = 0
-                meeting_freq = meeting_freq[node_names]
-                meeting_freqs[s] = meeting_freq
-            # Get the meeting with the highest frequency of each behaviour
-            for name in node_names:
-                max_freq = 0
-                max_meeting = ''
-                min_freq = 1000000
-                min_meeting = ''
-                sum = 0
-                for m in sequenceIds:
-                    if meeting_freqs[m][name] > max_freq:
-                        max_freq = meeting_freqs[m][name]
-                        max_meeting = m
-                    if meeting_freqs[m][name] < min_freq:
-                        min_freq = meeting_freqs[m][name]
-                        min_meeting = m
-                    sum += meeting_freqs[m][name]
-                stats[name] += ' Most frequent meeting: ' + max_meeting + ' (' + str(max_freq) + ')'
-                stats[name] += ' Least frequent meeting: ' + min_meeting + ' (' + str(min_freq) + ')'
-
-    # Get frequency of events
-    freq = events['event'].value_counts()
+    # Get frequency of events, in the same order as node_names
+    freq = pd.Series(counts[node_codes], index=node_names)
     # If normalise is True, divide by the number of events and multiply by NORMALISE_MULTIPLIER
     if normalise:
-        freq = (freq / len(events)) * NORMALISE_MULTIPLIER
-    # If 'Break' is in freq, remove it
-    if 'Break' in freq:
-        freq = freq.drop('Break')
-    # Sort freq in the same order as node_names
-    freq = freq[node_names]
+        freq = (freq / n_events) * NORMALISE_MULTIPLIER
     sizes = freq.values / 2.0
     sizes = [max(250, size) for size in sizes]
     # Size map
     size_map = "mapData(size," + str(min(sizes)) + "," + str(max(sizes)) + "," + str(NODE_MAP_MIN_SIZE) + "," + str(NODE_MAP_MAX_SIZE) + ")"
-    return node_names, acronyms, acronyms_dict, freq, sizes, size_map, leader, stats
+    return node_names, acronyms, acronyms_dict, freq, sizes, size_map, leader
 
 def get_participant_node_data(events, entities, team, meeting, participants_attributes, normalise):
     # Get entityIds of participants in the team.
     # Keep only rows where sequenceId split by '_' is equal to team
-    entityIds = events[events['sequenceId'].str.split('_').str[1] == team]['entityId'].unique()
+    entityIds = events[events['team'] == team]['entityId'].unique()
 
     # Remove -1 from entityIds
     entityIds = entityIds[entityIds != -1]
@@ -246,7 +434,7 @@ def get_participant_node_data(events, entities, team, meeting, participants_attr
     # Keep only rows where entityId is in entityIds
     entities = entities[entities['entityId'].isin(entityIds)]
     # Get names of participants
-    participants = entities['ParameterValue'].unique()
+    participants = np.asarray(entities['ParameterValue'].unique(), dtype=object)
 
     # Get node names
     node_names = participants
@@ -257,23 +445,14 @@ def get_participant_node_data(events, entities, team, meeting, participants_attr
     # Create a dictionary with node names as keys and acronyms as values
     acronyms_dict = dict(zip(node_names, acronyms))
 
-    # Get additional stats for each node if team and/or meeting = 'All'
-    stats = {}
-    for name in node_names:
-        stats[name] = ''
-
     # Get frequency of participants
     # Keep events where entityId is in entityIds
     events = events[events['entityId'].isin(entityIds)]
     # Keep meeting only
-    leader = ''
     if meeting != 'All':
-        events = events[events['sequenceId'].str.split('_').str[0] == meeting]
-        # Get participants in the selected team
-        leader = participants_attributes[(participants_attributes['teamid'] == team) & (participants_attributes['leader_meeting'] == int(meeting))][
-            'nameinfile']
-        if len(leader) > 0:
-            leader = "Leader: " + ",".join(leader)
+        events = events[events['meeting'] == meeting]
+    # Participant graphs are of one team
+    leader = get_leader('Teams', participants_attributes, team, meeting)
 
     freq = events['entityId'].value_counts()
     # If normalise is True, divide by the number of events and multiply by NORMALISE_MULTIPLIER
@@ -286,230 +465,444 @@ def get_participant_node_data(events, entities, team, meeting, participants_attr
     sizes = [max(250, size) for size in sizes]
     # Size map
     size_map = "mapData(size," + str(min(sizes)) + "," + str(max(sizes)) + "," + str(NODE_MAP_MIN_SIZE) + "," + str(NODE_MAP_MAX_SIZE) + ")"
-    return node_names, acronyms, acronyms_dict, freq, sizes, size_map, entities, leader, stats
-
-def get_behaviour_edge_data(group_by, edge_type, team_list, events, team, meeting, normalise, show_stats):
+    return node_names, acronyms, acronyms_dict, freq, sizes, size_map, entities, leader
+
+def select_group_rows(freqs, group_ids, groups):
+    # Arrange the rows of freqs in the order of groups (which may repeat). Groups missing from group_ids get zeros
+    freqs = np.vstack([freqs, np.zeros((1,) + freqs.shape[1:], dtype=freqs.dtype)])
+    return freqs[pd.Index(group_ids).get_indexer(groups)]
+
+def get_frequency_stats(freqs, groups, group_type, average):
+    # Describe the most and least frequent group of each column of freqs (groups x items). Ties go to the first group
+    # and the most frequent group is left empty if an item never appears
+    max_index = freqs.argmax(axis=0) if len(groups) > 0 else np.zeros(freqs.shape[1], dtype=int)
+    min_index = freqs.argmin(axis=0) if len(groups) > 0 else np.zeros(freqs.shape[1], dtype=int)
+    max_freqs = freqs.max(axis=0, initial=0)
+    min_freqs = freqs.min(axis=0, initial=1000000)
+    sums = freqs.sum(axis=0)
+    stats = []
+    for i in range(freqs.shape[1]):
+        max_group = groups[max_index[i]] if max_freqs[i] > 0 else ''
+        min_group = groups[min_index[i]] if min_freqs[i] < 1000000 else ''
+        text = 'Most frequent ' + group_type + ': ' + max_group + ' (' + str(max_freqs[i]) + ')'
+        text += ' Least frequent ' + group_type + ': ' + min_group + ' (' + str(min_freqs[i]) + ')'
+        if average:
+            # Get average frequency
+            text += ' Average frequency: ' + str(round(sums[i] / len(groups), 2))
+        stats.append(text)
+    return stats
+
+def get_stats_counts(group_by, dataset_name, team, meeting, compare=''):
+    # Frequencies the stats of a behaviour graph describe, computed when its stats are first asked for: of each
+    # behaviour and transition per team of the selection if team is 'All', and per sequence if meeting is 'All'. See
+    # get_node_stats and get_edge_stats
+    cube = read_cube(dataset_name)
+    teams = get_dataset_lists(cube)[0] if group_by == 'Teams' else read_teams_from_file(dataset_name, group_by, team)
+    if compare != '':
+        # Nodes of difference graphs are of both groups, see load_dataset
+        teams = sorted(set(teams + read_teams_from_file(dataset_name, group_by, compare)))
+    teams, edge_mask = get_selection(group_by, cube, teams, team, meeting)
+    node_mask = get_behaviour_node_mask(group_by, cube, teams, team, meeting)
+    counts = {'event_index': {name: code for code, name in enumerate(cube['event_names'].tolist())}, 'teams': None, 'sequences': None}
+    if team == 'All':
+        # Add up the frequencies of the sequences of each team and arrange the rows in the order of teams
+        counts['teams'] = teams
+        counts['team_nodes'] = select_group_rows(get_group_node_counts(cube, node_mask, cube['sequence_team_codes'], len(cube['team_ids'])), cube['team_ids'], teams)
+        counts['team_edges'] = select_group_rows(get_group_transition_counts(cube, edge_mask, cube['sequence_team_codes'], len(cube['team_ids'])), cube['team_ids'], teams)
+    if meeting == 'All':
+        # Frequencies of each selected sequence, in order of appearance. Only sequences with behaviours have transitions
+        sequences = np.flatnonzero(node_mask)
+        counts['sequences'] = cube['sequence_ids'][sequences]
+        counts['sequence_nodes'] = cube['node_counts'][sequences]
+        sequences = np.flatnonzero(edge_mask & (cube['behaviour_rows'] > 0))
+        sequences = sequences[np.argsort(cube['behaviour_sequence_first'][sequences], kind='stable')]
+        counts['edge_sequences'] = cube['sequence_ids'][sequences]
+        counts['sequence_edges'] = get_group_transition_counts(cube, edge_mask, np.arange(len(edge_mask)), len(edge_mask))[sequences]
+    return counts
+
+def get_node_stats(stats_counts, name):
+    # Stats text of the behaviour name: its most and least frequent team and meeting
+    code = stats_counts['event_index'][name]
+    text = ''
+    if stats_counts['teams'] is not None:
+        text += get_frequency_stats(stats_counts['team_nodes'][:, [code]], stats_counts['teams'], 'team', True)[0]
+    if stats_counts['sequences'] is not None:
+        text += ' ' + get_frequency_stats(stats_counts['sequence_nodes'][:, [code]], stats_counts['sequences'], 'meeting', False)[0]
+    return text
+
+def get_edge_stats(stats_counts, source, target):
+    # Stats text of the transition from behaviour source to behaviour target: its most and least frequent team and
+    # meeting
+    source_code = stats_counts['event_index'][source]
+    target_code = stats_counts['event_index'][target]
+    text = ''
+    if stats_counts['teams'] is not None:
+        text += get_frequency_stats(stats_counts['team_edges'][:, [source_code], target_code], stats_counts['teams'], 'team', True)[0]
+    if stats_counts['sequences'] is not None:
+        text += ' ' + get_frequency_stats(stats_counts['sequence_edges'][:, [source_code], target_code], stats_counts['edge_sequences'], 'meeting', False)[0]
+    return text
+
+def get_behaviour_edge_data(group_by, edge_type, team_list, cube, team, meeting, normalise, split_sequences=False):
     # Remove All from teams (if present)
     teams = team_list.copy()
     if 'All' in teams:
         teams.remove('All')
     if group_by == 'Teams':
         if team != 'All':
-            # Keep only rows where sequenceId contains team
-            events = events[events['sequenceId'].str.split('_').str[1] == team]
+            # Keep only sequences of the team and the selected meeting
+            sequence_mask = get_sequence_mask(cube, [team], meeting)
+        else:
+            # Keep only sequences of the selected meeting
+            sequence_mask = get_sequence_mask(cube, None, meeting)
     else:
-        # Keep only rows where sequenceId contains team
-        events = events[events['sequenceId'].str.split('_').str[1].isin(teams)]
-    if meeting != 'All':
-        # Keep only rows where meeting is equal to the selected meeting
-        events = events[events['sequenceId'].str.split('_').str[0] == meeting]
-    # Get edges
-    # From events, count the number of transitions between events. Save in a dictionary
-    edges = {}
-    # Remove rows with event 'Break'
-    events = events[events['event'] != 'Break']
-    # Regenerate index
-    events = events.reset_index(drop=True)
+        # Keep only sequences of the teams in the group and the selected meeting
+        sequence_mask = get_sequence_mask(cube, teams, meeting)
 
-    for i in range(1, len(events)):
-        if (events['event'][i - 1], events['event'][i]) in edges:
-            edges[(events['event'][i - 1], events['event'][i])] += 1
-        else:
-            edges[(events['event'][i - 1], events['event'][i])] = 1
+    # Get edges
+    # Add up the transition counts of the selected sequences ('Break' is not counted), in order of first appearance
+    counts, first, n_events = get_transition_counts(cube, sequence_mask, split_sequences)
+    source_codes, target_codes = np.nonzero(counts)
+    order = np.argsort(first[source_codes, target_codes], kind='stable')
+    source_codes = source_codes[order]
+    target_codes = target_codes[order]
+    event_names = cube['event_names']
+    values = counts[source_codes, target_codes]
+    source_sum = counts.sum(axis=1)
     if edge_type == 'Probability':
-        source_sum = {}
-        for key, value in edges.items():
-            source = key[0]
-            if source in source_sum:
-                source_sum[source] += value
-            else:
-                source_sum[source] = value
-
-        for key, value in edges.items():
-            source = key[0]
-            edges[key] = (value / source_sum[source] * 100)
-
-    # Get additional stats for each node if team and/or meeting = 'All'
-    stats = {}
-    for source,target in list(edges.keys()):
-        stats[source,target] = ''
-
-    if show_stats:
-        if team == 'All':
-            team_freqs = {}
-            for t in teams:
-                team_freq = {}
-                team_events = events[events['sequenceId'].str.split('_').str[1] == t]
-                # Regenerate index
-                team_events = team_events.reset_index(drop=True)
-                for i in range(1, len(team_events)):
-                    if (team_events['event'][i - 1], team_events['event'][i]) in team_freq:
-                        team_freq[(team_events['event'][i - 1], team_events['event'][i])] += 1
-                    else:
-                        team_freq[(team_events['event'][i - 1], team_events['event'][i])] = 1
-                # If one source, target pair is not present in team_freq, add it with value 0
-                for name in list(edges.keys()):
-                    if name not in team_freq:
-                        team_freq[name] = 0
-                team_freqs[t] = team_freq
-            # Get the team with the highest frequency of each behaviour
-            for source,target in list(edges.keys()):
-                max_freq = 0
-                max_team = ''
-                min_freq = 1000000
-                min_team = ''
-                sum = 0
-                for t in teams:
-                    if team_freqs[t][source,target] > max_freq:
-                        max_freq = team_freqs[t][source,target]
-                        max_team = t
-                    if team_freqs[t][source,target] < min_freq:
-                        min_freq = team_freqs[t][source,target]
-                        min_team = t
-                    sum += team_freqs[t][source,target]
-                stats[source,target] += 'Most frequent team: ' + max_team + ' (' + str(max_freq) + ')'
-                stats[source,target] += ' Least frequent team: ' + min_team + ' (' + str(min_freq) + ')'
-                # Get average frequency
-                stats[source,target] += ' Average frequency: ' + str(round(sum / len(teams),2))
-        if meeting == 'All':
-            # Get unique sequenceIds
-            sequenceIds = events['sequenceId'].unique()
-            # Get frequency of each behaviour in each meeting
-            meeting_freqs = {}
-            for s in sequenceIds:
-                meeting_freq = {}
-                meeting_events = events[events['sequenceId'] == s]
-                # Regenerate index
-                meeting_events = meeting_events.reset_index(drop=True)
-                for i in range(1, len(meeting_events)):
-                    if (meeting_events['event'][i - 1], meeting_events['event'][i]) in meeting_freq:
-                        meeting_freq[(meeting_events['event'][i - 1], meeting_events['event'][i])] += 1
-                    else:
-                        meeting_freq[(meeting_events['event'][i - 1], meeting_events['event'][i])] = 1
-                # If one node_name is not present in meeting_freq, add it with value 0
-                for name in list(edges.keys()):
-                    if name not in meeting_freq:
-                        meeting_freq[name] = 0
-                meeting_freqs[s] = meeting_freq
-            # Get the meeting with the highest frequency of each behaviour
-            for source,target in list(edges.keys()):
-                max_freq = 0
-                max_meeting = ''
-                min_freq = 1000000
-                min_meeting = ''
-                sum = 0
-                for m in sequenceIds:
-                    if meeting_freqs[m][source,target] > max_freq:
-                        max_freq = meeting_freqs[m][source,target]
-                        max_meeting = m
-                    if meeting_freqs[m][source,target] < min_freq:
-                        min_freq = meeting_freqs[m][source,target]
-                        min_meeting = m
-                    sum += meeting_freqs[m][source,target]
-                stats[source,target] += ' Most frequent meeting: ' + max_meeting + ' (' + str(max_freq) + ')'
-                stats[source,target] += ' Least frequent meeting: ' + min_meeting + ' (' + str(min_freq) + ')'
-
-    weights = list(edges.values())
-    min_weight = min(weights)
-    max_weight = max(weights)
+        values = values / source_sum[source_codes] * 100
+
+    min_weight = values.min().item()
+    max_weight = values.max().item()
 
     # Create 10 bins in the range of min_weight and max_weight
     weight_bins = np.linspace(min_weight, max_weight + 1, 20)
     # Create a dictionary with the bins as keys and the bins as values
     weight_bins = {str(int(bin)): str(int(bin)) for bin in weight_bins}
 
-    # Convert dictionary to a list of 4-tuples
+    # Weight and original weight of each edge
     if edge_type == 'Frequency':
+        original_weights = values
         if not normalise:
-            edge_data = [(key[0], key[1], "", log2(value), value) for key, value in edges.items()]
+            weights = np.log2(values)
             edge_size_map = "mapData(weight," + str(log2(min_weight)) + "," + str(log2(max_weight)) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
         else:
-            edge_data = [(key[0], key[1], "", (value / len(events)) * NORMALISE_MULTIPLIER, value) for key, value in edges.items()]
-            min_weight = (min_weight / len(events)) * NORMALISE_MULTIPLIER
-            max_weight = (max_weight / len(events)) * NORMALISE_MULTIPLIER
+            weights = (values / n_events) * NORMALISE_MULTIPLIER
+            min_weight = (min_weight / n_events) * NORMALISE_MULTIPLIER
+            max_weight = (max_weight / n_events) * NORMALISE_MULTIPLIER
             # Create 10 bins in the range of min_weight and max_weight
             weight_bins = np.linspace(min_weight, max_weight + 1, 20)
             # Create a dictionary with the bins as keys and the bins as values
             weight_bins = {str(int(bin)): str(int(bin)) for bin in weight_bins}
 
-            edge_size_map = "mapData(weight," + str((min_weight / len(events)) * NORMALISE_MULTIPLIER) + "," + str((max_weight / len(events)) * NORMALISE_MULTIPLIER) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+            edge_size_map = "mapData(weight," + str((min_weight / n_events) * NORMALISE_MULTIPLIER) + "," + str((max_weight / n_events) * NORMALISE_MULTIPLIER) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
     else:
-        edge_data = [(key[0], key[1], "", value, int(round((value / 100) * source_sum[key[0]]))) for key, value in edges.items()]
+        weights = values
+        original_weights = np.rint((values / 100) * source_sum[source_codes])
         edge_size_map = "mapData(weight," + str(min_weight) + "," + str(max_weight) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
-    return edge_data, min_weight, max_weight, weight_bins, edge_size_map, stats
+    edge_data = EdgeTable(event_names, [''], source_codes, target_codes, np.zeros(len(source_codes), dtype=np.int64), weights, original_weights)
+    return edge_data, min_weight, max_weight, weight_bins, edge_size_map
 
-def get_participant_edge_data(edge_type, events, team, meeting, entity_list, normalise):
-    # Get events rows where sequenceId contains team
-    events = events[events['sequenceId'].str.split('_').str[1] == team]
-    # Remove rows with entityId -1
-    events = events[events['entityId'] != -1]
-    # Keep meeting only
-    if meeting != 'All':
-        events = events[events['sequenceId'].str.split('_').str[0] == meeting]
-    # Regenerate index
-    events = events.reset_index(drop=True)
-    # Replace each entityId with the name of the participant
-    events['entityId'] = events['entityId'].replace(entity_list.set_index('entityId')['ParameterValue'])
+def get_participant_edge_data(edge_type, cube, team, meeting, entity_list, normalise, split_sequences=False):
+    # Keep only sequences of the team and the selected meeting
+    sequence_mask = get_sequence_mask(cube, [team], meeting)
 
     # Get edges
-    # From events, count the number of transitions between entityIds, including the event transition. Save in a dictionary (entityId1, entityId2, event): count
-    edges = {}
-    for i in range(1, len(events)):
-        if (events['entityId'][i - 1], events['entityId'][i], events['event'][i]) in edges:
-            edges[(events['entityId'][i - 1], events['entityId'][i], events['event'][i])] += 1
-        else:
-            edges[(events['entityId'][i - 1], events['entityId'][i], events['event'][i])] = 1
-
+    # Add up the transitions between entityIds of the selected sequences (rows with entityId -1 are not counted),
+    # including the event transition, with each entityId replaced by the name of the participant
+    entity_names = dict(zip(entity_list['entityId'], entity_list['ParameterValue']))
+    node_names, source_codes, target_codes, event_codes, values, n_events = get_participant_transitions(cube, sequence_mask, entity_names, split_sequences)
+    source_sum = np.bincount(source_codes, weights=values, minlength=len(node_names)).astype(np.int64)
     if edge_type == 'Probability':
-        source_sum = {}
-        for key, value in edges.items():
-            source = key[0]
-            if source in source_sum:
-                source_sum[source] += value
-            else:
-                source_sum[source] = value
+        values = values / source_sum[source_codes] * 100
+
+    min_weight = values.min().item()
+    max_weight = values.max().item()
 
-        for key, value in edges.items():
-            source = key[0]
-            edges[key] = (value / source_sum[source] * 100)
+    # Create 10 bins in the range of min_weight and max_weight
+    weight_bins = np.linspace(min_weight, max_weight, 20)
+    # Create a dictionary with the bins as keys and the bins as values
+    weight_bins = {str(int(bin)): str(int(bin)) for bin in weight_bins}
 
+    # Weight and original weight of each edge
+    if edge_type == 'Frequency':
+        original_weights = values
+        if not normalise:
+            weights = np.log2(values)
+            edge_size_map = "mapData(weight," + str(log2(min_weight)) + "," + str(log2(max_weight)) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+        else:
+            weights = (values / n_events) * NORMALISE_MULTIPLIER
+            edge_size_map = "mapData(weight," + str((min_weight / n_events) * NORMALISE_MULTIPLIER) + "," + str((max_weight / n_events) * NORMALISE_MULTIPLIER) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+            min_weight = (min_weight / n_events) * NORMALISE_MULTIPLIER
+            max_weight = (max_weight / n_events) * NORMALISE_MULTIPLIER
+            # Create 10 bins in the range of min_weight and max_weight
+            weight_bins = np.linspace(min_weight, max_weight + 1, 20)
+            # Create a dictionary with the bins as keys and the bins as values
+            weight_bins = {str(int(bin)): str(int(bin)) for bin in weight_bins}
+    else:
+        weights = values
+        original_weights = np.rint((values / 100) * source_sum[source_codes])
+        edge_size_map = "mapData(weight," + str(min_weight) + "," + str(max_weight) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+    edge_data = EdgeTable(node_names, cube['event_names'], source_codes, target_codes, event_codes, weights, original_weights)
+    return edge_data, min_weight, max_weight, weight_bins, edge_size_map
+
+def get_kgram_node_data(group_by, cube, stream, team_list, team, meeting, participants, normalise, order):
+    # Nodes of the graph of Markov order order of the selection: every run of order consecutive behaviours of a
+    # sequence, named after its behaviours ('Question_asking > Agreement') and coloured as its last one
+    teams, sequence_mask = get_selection(group_by, cube, team_list, team, meeting)
+    leader = get_leader(group_by, participants, team, meeting)
+    event_names = cube['event_names']
+    n_events = len(event_names)
+    keys, counts, n_rows = get_kgram_counts(stream[0], stream[1], sequence_mask, order, n_events)
+
+    # Events of each node, the first one in the first column
+    events = np.stack([keys // n_events ** (order - 1 - position) % n_events for position in range(order)], axis=1)
+    node_names = np.array([' > '.join(names) for names in event_names[events].tolist()], dtype=object)
+    behaviour_acronyms = np.array([''.join(word[0] for word in name.replace('_', ' ').split()).upper() for name in event_names.tolist()], dtype=object)
+    acronyms = ['-'.join(names) for names in behaviour_acronyms[events].tolist()]
+    acronyms_dict = dict(zip(node_names, acronyms))
 
-    # Get additional stats for each node if team and/or meeting = 'All'
-    stats = {}
-    for name in list(edges.keys()):
-        stats[name] = ''
-    # Remove third element from the key
-    stats = {(key[0], key[1]): value for key, value in stats.items()}
+    freq = pd.Series(counts, index=node_names)
+    # If normalise is True, divide by the number of events and multiply by NORMALISE_MULTIPLIER
+    if normalise:
+        freq = (freq / n_rows) * NORMALISE_MULTIPLIER
+    sizes = freq.values / 2.0
+    sizes = [max(250, size) for size in sizes]
+    # Size map
+    size_map = "mapData(size," + str(min(sizes)) + "," + str(max(sizes)) + "," + str(NODE_MAP_MIN_SIZE) + "," + str(NODE_MAP_MAX_SIZE) + ")"
+    return node_names, acronyms, acronyms_dict, freq, sizes, size_map, leader, event_names[events[:, -1]]
+
+def get_kgram_edge_data(group_by, edge_type, team_list, cube, stream, team, meeting, normalise, order):
+    # Edges of the graph of Markov order order of the selection: each run of order + 1 consecutive behaviours of a
+    # sequence goes from the node of its first order behaviours to the node of its last order, with its last behaviour
+    # as behaviour
+    teams, sequence_mask = get_selection(group_by, cube, team_list, team, meeting)
+    event_names = cube['event_names']
+    n_events = len(event_names)
+    keys, values, n_rows = get_kgram_counts(stream[0], stream[1], sequence_mask, order + 1, n_events)
+    # Nodes are numbered by their key, see get_kgram_node_data
+    node_keys, node_codes = np.unique(np.concatenate([keys // n_events, keys % n_events ** order]), return_inverse=True)
+    source_codes = node_codes[:len(keys)]
+    target_codes = node_codes[len(keys):]
+    node_names = np.array([' > '.join(names) for names in event_names[np.stack([node_keys // n_events ** (order - 1 - position) % n_events for position in range(order)], axis=1)].tolist()], dtype=object)
+    source_sum = np.bincount(source_codes, weights=values, minlength=len(node_keys)).astype(np.int64)
+    if edge_type == 'Probability':
+        values = values / source_sum[source_codes] * 100
 
-    weights = list(edges.values())
-    min_weight = min(weights)
-    max_weight = max(weights)
+    min_weight = values.min().item()
+    max_weight = values.max().item()
 
     # Create 10 bins in the range of min_weight and max_weight
-    weight_bins = np.linspace(min_weight, max_weight, 20)
+    weight_bins = np.linspace(min_weight, max_weight + 1, 20)
     # Create a dictionary with the bins as keys and the bins as values
     weight_bins = {str(int(bin)): str(int(bin)) for bin in weight_bins}
 
-    # Divide weights by max_weight
-    #weights = [weight / max_weight for weight in weights]
-    # Convert dictionary to a list of 5-tuples
+    # Weight and original weight of each edge
     if edge_type == 'Frequency':
+        original_weights = values
         if not normalise:
-            edge_data = [(key[0], key[1], key[2], log2(value), value) for key, value in edges.items()]
+            weights = np.log2(values)
             edge_size_map = "mapData(weight," + str(log2(min_weight)) + "," + str(log2(max_weight)) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
         else:
-            edge_data = [(key[0], key[1], key[2], (value / len(events)) * NORMALISE_MULTIPLIER, value) for key, value in edges.items()]
-            edge_size_map = "mapData(weight," + str((min_weight / len(events)) * NORMALISE_MULTIPLIER) + "," + str((max_weight / len(events)) * NORMALISE_MULTIPLIER) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
-            min_weight = (min_weight / len(events)) * NORMALISE_MULTIPLIER
-            max_weight = (max_weight / len(events)) * NORMALISE_MULTIPLIER
+            weights = (values / n_rows) * NORMALISE_MULTIPLIER
+            edge_size_map = "mapData(weight," + str((min_weight / n_rows) * NORMALISE_MULTIPLIER) + "," + str((max_weight / n_rows) * NORMALISE_MULTIPLIER) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+            min_weight = (min_weight / n_rows) * NORMALISE_MULTIPLIER
+            max_weight = (max_weight / n_rows) * NORMALISE_MULTIPLIER
             # Create 10 bins in the range of min_weight and max_weight
             weight_bins = np.linspace(min_weight, max_weight + 1, 20)
             # Create a dictionary with the bins as keys and the bins as values
             weight_bins = {str(int(bin)): str(int(bin)) for bin in weight_bins}
     else:
-        edge_data = [(key[0], key[1], key[2], value, int(round((value / 100) * source_sum[key[0]]))) for key, value in edges.items()]
+        weights = values
+        original_weights = np.rint((values / 100) * source_sum[source_codes])
         edge_size_map = "mapData(weight," + str(min_weight) + "," + str(max_weight) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
-    return edge_data, min_weight, max_weight, weight_bins, edge_size_map, stats
+    edge_data = EdgeTable(node_names, event_names, source_codes, target_codes, keys % n_events, weights, original_weights, node_keys % n_events)
+    return edge_data, min_weight, max_weight, weight_bins, edge_size_map
+
+def get_significance_edge_data(group_by, dataset_name, team_list, cube, stream, team, meeting):
+    # Edges of the transitions between consecutive behaviours of the same sequence, weighted by their adjusted
+    # residual (z-score), with the p-value of a permutation test (see significance.py). The weight slider selects
+    # edges by significance level instead of weight, see get_significance_levels
+    teams, sequence_mask = get_selection(group_by, cube, team_list, team, meeting)
+    rows = sequence_mask[stream[0]]
+    sequences = stream[0][rows]
+    events = stream[1][rows].astype(np.int64)
+    n_events = len(cube['event_names'])
+    counts = count_transitions(sequences, events, n_events)
+    residuals = get_adjusted_residuals(counts)
+    p_values = read_significance(dataset_name, 'p_values', [sequence_mask], lambda: get_permutation_p_values(sequences, events, n_events, counts))
+
+    # Edges in order of first appearance, as in get_behaviour_edge_data
+    same = sequences[:-1] == sequences[1:]
+    keys, first = np.unique(events[:-1][same] * n_events + events[1:][same], return_index=True)
+    keys = keys[np.argsort(first, kind='stable')]
+    source_codes = keys // n_events
+    target_codes = keys % n_events
+    event_names = cube['event_names']
+
+    weights = residuals[source_codes, target_codes]
+    edge_size_map = "mapData(weight," + str(weights.min()) + "," + str(weights.max()) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+    weight_bins = {str(level): label for level, label in enumerate(['All'] + ['p < ' + str(alpha) for alpha in SIGNIFICANCE_LEVELS])}
+    edge_data = EdgeTable(event_names, [''], source_codes, target_codes, np.zeros(len(keys), dtype=np.int64), weights, counts[source_codes, target_codes], p_values=p_values[source_codes, target_codes])
+    return edge_data, 0, len(SIGNIFICANCE_LEVELS), weight_bins, edge_size_map
+
+def read_significance(dataset_name, name, sequence_masks, compute):
+    # Result of compute (p-values or confidence intervals of the sequences selected by sequence_masks), computed once
+    # per selection and cached with the dataset, so that loading the graph of a selection again does not resample
+    events_path = dataset_name + '/' + events_file
+    paths = get_table_paths(events_path) + [get_cube_builder_path(events_path)]
+    selection = hashlib.sha256(b''.join(np.packbits(sequence_mask).tobytes() for sequence_mask in sequence_masks)).hexdigest()
+    return dataset_cache.get(dataset_name + '/' + name + '/' + selection, paths, compute, get_significance_size)
+
+def get_significance_size(value):
+    return sum(array.nbytes for array in value) if isinstance(value, tuple) else value.nbytes
+
+def get_difference_edge_data(dataset_name, cube, stream, teams_a, teams_b, meeting, edge_type):
+    # Edges of the difference between the transition rates (percentages of all the transitions, or of those leaving
+    # the same behaviour for Probability) of the sequences of teams_a and of teams_b, weighted by the difference.
+    # Transitions are between consecutive behaviours of the same sequence. Only edges whose bootstrap confidence
+    # interval (see significance.py) does not include 0 are kept. Edges are as wide as the size of the difference,
+    # its sign is their colour (see get_edge_classes)
+    event_names = cube['event_names']
+    n_events = len(event_names)
+    by_source = edge_type == 'Probability'
+    group_counts = []
+    group_masks = [get_sequence_mask(cube, teams, meeting) for teams in [teams_a, teams_b]]
+    for sequence_mask in group_masks:
+        rows = sequence_mask[stream[0]]
+        group_counts.append(count_sequence_transitions(stream[0][rows], stream[1][rows].astype(np.int64), n_events))
+    # Edges in order of first appearance in either group
+    rows = get_sequence_mask(cube, teams_a + teams_b, meeting)[stream[0]]
+    sequences = stream[0][rows]
+    events = stream[1][rows].astype(np.int64)
+    same = sequences[:-1] == sequences[1:]
+    keys, first = np.unique(events[:-1][same] * n_events + events[1:][same], return_index=True)
+    keys = keys[np.argsort(first, kind='stable')]
+
+    differences = (get_transition_rates(group_counts[0].sum(axis=0), n_events, by_source) - get_transition_rates(group_counts[1].sum(axis=0), n_events, by_source)) * NORMALISE_MULTIPLIER
+    if len(group_counts[0]) > 0 and len(group_counts[1]) > 0:
+        lower, upper = read_significance(dataset_name, 'intervals/' + edge_type, group_masks, lambda: get_bootstrap_intervals(group_counts[0], group_counts[1], n_events, by_source))
+        lower = lower.ravel() * NORMALISE_MULTIPLIER
+        upper = upper.ravel() * NORMALISE_MULTIPLIER
+        keys = keys[(lower[keys] > 0) | (upper[keys] < 0)]
+    else:
+        # Nothing to compare with
+        keys = keys[:0]
+        lower = upper = differences
+    source_codes = keys // n_events
+    target_codes = keys % n_events
+
+    weights = differences[keys]
+    original_weights = group_counts[0].sum(axis=0)[keys] + group_counts[1].sum(axis=0)[keys]
+    min_weight = weights.min().item() if len(keys) > 0 else 0
+    max_weight = weights.max().item() if len(keys) > 0 else 0
+    # 10 marks from min_weight to max_weight. Differences are percentages, often of less than 1, so marks are rounded
+    # to one decimal (adding 0.0 turns -0.0 into 0.0)
+    weight_bins = {str(bin): str(round(bin, 1) + 0.0) for bin in np.linspace(min_weight, max_weight, 10).tolist()}
+    max_magnitude = np.abs(weights).max().item() if len(keys) > 0 else 0
+    edge_size_map = "mapData(magnitude,0," + str(max_magnitude) + "," + str(EDGE_MAP_MIN_SIZE) + "," + str(EDGE_MAP_MAX_SIZE) + ")"
+    edge_data = EdgeTable(event_names, [''], source_codes, target_codes, np.zeros(len(keys), dtype=np.int64), weights, original_weights,
+                          intervals=np.stack([lower[keys], upper[keys]], axis=1))
+    return edge_data, min_weight, max_weight, weight_bins, edge_size_map
+
+def get_window_index(group_by, cube, stream, team_list, team, meeting):
+    # Cumulative transition counts of the selection, to count the transitions of any window of it (see
+    # get_window_counts). Windows go through the sequences of the selection in order, e.g. the meetings of a team
+    teams, sequence_mask = get_selection(group_by, cube, team_list, team, meeting)
+    n_events = len(cube['event_names'])
+    prefix, stride, n_transitions = get_transition_prefix_sums(stream[0], stream[1], sequence_mask, n_events, WINDOW_PREFIX_MAX_CELLS)
+    return {'prefix': prefix, 'stride': stride, 'transitions': n_transitions, 'events': n_events}
+
+def get_window_positions(window_index, size):
+    # Size of the windows (size rounded up to the stride of the counts) and the last and step of their start positions
+    stride = window_index['stride']
+    size = -(-size // stride) * stride
+    step = max(1, size // WINDOW_STEPS // stride) * stride
+    last = -(-max(0, window_index['transitions'] - size) // step) * step
+    return size, last, step
+
+def get_window_counts(window_index, start, size):
+    # Transition counts (source x target) of the transitions start to start + size - 1 of the selection. start and
+    # size are multiples of the stride of the counts
+    prefix = window_index['prefix']
+    stride = window_index['stride']
+    counts = prefix[min((start + size) // stride, len(prefix) - 1)] - prefix[min(start // stride, len(prefix) - 1)]
+    return counts.reshape(window_index['events'], window_index['events'])
+
+def get_window_edge_data(edge_data, counts, edge_type, normalise):
+    # Edges of edge_data (a behaviour graph of order 1) with transitions in the window of counts, weighted as in
+    # get_behaviour_edge_data with the counts of the window (normalised frequencies are percentages of the
+    # transitions of the window). Returns the edges and their indices in edge_data
+    indices = np.flatnonzero(counts[edge_data.sources, edge_data.targets] > 0)
+    sources = edge_data.sources[indices]
+    targets = edge_data.targets[indices]
+    values = counts[sources, targets]
+    original_weights = values
+    if edge_type == 'Probability':
+        weights = values / counts.sum(axis=1)[sources] * 100
+    elif normalise:
+        weights = values / counts.sum() * NORMALISE_MULTIPLIER
+    else:
+        weights = np.log2(values)
+    window_data = EdgeTable(edge_data.node_names, edge_data.behaviour_names, sources, targets, edge_data.behaviours[indices], weights, original_weights)
+    return window_data, indices
+
+def get_edge_disparities(edge_data):
+    # Disparity filter of every edge (the smaller of its values at its source and at its target): how likely a node
+    # with the same number of edges and total count would have an edge with this share of its count if counts were
+    # spread at random over its edges. Edges of nodes with one edge are 0 there
+    counts = edge_data.original_weights.astype(np.float64)
+    n_nodes = len(edge_data.node_names)
+    disparities = np.ones(len(edge_data))
+    for ends in [edge_data.sources, edge_data.targets]:
+        degrees = np.bincount(ends, minlength=n_nodes)[ends]
+        totals = np.bincount(ends, weights=counts, minlength=n_nodes)[ends]
+        shares = np.divide(counts, totals, out=np.zeros(len(counts)), where=totals > 0)
+        values = np.where(degrees > 1, (1 - shares) ** (degrees - 1), 0.0)
+        disparities = np.minimum(disparities, values)
+    return disparities
+
+def get_detail_edges(edge_data, detail, n_nodes):
+    # Indices (in order) of the edges of edge_data kept at level of detail detail: the DETAIL_TOP_EDGES strongest
+    # edges leaving each node ('Top'), the edges significant at DETAIL_BACKBONE_ALPHA for the disparity filter at
+    # either end ('Backbone'), or the most significant edges for the disparity filter (then the strongest) that fit
+    # in DETAIL_MAX_ELEMENTS with the n_nodes nodes ('Budget'). Difference graphs are by the size of the difference
+    strengths = edge_data.weights if edge_data.intervals is None else np.abs(edge_data.weights)
+    if detail == 'Top':
+        # Edges by source, strongest first, and their rank among the edges of their source
+        order = np.lexsort((-strengths, edge_data.sources))
+        sources = edge_data.sources[order]
+        starts = np.searchsorted(sources, sources, 'left')
+        return np.sort(order[np.arange(len(order)) - starts < DETAIL_TOP_EDGES])
+    disparities = get_edge_disparities(edge_data)
+    if detail == 'Backbone':
+        return np.flatnonzero(disparities < DETAIL_BACKBONE_ALPHA)
+    budget = max(0, DETAIL_MAX_ELEMENTS - n_nodes)
+    return np.sort(np.lexsort((-strengths, disparities))[:budget])
+
+def check_window_options(node_type, edge_type, order, compare):
+    # Temporal windows are of behaviour graphs of order 1, by Frequency or Probability
+    return node_type == 'Behaviours' and edge_type in ['Frequency', 'Probability'] and order == 1 and compare == ''
+
+def get_significance_levels(p_values):
+    # Number of levels of SIGNIFICANCE_LEVELS each p-value is below: 0 for not significant, 1 for p < 0.05 and so on
+    return (np.asarray(p_values)[:, None] < np.array(SIGNIFICANCE_LEVELS)).sum(axis=1)
+
+def get_selection(group_by, cube, team_list, team, meeting):
+    # Teams of the selection (without 'All') and mask of its sequences in the cube
+    teams = [name for name in team_list if name != 'All']
+    if group_by == 'Teams':
+        return teams, get_sequence_mask(cube, None if team == 'All' else [team], meeting)
+    return teams, get_sequence_mask(cube, teams, meeting)
+
+def get_leader(group_by, participants, team, meeting):
+    # 'Leader: <names>' of the team in the meeting, '' if there is none or the selection is not one team and meeting.
+    # Only datasets with leader_meeting attributes have participants
+    if group_by != 'Teams' or team == 'All' or meeting == 'All' or len(participants) == 0:
+        return ''
+    leader = participants[(participants['teamid'] == team) & (participants['leader_meeting'] == int(meeting))]['nameinfile']
+    if len(leader) > 0:
+        return "Leader: " + ",".join(leader)
+    return ''
 
 def get_colors(keys, behaviours, colour_type):
     # List of colors in rgb format
@@ -594,207 +987,142 @@ def get_selector_classes(node_names, behaviours, colors, node_size_map, edge_siz
         )
     return selector_node_classes, selector_edge_classes
 
-def get_nodes(node_names, acronyms, freq, sizes, node_type, leader, colour_type, stats):
-    # Create a list of random longitudes and latitudes with the size of the number of acronyms
-    longitudes = np.random.uniform(-180, 180, len(acronyms))
-    latitudes = np.random.uniform(-90, 90, len(acronyms))
-    # Create list of tuples with short name, label, long and lat
-    freq_values = freq.tolist()
-    node_data = list(zip(node_names, acronyms, freq_values, longitudes, latitudes, sizes))
-    if node_type == 'Behaviours':
-        nodes = [
-            {
-                'data': {'id': short, 'label': label, 'freq': str(freq), 'size': size, 'stats': stats[short]},
-                'position': {'x': 20 * lat, 'y': -20 * long},
-                'classes': "node" + short
+def get_difference_selector_classes():
+    # Colours of the edges of difference graphs by the sign of the difference, after the behaviour colours they replace
+    return [
+        {
+            'selector': '.' + name,
+            'style': {
+                'line-color': colour,
+                'target-arrow-color': colour
             }
-            for short, label, freq, long, lat, size in node_data
-        ]
-    else:
-        if colour_type == 'Behaviours':
-            nodes = [
-                {
-                    'data': {'id': short, 'label': label, 'freq': str(freq), 'size': size, 'stats': stats[short]},
-                    'position': {'x': 20 * lat, 'y': -20 * long},
-                    'classes': "nodeParticipant"
-                }
-                for short, label, freq, long, lat, size in node_data
-            ]
-        else:
-            nodes = [
-                {
-                    'data': {'id': short, 'label': label, 'freq': str(freq), 'size': size, 'stats': stats[short]},
-                    'position': {'x': 20 * lat, 'y': -20 * long},
-                    'classes': "node" + short
-                }
-                for short, label, freq, long, lat, size in node_data
-            ]
-        # Change leader node class
-        if leader != '':
-            for node in nodes:
-                if node['data']['id'] in leader:
-                    node['classes'] = "nodeLeader"
-    return node_data, nodes
+        }
+        for name, colour in DIFFERENCE_COLOURS.items()
+    ]
 
-def get_behaviour_edges(edge_data, colour_source, stats):
-    if colour_source == "Source":
-        edges = [
-            {
-                'data': {'source': source, 'target': target, 'behaviour':behaviour, 'weight': weight, 'original_weight': original_weight, 'stats': stats[source, target]},
-                'classes': "edge" + source
-            }
-            for source, target, behaviour, weight, original_weight in edge_data
-        ]
+def get_nodes(node_names, acronyms, freq, sizes, node_type, leader, colour_type, node_colours=None, edge_data=None):
+    # Nodes are placed by the layout of the graph of edge_data (see layout.py), at random if None. Positions are kept
+    # as the longitude and latitude that get_node_elements turns into y and x
+    if edge_data is None:
+        longitudes = np.random.uniform(-180, 180, len(acronyms))
+        latitudes = np.random.uniform(-90, 90, len(acronyms))
     else:
-        edges = [
-            {
-                'data': {'source': source, 'target': target, 'behaviour':behaviour, 'weight': weight, 'original_weight': original_weight, 'stats': stats[source, target]},
-                'classes': "edge" + target
-            }
-            for source, target, behaviour, weight, original_weight in edge_data
-        ]
-    return edges
+        codes = {name: code for code, name in enumerate(list(node_names))}
+        edge_codes = np.array([codes.get(name, -1) for name in edge_data.node_names.tolist()], dtype=np.int64)
+        sources = edge_codes[edge_data.sources]
+        targets = edge_codes[edge_data.targets]
+        kept = (sources >= 0) & (targets >= 0)
+        x, y = get_layout(list(node_names), sources[kept], targets[kept])
+        longitudes = -y / 20
+        latitudes = x / 20
+    # Table with short name, label, frequency, long, lat and size of each node
+    node_data = NodeTable(node_names, acronyms, freq.to_numpy(), longitudes, latitudes, sizes)
+    nodes = get_node_elements(node_data, get_node_classes(node_data, node_type, leader, colour_type, node_colours))
+    return node_data, nodes
 
-def get_participant_edges(edge_data, colour_type, colour_source):
-    if colour_type == 'Behaviours':
-        edges = [
-            {
-                'data': {'source': source, 'target': target, 'weight': weight, 'original_weight': original_weight, 'behaviour': behaviour, 'stats': ''},
-                'classes': "edge" + behaviour
-            }
-            for source, target, behaviour, weight, original_weight in edge_data
-        ]
+def get_node_classes(node_data, node_type, leader, colour_type, node_colours=None):
+    # Class of each node: its own colour, the colour in node_colours (the behaviour of each node of a k-gram graph)
+    # or the same one for every participant when colouring by behaviours. Leaders of participant graphs have their own
+    # class
+    if node_type != 'Behaviours' and colour_type == 'Behaviours':
+        classes = np.full(len(node_data), 'nodeParticipant', dtype=object)
+    elif node_colours is not None:
+        classes = 'node' + np.asarray(node_colours, dtype=object)
     else:
-        if colour_source == "Source":
-            edges = [
-                {
-                    'data': {'source': source, 'target': target, 'weight': weight, 'original_weight': original_weight, 'behaviour': behaviour, 'stats': ''},
-                    'classes': "edge" + source
-                }
-                for source, target, behaviour, weight, original_weight in edge_data
-            ]
-        else:
-            edges = [
-                {
-                    'data': {'source': source, 'target': target, 'weight': weight, 'original_weight': original_weight, 'behaviour': behaviour, 'stats': ''},
-                    'classes': "edge" + target
-                }
-                for source, target, behaviour, weight, original_weight in edge_data
-            ]
-    return edges
-
-def get_original_nodes(node_data, node_type, leader, colour_type, stats):
-    if node_type == 'Behaviours':
-        original_nodes = [
-            {
-                'data': {'id': short, 'label': label, 'freq': str(freq), 'size': size, 'stats': stats[short]},
-                'position': {'x': 20 * lat, 'y': -20 * long},
-                'classes': "node" + short
-            }
-            for short, label, freq, long, lat, size in node_data
-        ]
+        classes = 'node' + node_data.names
+    if node_type != 'Behaviours' and leader != '':
+        classes = np.where([name in leader for name in node_data.names.tolist()], 'nodeLeader', classes)
+    return classes
+
+def get_edges(edge_data, node_type, colour_type, colour_source):
+    # Cytoscape edges of edge_data
+    return get_edge_elements(edge_data, get_edge_classes(edge_data, node_type, colour_type, colour_source))
+
+def get_edge_classes(edge_data, node_type, colour_type, colour_source):
+    # Class of each edge: the colour of its behaviour (participant graphs coloured by behaviours), source or target.
+    # Edges of difference graphs also have the class of the sign of their difference
+    if node_type != 'Behaviours' and colour_type == 'Behaviours':
+        classes = 'edge' + edge_data.behaviour_names[edge_data.behaviours]
+    elif edge_data.node_behaviours is not None:
+        # Nodes of k-gram graphs have the colour of their last behaviour
+        codes = edge_data.sources if colour_source == "Source" else edge_data.targets
+        classes = 'edge' + edge_data.behaviour_names[edge_data.node_behaviours[codes]]
+    elif colour_source == "Source":
+        classes = 'edge' + edge_data.node_names[edge_data.sources]
     else:
-        if colour_type == 'Behaviours':
-            original_nodes = [
-                {
-                    'data': {'id': short, 'label': label, 'freq': str(freq), 'size': size, 'stats': stats[short]},
-                    'position': {'x': 20 * lat, 'y': -20 * long},
-                    'classes': "nodeParticipant"
-                }
-                for short, label, freq, long, lat, size in node_data
-            ]
-        else:
-            original_nodes = [
-                {
-                    'data': {'id': short, 'label': label, 'freq': str(freq), 'size': size, 'stats': stats[short]},
-                    'position': {'x': 20 * lat, 'y': -20 * long},
-                    'classes': "node" + short
-                }
-                for short, label, freq, long, lat, size in node_data
-            ]
-        # Change leader node class
-        if leader != '':
-            for node in original_nodes:
-                if node['data']['id'] in leader:
-                    node['classes'] = "nodeLeader"
-    return original_nodes
-
-def get_original_edges(edge_data, node_type, colour_type, colour_source, stats):
-    if node_type == 'Behaviours':
-        if colour_source == "Source":
-            original_edges = [
-                {
-                    'data': {'source': source, 'target': target, 'behaviour':behaviour, 'weight': weight, 'original_weight': original_weight, 'stats': stats[source, target]},
-                    'classes': "edge" + source
-                }
-                for source, target, behaviour, weight, original_weight in edge_data
-            ]
-        else:
-            original_edges = [
-                {
-                    'data': {'source': source, 'target': target,'behaviour':behaviour, 'weight': weight, 'original_weight': original_weight, 'stats': stats[source, target]},
-                    'classes': "edge" + target
-                }
-                for source, target, behaviour, weight, original_weight in edge_data
-            ]
+        classes = 'edge' + edge_data.node_names[edge_data.targets]
+    if edge_data.intervals is not None:
+        classes = classes + np.where(edge_data.weights < 0, ' edgeDecrease', ' edgeIncrease').astype(object)
+    return classes
+
+def get_weight_index(edge_data):
+    # Indices of edge_data sorted by weight, and the sorted weights, so that the edges in a weight range are a slice.
+    # Edges with p-values are sorted by significance level instead
+    weights = edge_data.weights if edge_data.p_values is None else get_significance_levels(edge_data.p_values)
+    order = np.argsort(weights, kind='stable')
+    return weights[order], order
+
+def get_edges_in_range(weight_index, min_weight, max_weight):
+    # Indices of the edges with min_weight <= weight <= max_weight
+    weights, order = weight_index
+    return order[np.searchsorted(weights, min_weight, 'left'):np.searchsorted(weights, max_weight, 'right')].tolist()
+
+def get_visible_changes(current, visible):
+    # Edge indices to remove from and add to the current ones to show visible
+    return sorted(current - visible), sorted(visible - current)
+
+def get_adjacency_index(edge_data):
+    # Edges leaving (outgoing) and entering (incoming) each node, as edge indices sorted by node code and the position
+    # where the edges of each node start
+    n_nodes = len(edge_data.node_names)
+    index = []
+    for codes in [edge_data.sources, edge_data.targets]:
+        order = np.argsort(codes, kind='stable')
+        index.append((order, np.searchsorted(codes[order], np.arange(n_nodes + 1))))
+    return index[0], index[1]
+
+def get_neighbourhood_edges(adjacency_index, edge_data, node_ids, hops, colour_source):
+    # Indices of the edges up to hops steps away from node_ids (the k-hop ego network). Edges are followed from source
+    # to target if colour_source is 'Source' and from target to source otherwise, so 1 hop gives the edges leaving
+    # (or entering) the nodes themselves
+    outgoing, incoming = adjacency_index
+    if colour_source == 'Source':
+        (order, starts), next_ends = outgoing, edge_data.targets
     else:
-        if colour_type == 'Behaviours':
-            original_edges = [
-                {
-                    'data': {'source': source, 'target': target, 'weight': weight, 'original_weight': original_weight, 'behaviour': behaviour, 'stats': stats[source, target]},
-                    'classes': "edge" + behaviour
-                }
-                for source, target, behaviour, weight, original_weight in edge_data
-            ]
-        else:
-            if colour_source == "Source":
-                original_edges = [
-                    {
-                        'data': {'source': source, 'target': target, 'weight': weight, 'original_weight': original_weight, 'behaviour': behaviour, 'stats': stats[source, target]},
-                        'classes': "edge" + source
-                    }
-                    for source, target, behaviour, weight, original_weight in edge_data
-                ]
-            else:
-                original_edges = [
-                    {
-                        'data': {'source': source, 'target': target, 'weight': weight, 'original_weight': original_weight, 'behaviour': behaviour, 'stats': stats[source, target]},
-                        'classes': "edge" + target
-                    }
-                    for source, target, behaviour, weight, original_weight in edge_data
-            ]
-    return original_edges
+        (order, starts), next_ends = incoming, edge_data.sources
+    selected_edges = np.zeros(len(edge_data), dtype=bool)
+    reached = np.zeros(len(edge_data.node_names), dtype=bool)
+    frontier = edge_data.get_node_codes(node_ids)
+    reached[frontier] = True
+    for hop in range(hops):
+        if len(frontier) == 0:
+            break
+        hop_edges = np.concatenate([order[starts[node]:starts[node + 1]] for node in frontier])
+        hop_edges = hop_edges[~selected_edges[hop_edges]]
+        selected_edges[hop_edges] = True
+        frontier = np.unique(next_ends[hop_edges])
+        frontier = frontier[~reached[frontier]]
+        reached[frontier] = True
+    return set(np.flatnonzero(selected_edges).tolist())
 
 def get_meetings_for_team(database, group_by, team):
-    events, entities, teams, behaviours, participants, meetings = read_files(database)
+    # Meetings are found from the sequences of the cube, so the events do not need to be read
+    cube = read_cube(database)
     meetings = []
 
     if team is None:
         meetings.append('All')
     elif team == 'All':
-        meetings = events['sequenceId'].unique()
-        meetings = [meeting.split('_')[0] for meeting in meetings]
-        meetings = list(set(meetings))
-        meetings.sort()
+        meetings = get_present_meetings(cube, None)
         meetings.insert(0, 'All')
     elif any(char.isdigit() for char in team):
-        # Get events where sequenceId contains team
-        events = events[events['sequenceId'].str.split('_').str[1] == team]
-        meetings = events['sequenceId'].unique()
-        meetings = [meeting.split('_')[0] for meeting in meetings]
-
-        meetings = list(set(meetings))
-        meetings.sort()
+        # Get meetings of sequences of team
+        meetings = get_present_meetings(cube, [team])
         meetings.insert(0, 'All')
     else:  # Team is a group (variable values control, feedback, etc.)
         team_list = read_teams_from_file(database, group_by, team)
-        # Get events where sequenceId contains team
-        events = events[events['sequenceId'].str.split('_').str[1].isin(team_list)]
-        meetings = events['sequenceId'].unique()
-        meetings = [meeting.split('_')[0] for meeting in meetings]
-
-        meetings = list(set(meetings))
-        meetings.sort()
+        # Get meetings of sequences of the teams in the group
+        meetings = get_present_meetings(cube, team_list)
         meetings.insert(0, 'All')
 
     options = [
@@ -803,6 +1131,10 @@ def get_meetings_for_team(database, group_by, team):
     ]
     return options
 
+def get_present_meetings(cube, teams):
+    # Sorted meetings of the sequences of teams (all teams if None)
+    return np.unique(cube['sequence_meetings'][get_sequence_mask(cube, teams)]).tolist()
+
 def get_teams_for_group(database, variable):
     if variable == 'Teams':
         return get_teams_for_database(database)
@@ -810,7 +1142,7 @@ def get_teams_for_group(database, variable):
         return read_team_groups_from_file(database, variable)
 
 def get_teams_for_database(database):
-    events, entities, teams, behaviours, participants, meetings = read_files(database)
+    teams, behaviours, meetings = get_dataset_lists(read_cube(database))
     options = [
         {'label': name, 'value': name}
         for name in teams
@@ -818,32 +1150,20 @@ def get_teams_for_database(database):
     return options
 
 def read_team_groups_from_file(database, variable):
-    with open(database + '/' + variable_separation_file, 'r') as file:
-        lines = file.readlines()
-
-    is_variable = False
-    names = []
-    for line in lines:
-        if 'Attribute' in line:
-            if variable in line:
-                is_variable = True
-            else:
-                is_variable = False
-        if is_variable:
-            if line.startswith('ids'):
-                names.append(line.split(':')[1].strip())
+    names = read_variables(database).get(variable, {}).keys()
     options = [
         {'label': name, 'value': name}
         for name in names
     ]
     return options
 
-def check_valid_options(node_type, colour_type, team):
+def check_valid_options(node_type, colour_type, team, edge_type='Frequency'):
     if node_type == 'Behaviours':
         if colour_type == 'Behaviours':
             return True
     else:
-        if team == 'All':
+        # Significance is only tested for behaviour transitions
+        if team == 'All' or edge_type == 'Significance':
             return False
         return True
 
@@ -0,0 +1,108 @@
+import numpy as np
+
+# Graphs as arrays of integer codes instead of lists of tuples of strings. Node and behaviour names are kept once in
+# a table and edges refer to them by position, so a participant graph with thousands of edges is a handful of arrays.
+# Cytoscape elements are written from the arrays by get_node_elements and get_edge_elements, for all the elements or
+# only some of them (e.g. the edges added to or removed from the browser).
+#
+# Iterating over a table gives the tuples of the lists it replaces, (name, acronym, freq, longitude, latitude, size)
+# for nodes and (source, target, behaviour, weight, original_weight) for edges.
+
+class NodeTable:
+    # Nodes in order, one array per column
+    __slots__ = ['names', 'acronyms', 'freqs', 'longitudes', 'latitudes', 'sizes']
+
+    def __init__(self, names, acronyms, freqs, longitudes, latitudes, sizes):
+        self.names = np.asarray(names, dtype=object)
+        self.acronyms = np.asarray(acronyms, dtype=object)
+        self.freqs = np.asarray(freqs)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.sizes = np.asarray(sizes)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return zip(self.names.tolist(), self.acronyms.tolist(), self.freqs.tolist(), self.longitudes.tolist(), self.latitudes.tolist(), self.sizes.tolist())
+
+class EdgeTable:
+    # Edges in order: codes of their source and target in node_names and of their behaviour in behaviour_names, weight
+    # and original weight. node_index maps node names to codes. node_behaviours has the code in behaviour_names of the
+    # behaviour each node is coloured as, None if nodes have their own colour. p_values has the p-value of each edge
+    # of significance graphs, None for other graphs. intervals has the confidence interval (lower, upper) of the weight
+    # of each edge of difference graphs, None for other graphs
+    __slots__ = ['node_names', 'behaviour_names', 'node_index', 'node_behaviours', 'sources', 'targets', 'behaviours', 'weights', 'original_weights', 'p_values', 'intervals']
+
+    def __init__(self, node_names, behaviour_names, sources, targets, behaviours, weights, original_weights, node_behaviours=None, p_values=None, intervals=None):
+        self.node_names = np.asarray(node_names, dtype=object)
+        self.behaviour_names = np.asarray(behaviour_names, dtype=object)
+        self.node_index = {name: code for code, name in enumerate(self.node_names.tolist())}
+        self.node_behaviours = None if node_behaviours is None else np.asarray(node_behaviours, dtype=np.int64)
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.behaviours = np.asarray(behaviours, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.original_weights = np.asarray(original_weights, dtype=np.int64)
+        self.p_values = None if p_values is None else np.asarray(p_values, dtype=np.float64)
+        self.intervals = None if intervals is None else np.asarray(intervals, dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        return zip(self.node_names[self.sources].tolist(), self.node_names[self.targets].tolist(), self.behaviour_names[self.behaviours].tolist(),
+                   self.weights.tolist(), self.original_weights.tolist())
+
+    def __getitem__(self, i):
+        return (self.node_names[self.sources[i]], self.node_names[self.targets[i]], self.behaviour_names[self.behaviours[i]],
+                float(self.weights[i]), int(self.original_weights[i]))
+
+    def take(self, indices):
+        # Table of the edges at indices, in that order
+        return EdgeTable(self.node_names, self.behaviour_names, self.sources[indices], self.targets[indices], self.behaviours[indices],
+                         self.weights[indices], self.original_weights[indices], self.node_behaviours,
+                         None if self.p_values is None else self.p_values[indices], None if self.intervals is None else self.intervals[indices])
+
+    def get_node_codes(self, names):
+        # Codes of the nodes in names that have edges
+        return np.array([self.node_index[name] for name in names if name in self.node_index], dtype=np.int64)
+
+def get_node_elements(node_data, classes):
+    # Cytoscape nodes of node_data (a NodeTable). classes has the class of each node
+    return [
+        {
+            'data': {'id': name, 'label': label, 'freq': freq, 'size': size},
+            'position': {'x': x, 'y': y},
+            'classes': node_class
+        }
+        for name, label, freq, size, x, y, node_class in zip(
+            node_data.names.tolist(), node_data.acronyms.tolist(), [str(freq) for freq in node_data.freqs.tolist()], node_data.sizes.tolist(),
+            (20 * node_data.latitudes).tolist(), (-20 * node_data.longitudes).tolist(), list(classes))
+    ]
+
+def get_edge_elements(edge_data, classes, indices=None):
+    # Cytoscape edges of edge_data (an EdgeTable) at indices, all of them if None. classes has the class of each edge
+    if indices is None:
+        indices = np.arange(len(edge_data))
+    indices = np.asarray(indices, dtype=np.int64)
+    elements = [
+        {
+            'data': {'source': source, 'target': target, 'behaviour': behaviour, 'weight': weight, 'original_weight': original_weight},
+            'classes': edge_class
+        }
+        for source, target, behaviour, weight, original_weight, edge_class in zip(
+            edge_data.node_names[edge_data.sources[indices]].tolist(), edge_data.node_names[edge_data.targets[indices]].tolist(),
+            edge_data.behaviour_names[edge_data.behaviours[indices]].tolist(), edge_data.weights[indices].tolist(),
+            edge_data.original_weights[indices].tolist(), np.asarray(classes, dtype=object)[indices].tolist())
+    ]
+    if edge_data.p_values is not None:
+        for element, p_value in zip(elements, edge_data.p_values[indices].tolist()):
+            element['data']['p_value'] = p_value
+    if edge_data.intervals is not None:
+        # Edges of difference graphs are as wide as the size of their difference (magnitude)
+        for element, (lower, upper), magnitude in zip(elements, edge_data.intervals[indices].tolist(), np.abs(edge_data.weights[indices]).tolist()):
+            element['data']['lower'] = lower
+            element['data']['upper'] = upper
+            element['data']['magnitude'] = magnitude
+    return elements
@@ -0,0 +1,18 @@
+import multiprocessing
+import os
+
+# gunicorn settings for serving the app with several worker processes (see wsgi.py)
+wsgi_app = 'wsgi:server'
+bind = os.environ.get('BITGRAPHS_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('BITGRAPHS_WORKERS', multiprocessing.cpu_count()))
+# Load the app, and with it every dataset, once in the master before forking the workers
+preload_app = True
+timeout = 120
+
+def post_worker_init(worker):
+    from wsgi import report_memory
+    report_memory('worker')
+
+def worker_exit(server, worker):
+    from significance import shutdown_executor
+    shutdown_executor()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Node positions computed on the server, so the browser shows graphs with a preset layout instead of laying them out
+# itself. Positions come from stress majorization (SMACOF) on the shortest path distances between nodes, started from
+# classical multidimensional scaling, so the same graph always gets the same positions.
+#
+# Layouts only depend on the structure of a graph: its node names and which pairs of nodes are joined by an edge, in
+# either direction. They are kept under a hash of that structure, in memory and as JSON files in
+# BITGRAPHS_LAYOUT_STORE (shared by the worker processes of a machine), so graphs with the same structure (e.g. the
+# same team by Frequency and by Probability, or after a reload) reuse them.
+
+LAYOUT_STORE_PATH = os.environ.get('BITGRAPHS_LAYOUT_STORE', os.path.join(tempfile.gettempdir(), 'bitgraphs_layouts'))
+# Layouts kept in memory by each worker process
+LAYOUT_CACHE_MAX = 256
+LAYOUT_ITERATIONS = 300
+LAYOUT_TOLERANCE = 1e-5
+# Pixels between nodes one edge apart, more than the largest node (NODE_MAP_MAX_SIZE in functions.py)
+LAYOUT_SCALE = 400
+# Graphs with more nodes are laid out on a circle (about 0.3 s for 300 nodes, 4 s for 1000)
+LAYOUT_MAX_NODES = 300
+# Layouts in LAYOUT_STORE_PATH not used for this long (in seconds) are deleted, and only the most recently used
+# LAYOUT_STORE_MAX are kept
+LAYOUT_MAX_AGE = 7 * 24 * 60 * 60
+LAYOUT_STORE_MAX = 10000
+
+layouts = OrderedDict()
+layouts_lock = threading.Lock()
+
+def get_layout_key(node_names, sources, targets):
+    # Hash of the node names and of the pairs of nodes joined by an edge. sources and targets are codes in node_names
+    names = np.asarray(node_names, dtype=object)
+    pairs = sorted(set(tuple(sorted(pair)) for pair in zip(names[sources].tolist(), names[targets].tolist())))
+    content = json.dumps([sorted(names.tolist()), pairs], separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def get_layout(node_names, sources, targets):
+    # x and y (in pixels) of each node of node_names, for a graph with edges from sources to targets (codes in
+    # node_names). Layouts are kept in edge lengths, so changing LAYOUT_SCALE does not need new ones
+    names = np.asarray(node_names, dtype=object).tolist()
+    key = get_layout_key(node_names, sources, targets)
+    with layouts_lock:
+        positions = layouts.get(key)
+        if positions is not None:
+            layouts.move_to_end(key)
+    if positions is None:
+        positions = read_layout(key)
+    if positions is None:
+        codes = {name: code for code, name in enumerate(sorted(names))}
+        order = np.array([codes[name] for name in names], dtype=np.int64)
+        coordinates = compute_layout(len(names), order[np.asarray(sources, dtype=np.int64)], order[np.asarray(targets, dtype=np.int64)])
+        positions = dict(zip(sorted(names), coordinates.tolist()))
+        write_layout(key, positions)
+    with layouts_lock:
+        layouts[key] = positions
+        while len(layouts) > LAYOUT_CACHE_MAX:
+            layouts.popitem(last=False)
+    coordinates = np.array([positions[name] for name in names], dtype=np.float64).reshape(-1, 2) * LAYOUT_SCALE
+    return coordinates[:, 0], coordinates[:, 1]
+
+def read_layout(key):
+    path = os.path.join(LAYOUT_STORE_PATH, key + '.json')
+    try:
+        with open(path, 'r') as file:
+            positions = json.load(file)
+    except FileNotFoundError:
+        # Not computed yet, or deleted by clean_layouts
+        return None
+    # Marks the layout as used, for clean_layouts
+    os.utime(path)
+    return positions
+
+def write_layout(key, positions):
+    # Written to a temporary file first, so that processes reading the layout never see part of it
+    path = os.path.join(LAYOUT_STORE_PATH, key + '.json')
+    temporary_path = path + '.' + str(os.getpid()) + '.tmp'
+    os.makedirs(LAYOUT_STORE_PATH, exist_ok=True)
+    with open(temporary_path, 'w') as file:
+        json.dump(positions, file)
+    os.replace(temporary_path, path)
+    clean_layouts()
+
+def clean_layouts():
+    # Deletes the layouts not used for LAYOUT_MAX_AGE, then the least recently used ones beyond LAYOUT_STORE_MAX
+    now = time.time()
+    files = []
+    with os.scandir(LAYOUT_STORE_PATH) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    files.sort(reverse=True)
+    for position, (modified, path) in enumerate(files):
+        if position >= LAYOUT_STORE_MAX or now - modified > LAYOUT_MAX_AGE:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Deleted by another process
+                pass
+
+def get_distances(n_nodes, sources, targets):
+    # Shortest path lengths (number of edges, in either direction) between every pair of nodes, from a breadth first
+    # search of every node at once: the nodes one step further are a product with the adjacency matrix. Nodes that
+    # cannot reach each other are one more than the longest path apart
+    adjacency = np.zeros((n_nodes, n_nodes))
+    adjacency[sources, targets] = 1
+    adjacency[targets, sources] = 1
+    distances = np.full((n_nodes, n_nodes), np.inf)
+    np.fill_diagonal(distances, 0)
+    reached = np.eye(n_nodes, dtype=bool)
+    frontier = reached
+    step = 0
+    while frontier.any():
+        step += 1
+        frontier = ((frontier.astype(np.float64) @ adjacency) > 0) & ~reached
+        distances[frontier] = step
+        reached |= frontier
+    finite = np.isfinite(distances)
+    distances[~finite] = distances[finite].max() + 1
+    return distances
+
+def get_classical_scaling(distances):
+    # Positions (n x 2) whose distances are closest to distances, from the two largest eigenvectors of the double
+    # centered squared distances. Each axis is flipped so its largest coordinate is positive
+    n_nodes = len(distances)
+    centering = np.eye(n_nodes) - 1 / n_nodes
+    gram = -0.5 * centering @ (distances ** 2) @ centering
+    values, vectors = np.linalg.eigh(gram)
+    values, vectors = values[::-1][:2], vectors[:, ::-1][:, :2]
+    positions = vectors * np.sqrt(np.maximum(values, 1e-12))
+    signs = np.sign(positions[np.abs(positions).argmax(axis=0), [0, 1]])
+    return positions * np.where(signs == 0, 1, signs)
+
+def compute_layout(n_nodes, sources, targets):
+    # Positions (n x 2, in edge lengths) of a graph of n_nodes nodes with edges from sources to targets
+    if n_nodes == 0:
+        return np.zeros((0, 2))
+    if n_nodes == 1:
+        return np.zeros((1, 2))
+    if n_nodes > LAYOUT_MAX_NODES:
+        angles = 2 * np.pi * np.arange(n_nodes) / n_nodes
+        return np.stack([np.cos(angles), np.sin(angles)], axis=1) * n_nodes / (2 * np.pi)
+    distances = get_distances(n_nodes, sources, targets)
+    positions = get_classical_scaling(distances)
+    # Nodes at the same distance from every other node (e.g. nodes without edges) start at the same place, they are
+    # moved apart a little so that they are pushed away from each other
+    angles = np.arange(n_nodes)
+    positions = positions + 1e-3 * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    # Stress majorization (Guttman transform) with weights 1 / distance ** 2, which favours local distances
+    weights = np.zeros_like(distances)
+    off_diagonal = ~np.eye(n_nodes, dtype=bool)
+    weights[off_diagonal] = distances[off_diagonal] ** -2.0
+    laplacian = -weights
+    laplacian[np.diag_indices(n_nodes)] = weights.sum(axis=1)
+    inverse = np.linalg.pinv(laplacian)
+    weighted_distances = weights * distances
+    stress = np.inf
+    for iteration in range(LAYOUT_ITERATIONS):
+        # Distances between the positions, from their squared norms and dot products
+        norms = (positions ** 2).sum(axis=1)
+        lengths = np.sqrt(np.maximum(norms[:, None] + norms[None, :] - 2 * positions @ positions.T, 0))
+        np.fill_diagonal(lengths, 0)
+        ratios = np.zeros_like(distances)
+        np.divide(weighted_distances, lengths, out=ratios, where=lengths > 1e-12)
+        # b @ positions, with b the Laplacian of ratios
+        positions = inverse @ (ratios.sum(axis=1)[:, None] * positions - ratios @ positions)
+        new_stress = (weights * (lengths - distances) ** 2).sum() / 2
+        if stress - new_stress < LAYOUT_TOLERANCE * new_stress:
+            break
+        stress = new_stress
+    return positions - positions.mean(axis=0)
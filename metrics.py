@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+from plotly.io.json import to_json_plotly
+
+# Timing of the stages of load_dataset and of the callbacks of the app, enabled with BITGRAPHS_METRICS=1. Each span
+# is logged as a JSON line (logger bitgraphs.metrics) and added to the totals served by /metrics. With
+# BITGRAPHS_TRACE_MEMORY=1 spans also measure the peak of memory allocated (tracemalloc), which slows everything
+# down. When disabled, span() returns the same empty context, so a span costs a function call. Callbacks that raise
+# PreventUpdate (nothing to update) are not errors.
+
+METRICS_ENABLED = os.environ.get('BITGRAPHS_METRICS') == '1'
+METRICS_TRACE_MEMORY = os.environ.get('BITGRAPHS_TRACE_MEMORY') == '1'
+
+logger = logging.getLogger('bitgraphs.metrics')
+if METRICS_ENABLED and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+# Totals per span name: count, total and maximum seconds, and the fields of the last span
+totals = {}
+totals_lock = threading.Lock()
+# Spans open in each thread, to pass memory peaks of inner spans to outer ones
+open_spans = threading.local()
+
+class NoSpan:
+    # What span() returns when disabled
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+no_span = NoSpan()
+
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        # Add fields (e.g. element counts) to the span
+        self.fields.update(fields)
+
+    def __enter__(self):
+        if METRICS_TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            stack = getattr(open_spans, 'stack', None)
+            if stack is None:
+                stack = open_spans.stack = []
+            current, peak = tracemalloc.get_traced_memory()
+            if len(stack) > 0:
+                stack[-1].inner_peak = max(stack[-1].inner_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+            self.inner_peak = 0
+            stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        if METRICS_TRACE_MEMORY:
+            peak = max(tracemalloc.get_traced_memory()[1], self.inner_peak)
+            stack = open_spans.stack
+            stack.pop()
+            if len(stack) > 0:
+                stack[-1].inner_peak = max(stack[-1].inner_peak, peak)
+            self.fields['peak_memory'] = peak - self.start_memory
+        if exc_type is not None and issubclass(exc_type, PreventUpdate):
+            self.fields['prevented'] = True
+        add_span(self.name, seconds, self.fields, exc_type is not None and not issubclass(exc_type, PreventUpdate))
+        return False
+
+def span(name, **fields):
+    # Context that measures the block it wraps as name, with fields added to the log line
+    if not METRICS_ENABLED:
+        return no_span
+    return Span(name, fields)
+
+def add_span(name, seconds, fields, failed):
+    with totals_lock:
+        total = totals.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'errors': 0})
+        total['count'] += 1
+        total['seconds'] += seconds
+        total['max_seconds'] = max(total['max_seconds'], seconds)
+        total['errors'] += int(failed)
+        total['last'] = fields
+    logger.info(json.dumps({'span': name, 'seconds': round(seconds, 6), 'pid': os.getpid(), 'error': failed, **fields}, default=str))
+
+def instrument(name):
+    # Decorator for callbacks: a span around each call, with the size of its output as sent to the browser
+    def decorator(function):
+        if not METRICS_ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                output = function(*args, **kwargs)
+                current.set(payload_bytes=len(to_json_plotly(output)))
+            return output
+        return wrapper
+    return decorator
+
+def get_metrics():
+    with totals_lock:
+        spans = {name: dict(total) for name, total in totals.items()}
+    return {'enabled': METRICS_ENABLED, 'trace_memory': METRICS_TRACE_MEMORY, 'pid': os.getpid(), 'spans': spans}
@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import closing
+
+# Server side state of every browser session. The browser only keeps a session id (in a dcc.Store), every worker
+# process reads and writes the state of that session here, so that any worker can answer any callback.
+#
+# Every state has a version, increased each time it is saved. Callbacks that send changes relative to the state they
+# read save it with update, which fails if another callback saved the session in between.
+#
+# This is a SQLite file shared by the workers of one machine. Running workers on several machines needs a store they
+# can all reach (e.g. Redis) with the same get/set methods.
+
+SESSION_STORE_PATH = os.environ.get('BITGRAPHS_SESSION_STORE', os.path.join(tempfile.gettempdir(), 'bitgraphs_sessions.sqlite3'))
+# Sessions not used for this long (in seconds) are deleted
+SESSION_MAX_AGE = 24 * 60 * 60
+
+def get_state_json(state):
+    # The version is kept in its own column
+    return json.dumps({key: value for key, value in state.items() if key != 'version'})
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+class SessionStore:
+    def __init__(self, path, max_age=SESSION_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        with closing(self.connect()) as connection, connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL, version INTEGER NOT NULL DEFAULT 0)')
+            # Stores made before states had versions
+            if 'version' not in [column[1] for column in connection.execute('PRAGMA table_info(sessions)')]:
+                connection.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+    def connect(self):
+        # A new connection per call, so the store can be used from any thread of any worker
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, session_id):
+        # State of the session (a dictionary, with its version), or None if the session is not known
+        if session_id is None:
+            return None
+        with closing(self.connect()) as connection, connection:
+            row = connection.execute('SELECT state, version FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        state['version'] = row[1]
+        return state
+
+    def set(self, session_id, state):
+        now = time.time()
+        with closing(self.connect()) as connection, connection:
+            version = connection.execute('SELECT version FROM sessions WHERE id = ?', (session_id,)).fetchone()
+            state['version'] = version[0] + 1 if version is not None else 1
+            connection.execute('INSERT OR REPLACE INTO sessions (id, state, updated, version) VALUES (?, ?, ?, ?)', (session_id, get_state_json(state), now, state['version']))
+            connection.execute('DELETE FROM sessions WHERE updated < ?', (now - self.max_age,))
+
+    def update(self, session_id, state):
+        # Save state only if the session is still at the version it was read with (state without a version is of a
+        # new session). Returns whether it was saved
+        now = time.time()
+        with closing(self.connect()) as connection, connection:
+            if state.get('version') is None:
+                cursor = connection.execute('INSERT OR IGNORE INTO sessions (id, state, updated, version) VALUES (?, ?, ?, 1)', (session_id, get_state_json(state), now))
+            else:
+                cursor = connection.execute('UPDATE sessions SET state = ?, updated = ?, version = version + 1 WHERE id = ? AND version = ?', (get_state_json(state), now, session_id, state['version']))
+        if cursor.rowcount != 1:
+            return False
+        state['version'] = state['version'] + 1 if state.get('version') is not None else 1
+        return True
+
+    def delete(self, session_id):
+        with closing(self.connect()) as connection, connection:
+            connection.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
@@ -0,0 +1,148 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Lag-sequential analysis of behaviour transitions: adjusted residuals of the observed transition counts against the
+# counts expected if the next behaviour did not depend on the previous one, and permutation p-values from shuffling
+# the events of each sequence. Permutations are run in jobs of PERMUTATION_BATCH, each with its own seed spawned from
+# the seed of the test, so p-values only depend on the seed and the number of permutations, not on the number of
+# processes. Jobs run in a pool of BITGRAPHS_PERMUTATION_PROCESSES processes, created on first use and kept by the
+# process until it exits. Every gunicorn worker has its own pool, so by default the pools share the cores left over
+# from the BITGRAPHS_WORKERS workers (see gunicorn.conf.py); without any, jobs run in the worker itself. Pool processes are started
+# by a fork server (or spawned where there is none) rather than forked from the threaded worker.
+#
+# Differences between the transition rates of two groups of sequences get bootstrap confidence intervals, from
+# resampling the sequences of each group with replacement. Replicates are run in jobs of BOOTSTRAP_BATCH in the same
+# pool, seeded the same way.
+
+PERMUTATIONS = int(os.environ.get('BITGRAPHS_PERMUTATIONS', '1000'))
+PERMUTATION_SEED = 0
+PERMUTATION_BATCH = 50
+WORKERS = int(os.environ.get('BITGRAPHS_WORKERS', str(os.cpu_count())))
+PERMUTATION_PROCESSES = int(os.environ.get('BITGRAPHS_PERMUTATION_PROCESSES', '0')) or max(1, (os.cpu_count() - WORKERS) // WORKERS)
+# Largest number of shuffled events held at once by a job
+PERMUTATION_MAX_EVENTS = 1000000
+BOOTSTRAP_REPLICATES = int(os.environ.get('BITGRAPHS_BOOTSTRAP_REPLICATES', '10000'))
+BOOTSTRAP_SEED = 0
+BOOTSTRAP_BATCH = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+
+executor = None
+executor_lock = threading.Lock()
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            executor = ProcessPoolExecutor(PERMUTATION_PROCESSES, mp_context=multiprocessing.get_context(start_method))
+            atexit.register(shutdown_executor)
+        return executor
+
+def shutdown_executor():
+    # Stop the pool of this process, if it has one (see worker_exit in gunicorn.conf.py)
+    global executor
+    with executor_lock:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+            executor = None
+
+def count_transitions(sequences, events, n_events):
+    # Counts (n_events x n_events) of the transitions between consecutive events of the same sequence. sequences and
+    # events have one row per event, grouped by sequence
+    same = sequences[:-1] == sequences[1:]
+    keys = events[:-1][same] * n_events + events[1:][same]
+    return np.bincount(keys, minlength=n_events * n_events).reshape(n_events, n_events)
+
+def count_sequence_transitions(sequences, events, n_events):
+    # Transition counts of each sequence, one row (n_events * n_events) per sequence in order of their codes
+    same = sequences[:-1] == sequences[1:]
+    codes, rows = np.unique(sequences[:-1][same], return_inverse=True)
+    keys = rows * n_events * n_events + events[:-1][same] * n_events + events[1:][same]
+    return np.bincount(keys, minlength=len(codes) * n_events * n_events).reshape(len(codes), n_events * n_events)
+
+def get_transition_rates(counts, n_events, by_source):
+    # Rates of transition counts (... x n_events * n_events): the share of the transitions leaving the same source if
+    # by_source, of all the transitions otherwise. Rates of sources without transitions are 0
+    counts = counts.reshape(counts.shape[:-1] + (n_events, n_events))
+    if by_source:
+        totals = counts.sum(axis=-1, keepdims=True)
+    else:
+        totals = counts.sum(axis=(-2, -1), keepdims=True)
+    rates = np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+    return rates.reshape(rates.shape[:-2] + (n_events * n_events,))
+
+def get_adjusted_residuals(counts):
+    # Adjusted residuals (z-scores) of a table of transition counts: (observed - expected) / standard error, with
+    # expected = row total * column total / total
+    total = counts.sum()
+    rows = counts.sum(axis=1, keepdims=True)
+    columns = counts.sum(axis=0, keepdims=True)
+    expected = rows * columns / max(total, 1)
+    variance = expected * (1 - rows / max(total, 1)) * (1 - columns / max(total, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals = (counts - expected) / np.sqrt(variance)
+    return np.where(variance > 0, residuals, 0.0)
+
+def count_exceedances(job):
+    # Number of permutations of job in which each transition is at least as frequent as observed. The events of each
+    # sequence are shuffled by sorting them on random keys offset by their sequence, so they stay in their sequence
+    sequences, events, n_events, observed, n_permutations, seed = job
+    rng = np.random.default_rng(seed)
+    same = sequences[:-1] == sequences[1:]
+    offsets = sequences.astype(np.float64)
+    exceedances = np.zeros(n_events * n_events, dtype=np.int64)
+    batch = max(1, min(n_permutations, PERMUTATION_MAX_EVENTS // max(len(events), 1)))
+    for start in range(0, n_permutations, batch):
+        size = min(batch, n_permutations - start)
+        shuffled = events[np.argsort(offsets + rng.random((size, len(events))), axis=1)]
+        keys = shuffled[:, :-1][:, same] * n_events + shuffled[:, 1:][:, same]
+        # One bincount for the whole batch, each permutation in its own range of keys
+        keys += np.arange(size)[:, None] * n_events * n_events
+        counts = np.bincount(keys.ravel(), minlength=size * n_events * n_events).reshape(size, -1)
+        exceedances += (counts >= observed.ravel()).sum(axis=0)
+    return exceedances
+
+def get_permutation_p_values(sequences, events, n_events, observed, n_permutations=PERMUTATIONS, seed=PERMUTATION_SEED):
+    # One-sided p-value of each transition of observed (n_events x n_events) being this frequent by chance, with the
+    # events of each sequence shuffled n_permutations times
+    seeds = np.random.SeedSequence(seed).spawn((n_permutations + PERMUTATION_BATCH - 1) // PERMUTATION_BATCH)
+    jobs = [(sequences, events, n_events, observed, min(PERMUTATION_BATCH, n_permutations - i * PERMUTATION_BATCH), job_seed) for i, job_seed in enumerate(seeds)]
+    if PERMUTATION_PROCESSES > 1 and len(jobs) > 1:
+        results = get_executor().map(count_exceedances, jobs)
+    else:
+        results = map(count_exceedances, jobs)
+    exceedances = sum(results)
+    return ((exceedances + 1) / (n_permutations + 1)).reshape(n_events, n_events)
+
+def resample_differences(job):
+    # Rate differences (replicates x n_events * n_events) of job, each from the sequences of both groups resampled
+    # with replacement. A resample is a count of each sequence, so its transitions are a product with the counts of
+    # the sequences (as floats, which NumPy multiplies much faster than integers)
+    counts_a, counts_b, n_events, by_source, n_replicates, seed = job
+    rng = np.random.default_rng(seed)
+    totals = []
+    for counts in [counts_a, counts_b]:
+        n = len(counts)
+        picks = rng.integers(0, n, (n_replicates, n)) + np.arange(n_replicates)[:, None] * n
+        weights = np.bincount(picks.ravel(), minlength=n_replicates * n).reshape(n_replicates, n)
+        totals.append(weights.astype(np.float64) @ counts.astype(np.float64))
+    return get_transition_rates(totals[0], n_events, by_source) - get_transition_rates(totals[1], n_events, by_source)
+
+def get_bootstrap_intervals(counts_a, counts_b, n_events, by_source, n_replicates=BOOTSTRAP_REPLICATES, seed=BOOTSTRAP_SEED):
+    # Percentile confidence interval (lower, upper, each n_events x n_events) of the difference between the rates of
+    # group a and group b, from the transition counts of their sequences (see count_sequence_transitions)
+    seeds = np.random.SeedSequence(seed).spawn((n_replicates + BOOTSTRAP_BATCH - 1) // BOOTSTRAP_BATCH)
+    jobs = [(counts_a, counts_b, n_events, by_source, min(BOOTSTRAP_BATCH, n_replicates - i * BOOTSTRAP_BATCH), job_seed) for i, job_seed in enumerate(seeds)]
+    if PERMUTATION_PROCESSES > 1 and len(jobs) > 1:
+        results = get_executor().map(resample_differences, jobs)
+    else:
+        results = map(resample_differences, jobs)
+    differences = np.concatenate(list(results))
+    tail = (1 - BOOTSTRAP_CONFIDENCE) / 2 * 100
+    lower, upper = np.percentile(differences, [tail, 100 - tail], axis=0)
+    return lower.reshape(n_events, n_events), upper.reshape(n_events, n_events)
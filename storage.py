@@ -0,0 +1,183 @@
+import json
+import os
+import pickle
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Converted copies of a dataset live next to its CSV files, one directory per file: GEC2017/columnar/Events/
+columnar_dir = 'columnar'
+metadata_file = 'metadata.json'
+converted_files = ['Events.csv', 'EntityAttributes.csv']
+# Events the app never shows, left out of the converted Events so they are not filtered out of it on every read
+dropped_events = ['Online']
+# Saved cube builder of a dataset (see cube.py), next to the converted Events: GEC2017/columnar/cube.pickle
+cube_builder_file = 'cube.pickle'
+
+def get_columnar_path(csv_path):
+    directory, name = os.path.split(csv_path)
+    return os.path.join(directory, columnar_dir, os.path.splitext(name)[0])
+
+def get_source_signature(csv_path):
+    if not os.path.exists(csv_path):
+        return None
+    file_stat = os.stat(csv_path)
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+def write_columnar(df, path, source_signature):
+    # Save every column as a .npy file. String columns are saved as integer codes plus a dictionary of their values
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object:
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(path, column + '.npy'), codes.astype(np.int32))
+            columns.append({'name': column, 'kind': 'dictionary', 'categories': categories.tolist()})
+        else:
+            np.save(os.path.join(path, column + '.npy'), values.to_numpy())
+            columns.append({'name': column, 'kind': 'values'})
+    metadata = {'rows': len(df), 'columns': columns, 'source': source_signature}
+    with open(os.path.join(path, metadata_file), 'w') as file:
+        json.dump(metadata, file)
+
+def append_columnar(df, path, source_signature):
+    # Add the rows of df at the end of a converted table, encoding only those rows. New values of string columns are
+    # added at the end of their dictionary, so the codes already saved do not change. Returns False, without changing
+    # the table, if a column of numbers gets strings (the whole table has to be converted again)
+    metadata = read_metadata(path)
+    if any(column['kind'] == 'values' and df[column['name']].dtype == object for column in metadata['columns']):
+        return False
+    for column in metadata['columns']:
+        name = column['name']
+        values = df[name]
+        if column['kind'] == 'dictionary':
+            categories = pd.Index(column['categories'], dtype=object)
+            new_categories = pd.Index(values.dropna().unique(), dtype=object).difference(categories, sort=False)
+            categories = categories.append(new_categories)
+            column['categories'] = categories.tolist()
+            # Missing values get code -1
+            values = categories.get_indexer(values).astype(np.int32)
+        else:
+            values = values.to_numpy()
+        column_path = os.path.join(path, name + '.npy')
+        write_atomic(column_path, lambda file: np.save(file, np.concatenate([np.load(column_path, mmap_mode='r'), values])))
+    metadata['rows'] += len(df)
+    metadata['source'] = source_signature
+    write_atomic(os.path.join(path, metadata_file), lambda file: file.write(json.dumps(metadata).encode('utf-8')))
+    return True
+
+def write_atomic(path, write):
+    # Written to a temporary file first, so that processes reading the file never see part of it
+    temporary_path = path + '.' + str(os.getpid()) + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        write(file)
+    os.replace(temporary_path, path)
+
+def read_metadata(path):
+    with open(os.path.join(path, metadata_file), 'r') as file:
+        return json.load(file)
+
+def read_columnar(path, columns=None, metadata=None):
+    # Load a converted table. Numeric columns and codes are memory mapped, string columns are categoricals over their
+    # codes, so no string is made per row
+    if metadata is None:
+        metadata = read_metadata(path)
+    return decode_columnar(read_columnar_codes(path, columns, metadata), metadata)
+
+def read_columnar_codes(path, columns, metadata):
+    # Memory mapped arrays of the columns of a converted table, with codes for string columns
+    names = [column['name'] for column in metadata['columns']] if columns is None else columns
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+
+def decode_columnar(arrays, metadata):
+    # DataFrame of columnar arrays, with string columns as categoricals of their dictionary
+    data = {}
+    for column in metadata['columns']:
+        name = column['name']
+        if name not in arrays:
+            continue
+        values = arrays[name]
+        if column['kind'] == 'dictionary':
+            # Missing values keep code -1, which categoricals read as NaN
+            values = pd.Categorical.from_codes(values, pd.Index(column['categories'], dtype=object), validate=False)
+        data[name] = values
+    return pd.DataFrame({name: data[name] for name in arrays}, copy=False)
+
+def has_columnar(csv_path):
+    # A converted copy is used if it exists and the CSV it was made from has not changed since (or is not there)
+    path = get_columnar_path(csv_path)
+    if not os.path.exists(os.path.join(path, metadata_file)):
+        return False
+    source_signature = get_source_signature(csv_path)
+    return source_signature is None or read_metadata(path)['source'] == source_signature
+
+def read_table(csv_path, columns=None):
+    if has_columnar(csv_path):
+        return read_columnar(get_columnar_path(csv_path), columns)
+    return pd.read_csv(csv_path, usecols=columns)
+
+def read_table_chunks(csv_path, columns=None, chunk_size=1000000):
+    # The rows of a table as DataFrames of at most chunk_size rows, in file order
+    if has_columnar(csv_path):
+        path = get_columnar_path(csv_path)
+        metadata = read_metadata(path)
+        table = read_columnar_codes(path, columns, metadata)
+        for start in range(0, metadata['rows'], chunk_size):
+            yield decode_columnar({name: values[start:start + chunk_size] for name, values in table.items()}, metadata)
+    else:
+        yield from pd.read_csv(csv_path, usecols=columns, chunksize=chunk_size)
+
+def get_table_paths(csv_path):
+    # Files a parsed table depends on, used to detect changes on disk
+    return [csv_path, os.path.join(get_columnar_path(csv_path), metadata_file)]
+
+def get_cube_builder_path(events_path):
+    return os.path.join(os.path.dirname(events_path), columnar_dir, cube_builder_file)
+
+def read_cube_builder(events_path):
+    # Saved cube builder of the events in events_path, or None if there is none or the events changed since
+    path = get_cube_builder_path(events_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        builder = pickle.load(file)
+    return builder if builder['source'] == get_source_signature(events_path) else None
+
+def write_cube_builder(events_path, builder):
+    path = get_cube_builder_path(events_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, lambda file: pickle.dump(builder, file, protocol=pickle.HIGHEST_PROTOCOL))
+
+def convert_dataset(dataset_name):
+    for file_name in converted_files:
+        csv_path = os.path.join(dataset_name, file_name)
+        if not os.path.exists(csv_path):
+            continue
+        convert_table(csv_path)
+
+def convert_table(csv_path):
+    source_signature = get_source_signature(csv_path)
+    df = pd.read_csv(csv_path)
+    if 'event' in df.columns:
+        df = drop_events(df)
+    write_columnar(df, get_columnar_path(csv_path), source_signature)
+
+def drop_events(events):
+    # Rows of events that are not one of dropped_events. events itself if there are none, so that memory mapped
+    # columns are not copied
+    dropped = events['event'].isin(dropped_events)
+    return events[~dropped] if dropped.any() else events
+
+if __name__ == '__main__':
+    # Convert the datasets given as arguments, or every directory with an Events.csv file, and save their cube builders
+    from functions import save_cube_builder
+    dataset_names = sys.argv[1:]
+    if len(dataset_names) == 0:
+        dataset_names = sorted(name for name in os.listdir('.') if os.path.exists(os.path.join(name, 'Events.csv')))
+    for dataset_name in dataset_names:
+        start = time.perf_counter()
+        convert_dataset(dataset_name)
+        save_cube_builder(dataset_name)
+        print(dataset_name + ': converted in ' + str(round(time.perf_counter() - start, 2)) + 's')
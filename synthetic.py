@@ -0,0 +1,126 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from functions import events_file, entities_file, teams_file, variable_separation_file
+
+# Synthetic datasets in the layout of the real ones (Events.csv, EntityAttributes.csv, SequenceAttributes.csv and
+# Variables.csv), at any scale, to measure the pipeline (see benchmark.py). Usage:
+#
+#   python3 synthetic.py OUTPUT_DIRECTORY [--teams N] [--meetings N] [--events N] [--behaviours N] [--participants N]
+#
+# The dataset is named after the last part of OUTPUT_DIRECTORY. Names with 2017 in them get a leader_meeting
+# attribute, as the real 2017 datasets.
+#
+# Behaviours follow a random Markov chain, so transitions are not uniform. Participants speak with random weights and
+# some events have no participant (entityId -1). Each team is split in two groups (HighPerforming and LowPerforming)
+# for every attribute of Variables.csv.
+
+# Words for behaviour names: the acronym of a behaviour is the first letter of each word, so the initials of each
+# list are all different
+BEHAVIOUR_WORDS = [['Information', 'Question', 'Agreement', 'Disagreement', 'Humour', 'Proposal', 'Summary', 'Task', 'Encouragement', 'Clarification', 'Reflection', 'Objection'],
+                   ['giving', 'asking', 'building', 'seeking', 'management', 'checking', 'offering', 'raising']]
+GROUP_ATTRIBUTES = ['teammark', 'airtime_evenness', 'psy_safe', 'expgroup']
+GROUPS = ['HighPerforming', 'LowPerforming']
+NO_PARTICIPANT_PROBABILITY = 0.1
+BREAK_PROBABILITY = 0.01
+
+def get_behaviour_names(n_behaviours):
+    names = BEHAVIOUR_WORDS[0][:n_behaviours]
+    for second in BEHAVIOUR_WORDS[1]:
+        names += [first + '_' + second for first in BEHAVIOUR_WORDS[0]]
+    if n_behaviours > len(names):
+        raise ValueError('At most ' + str(len(names)) + ' behaviours')
+    return names[:n_behaviours]
+
+def get_team_names(n_teams):
+    # Team names must have a digit, see get_meetings_for_team
+    return [str(team + 1).zfill(2) + 'A' for team in range(n_teams)]
+
+def generate_markov_chain(rng, n_states, length, n_chains):
+    # n_chains sequences of states (n_chains x length) of a random Markov chain
+    transitions = rng.dirichlet(np.full(n_states, 0.5), size=n_states).cumsum(axis=1)
+    states = np.empty((n_chains, length), dtype=np.int64)
+    states[:, 0] = rng.integers(0, n_states, n_chains)
+    for step in range(1, length):
+        draws = rng.random(n_chains)
+        states[:, step] = (transitions[states[:, step - 1]] < draws[:, None]).sum(axis=1)
+    return np.minimum(states, n_states - 1)
+
+def generate_dataset(path, n_teams=20, n_meetings=6, n_events=500, n_behaviours=10, n_participants=5, seed=0):
+    # Write a dataset in directory path. Returns the number of events
+    rng = np.random.default_rng(seed)
+    dataset_name = os.path.basename(os.path.normpath(path))
+    os.makedirs(path, exist_ok=True)
+    behaviours = np.array(get_behaviour_names(n_behaviours), dtype=object)
+    teams = get_team_names(n_teams)
+    meetings = [str(meeting + 1) for meeting in range(n_meetings)]
+    # Sequences team by team, meetings in order
+    sequence_ids = np.array([meeting + '_' + team for team in teams for meeting in meetings], dtype=object)
+    n_sequences = len(sequence_ids)
+
+    # Participants: entityIds are numbered across the dataset, n_participants per team
+    entity_ids = np.arange(1, n_teams * n_participants + 1).reshape(n_teams, n_participants)
+    speaking_weights = rng.dirichlet(np.ones(n_participants), size=n_teams)
+
+    # Events
+    event_codes = generate_markov_chain(rng, n_behaviours, n_events, n_sequences).ravel()
+    sequence_codes = np.repeat(np.arange(n_sequences), n_events)
+    team_codes = sequence_codes // n_meetings
+    cumulative_weights = speaking_weights.cumsum(axis=1)[team_codes]
+    speakers = np.minimum((cumulative_weights < rng.random(len(team_codes))[:, None]).sum(axis=1), n_participants - 1)
+    events = pd.DataFrame({
+        'sequenceId': sequence_ids[sequence_codes],
+        'event': behaviours[event_codes],
+        'entityId': entity_ids[team_codes, speakers]
+    })
+    events.loc[rng.random(len(events)) < NO_PARTICIPANT_PROBABILITY, 'entityId'] = -1
+    breaks = rng.random(len(events)) < BREAK_PROBABILITY
+    events.loc[breaks, 'event'] = 'Break'
+    events.loc[breaks, 'entityId'] = -1
+    events.to_csv(os.path.join(path, events_file), index=False)
+
+    # Entity attributes, with leader_meeting for the 2017 datasets
+    rows = []
+    for team_code, team in enumerate(teams):
+        team_sequences = ';'.join(meeting + '_' + team for meeting in meetings)
+        leaders = rng.integers(0, n_participants, n_meetings)
+        for participant, entity_id in enumerate(entity_ids[team_code]):
+            rows.append((team_sequences, entity_id, 'name', 'Participant' + str(entity_id)))
+            rows.append((team_sequences, entity_id, 'Sex', rng.choice(['Female', 'Male'])))
+            if '2017' in dataset_name:
+                led = np.flatnonzero(leaders == participant)
+                rows.append((team_sequences, entity_id, 'leader_meeting', float(led[0] + 1 if len(led) > 0 else 0)))
+    pd.DataFrame(rows, columns=['sequenceId', 'entityId', 'ParameterKey', 'ParameterValue']).to_csv(os.path.join(path, entities_file), index=False)
+
+    # Sequence attributes and Variables.csv: the first half of the teams (in a random order) is HighPerforming for
+    # each attribute
+    rows = []
+    team_groups = {}
+    for attribute in GROUP_ATTRIBUTES:
+        order = rng.permutation(n_teams)
+        team_groups[attribute] = {team: GROUPS[int(rank >= n_teams // 2)] for team, rank in zip(teams, np.argsort(order))}
+        rows += [(sequence_id, attribute, team_groups[attribute][sequence_id.split('_')[1]]) for sequence_id in sequence_ids]
+    pd.DataFrame(rows, columns=['sequenceId', 'ParameterKey', 'ParameterValue']).to_csv(os.path.join(path, teams_file), index=False)
+    with open(os.path.join(path, variable_separation_file), 'w') as file:
+        for attribute in GROUP_ATTRIBUTES:
+            file.write('Attribute:' + attribute + '\n')
+            for group in GROUPS:
+                file.write('ids:' + group + '\n')
+                file.write(','.join(sequence_id for sequence_id in sequence_ids if team_groups[attribute][sequence_id.split('_')[1]] == group) + '\n')
+    return len(events)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic dataset')
+    parser.add_argument('path', help='dataset directory, its name is the name of the dataset')
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--meetings', type=int, default=6)
+    parser.add_argument('--events', type=int, default=500, help='events per meeting')
+    parser.add_argument('--behaviours', type=int, default=10)
+    parser.add_argument('--participants', type=int, default=5, help='participants per team')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    n_events = generate_dataset(args.path, args.teams, args.meetings, args.events, args.behaviours, args.participants, args.seed)
+    print(args.path + ': ' + str(n_events) + ' events')
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import new_cube_builder, add_events_chunk, compact_cube_builder, get_builder_cube, get_sequence_mask, get_node_counts, get_transition_counts
+from functions import events_file
+from synthetic import generate_dataset
+
+# Counts of the cube (see cube.py), built from the events in one chunk or in chunks that split sequences, against
+# counting the selected events directly with pandas
+
+N_EVENTS = 37
+# Chunk sizes that split sequences of N_EVENTS events, and one chunk for the whole dataset
+CHUNK_SIZES = [1, 10, 64, 1000000]
+SELECTIONS = [(None, 'All'), (['01A'], 'All'), (None, '2'), (['02A'], '3'), (['01A', '03A'], 'All'), (['03A', '02A'], '1')]
+
+@pytest.fixture(scope='module')
+def events(tmp_path_factory):
+    path = os.path.join(tmp_path_factory.mktemp('data'), 'SYN2017')
+    generate_dataset(path, n_teams=3, n_meetings=3, n_events=N_EVENTS, n_behaviours=5, n_participants=3, seed=1)
+    events = pd.read_csv(os.path.join(path, events_file))
+    # Some breaks at the start and end of sequences and one after the other
+    for row in [0, 1, N_EVENTS - 1, N_EVENTS, 5 * N_EVENTS + 3, 5 * N_EVENTS + 4]:
+        events.loc[row, ['event', 'entityId']] = ['Break', -1]
+    return events
+
+def build_cube(events, chunk_size, compact=False):
+    # Cube of events added chunk_size rows at a time. With compact, the builder is compacted after every chunk, as
+    # when more events are appended to a saved builder (see append.py)
+    builder = new_cube_builder()
+    for start in range(0, len(events), chunk_size):
+        add_events_chunk(builder, events.iloc[start:start + chunk_size])
+        if compact:
+            compact_cube_builder(builder)
+    return get_builder_cube(builder)
+
+def get_selected_events(events, teams, meeting):
+    meetings, sequence_teams = events['sequenceId'].str.split('_', expand=True).T.values
+    selected = np.ones(len(events), dtype=bool)
+    if teams is not None:
+        selected &= np.isin(sequence_teams, teams)
+    if meeting != 'All':
+        selected &= meetings == meeting
+    return events[selected]
+
+def count_naive_transitions(events, split_sequences):
+    # Transitions between consecutive events that are not 'Break', in order of first appearance
+    events = events[events['event'] != 'Break']
+    pairs = pd.DataFrame({'source': events['event'], 'target': events['event'].shift(-1)})
+    same = events['sequenceId'] == events['sequenceId'].shift(-1) if split_sequences else pd.Series(True, index=events.index)
+    pairs = pairs[same & pairs['target'].notna()]
+    return pairs.groupby(['source', 'target'], sort=False).size()
+
+def get_cube_transitions(cube, sequence_mask, split_sequences):
+    counts, first, n_rows = get_transition_counts(cube, sequence_mask, split_sequences)
+    sources, targets = np.nonzero(counts)
+    order = np.argsort(first[sources, targets], kind='stable')
+    names = cube['event_names']
+    index = pd.MultiIndex.from_arrays([names[sources[order]], names[targets[order]]], names=['source', 'target'])
+    return pd.Series(counts[sources[order], targets[order]], index=index)
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('compact', [False, True])
+def test_node_counts(events, chunk_size, compact):
+    cube = build_cube(events, chunk_size, compact)
+    for teams, meeting in SELECTIONS:
+        selected = get_selected_events(events, teams, meeting)
+        counts, first, n_rows = get_node_counts(cube, get_sequence_mask(cube, teams, meeting))
+        present = np.flatnonzero(counts)
+        present = present[np.argsort(first[present], kind='stable')]
+        expected = selected['event'].value_counts(sort=False)
+        assert n_rows == len(selected)
+        assert cube['event_names'][present].tolist() == expected.index.tolist()
+        assert counts[present].tolist() == expected.tolist()
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('split_sequences', [False, True])
+def test_transition_counts(events, chunk_size, compact, split_sequences):
+    cube = build_cube(events, chunk_size, compact)
+    for teams, meeting in SELECTIONS:
+        selected = get_selected_events(events, teams, meeting)
+        transitions = get_cube_transitions(cube, get_sequence_mask(cube, teams, meeting), split_sequences)
+        expected = count_naive_transitions(selected, split_sequences)
+        assert transitions.index.tolist() == expected.index.tolist()
+        assert transitions.tolist() == expected.tolist()
@@ -0,0 +1,43 @@
+import gc
+import os
+import resource
+import sys
+
+from functions import DATASETS, preload_datasets
+from app import app
+
+# Production entry point, for a WSGI server with several worker processes:
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# Every dataset is parsed and its cube built here, in the process that imports this module. With preload_app the
+# workers are forked after that and share the cached arrays copy-on-write instead of each parsing the CSV files.
+
+def get_memory_usage():
+    # Resident memory of this process in KiB: total (rss), proportional share of pages shared with other processes
+    # (pss) and shared. Only rss is known where /proc/self/smaps_rollup is not available
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key in ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty']:
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'rss': maxrss // 1024 if sys.platform == 'darwin' else maxrss}
+    return {'rss': usage['Rss'], 'pss': usage['Pss'], 'shared': usage['Shared_Clean'] + usage['Shared_Dirty']}
+
+def report_memory(name):
+    usage = get_memory_usage()
+    print(name + ' (pid ' + str(os.getpid()) + '): ' + ', '.join(key + ' ' + str(round(value / 1024, 1)) + ' MiB' for key, value in usage.items()), flush=True)
+
+loaded_datasets = preload_datasets(DATASETS)
+print('Preloaded datasets: ' + ', '.join(loaded_datasets), flush=True)
+# Move the preloaded objects out of the collector's generations, so collections in the workers do not write to
+# their pages and break the sharing
+gc.freeze()
+report_memory('master')
+
+server = app.server